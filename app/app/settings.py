@@ -48,13 +48,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.MemoryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.AuditMiddleware',
+    'core.middleware.QueryDeadlineMiddleware',
+    'core.middleware.ShardMovingMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -88,6 +95,56 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'OPTIONS': {
+            # Upper bound for any statement, including outside requests.
+            'options': '-c statement_timeout=%d' % int(
+                os.environ.get('DB_STATEMENT_TIMEOUT_MS', 60000)),
+        },
+    }
+}
+
+# Aliases of the databases holding users' recipe data, see core.sharding.
+# Extra shards are listed in DB_SHARDS and configured with DB_<ALIAS>_HOST,
+# DB_<ALIAS>_NAME, DB_<ALIAS>_USER and DB_<ALIAS>_PASS. Each shard gives its
+# rows ids from its own range, picked by its number, DB_<ALIAS>_NUMBER or its
+# position in DB_SHARDS; a shard's number must never change. Users are pinned
+# to their shard when created, so adding a shard only takes new users; run
+# the core migrations before the first deploy with a new DB_SHARDS.
+DATABASE_SHARDS = ['default']
+DATABASE_SHARD_NUMBERS = {'default': 0}
+for alias in filter(None, os.environ.get('DB_SHARDS', '').split(',')):
+    prefix = f'DB_{alias.upper()}_'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'HOST': os.environ.get(prefix + 'HOST'),
+        'NAME': os.environ.get(prefix + 'NAME'),
+        'USER': os.environ.get(prefix + 'USER'),
+        'PASSWORD': os.environ.get(prefix + 'PASS'),
+        'OPTIONS': DATABASES['default']['OPTIONS'],
+    }
+    DATABASE_SHARD_NUMBERS[alias] = int(
+        os.environ.get(prefix + 'NUMBER', len(DATABASE_SHARDS)))
+    DATABASE_SHARDS.append(alias)
+
+# Seconds move_user_shard waits for writes started before a user was frozen.
+SHARD_MOVE_GRACE = int(os.environ.get('SHARD_MOVE_GRACE', 30))
+
+DATABASE_ROUTERS = ['core.routers.ShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Shared by every worker: throttle buckets, token generations, the shard
+# directory and the coalescing locks only work across processes through
+# it. CACHE_LOCATION lists the memcached servers, comma separated.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', '127.0.0.1:11211').split(','),
     }
 }
 
@@ -129,6 +186,14 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
+MEDIA_URL = '/static/media/'
+
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '/vol/web/media')
+
+# Uploads always go to a temporary file instead of being read into memory.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -137,6 +202,189 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Log in with an email in any case.
+AUTHENTICATION_BACKENDS = ['core.backends.EmailBackend']
+
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema'
+    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '600/min',
+        'write': '120/min',
+        'login': '20/min',
+        'bulk': '30/min',
+    },
+}
+
+# Largest number of recipes a client may fetch in one batch request.
+RECIPE_BATCH_MAX_IDS = int(os.environ.get('RECIPE_BATCH_MAX_IDS', 100))
+
+# Largest number of changed and of deleted recipes in one sync page.
+RECIPE_SYNC_PAGE_SIZE = int(os.environ.get('RECIPE_SYNC_PAGE_SIZE', 100))
+# Seconds sync cursors stay behind, longer than any transaction writing
+# recipes lasts, and days tombstones of deleted recipes are kept for them.
+RECIPE_SYNC_LAG = int(os.environ.get('RECIPE_SYNC_LAG', 120))
+RECIPE_SYNC_TOMBSTONE_DAYS = int(
+    os.environ.get('RECIPE_SYNC_TOMBSTONE_DAYS', 90))
+
+# Render recipe lists and tag filters from the tag list stored on each
+# recipe instead of joining the recipe/tag table.
+RECIPE_DENORMALIZED_TAGS = True
+
+# Admin changelists use the planner's row estimate instead of COUNT(*)
+# for unfiltered tables larger than this.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Recipe image thumbnails, in pixels, and the number of processes making
+# them. With 0 workers thumbnails are made in the committing thread.
+# Thumbnails requested while being made are answered with 404 and
+# Retry-After RECIPE_THUMBNAIL_RETRY_AFTER seconds.
+RECIPE_THUMBNAIL_SIZES = [128, 512]
+RECIPE_THUMBNAIL_WORKERS = int(os.environ.get('RECIPE_THUMBNAIL_WORKERS', 2))
+RECIPE_THUMBNAIL_RETRY_AFTER = 2
+
+# Where the per user "similar recipes" indexes are stored, how many builds
+# older than the current one are kept for readers, whether a background
+# thread writes them, and seconds to wait for a first build.
+SIMILARITY_INDEX_DIR = os.environ.get(
+    'SIMILARITY_INDEX_DIR', '/vol/web/similarity')
+SIMILARITY_KEEP_BUILDS = 2
+SIMILARITY_IN_BACKGROUND = True
+SIMILARITY_RETRY_AFTER = 5
+
+# Lifetimes, in seconds, of signed access tokens and of refresh tokens.
+ACCESS_TOKEN_LIFETIME = int(os.environ.get('ACCESS_TOKEN_LIFETIME', 300))
+REFRESH_TOKEN_LIFETIME = int(
+    os.environ.get('REFRESH_TOKEN_LIFETIME', 30 * 24 * 3600))
+
+# How long a user's token generation is cached. Revocation clears it.
+TOKEN_GENERATION_CACHE_TIMEOUT = 3600
+
+# authtoken tokens expire after this many seconds without use. How often
+# they are used is written down at most once per renew interval.
+TOKEN_LIFETIME = int(os.environ.get('TOKEN_LIFETIME', 30 * 24 * 3600))
+TOKEN_RENEW_INTERVAL = int(os.environ.get('TOKEN_RENEW_INTERVAL', 24 * 3600))
+
+# Deleting an account removes its rows this many at a time, in a
+# background thread unless turned off. Progress is kept in the database
+# for USER_DELETION_TTL seconds after it finishes; resume_user_deletions
+# finishes deletions without progress for USER_DELETION_STALE_AFTER seconds.
+USER_DELETION_BATCH_SIZE = 1000
+USER_DELETION_IN_BACKGROUND = True
+USER_DELETION_TTL = 24 * 3600
+USER_DELETION_STALE_AFTER = 15 * 60
+
+# Seconds between keep-alive comments on idle recipe event streams,
+# seconds between rechecks of their credentials, how many events a stream
+# may fall behind before it is told to resync, and seconds before
+# reconnecting a lost LISTEN connection.
+RECIPE_EVENTS_HEARTBEAT = 25
+RECIPE_EVENTS_RECHECK = 300
+RECIPE_EVENTS_QUEUE_SIZE = 100
+RECIPE_EVENTS_RECONNECT_DELAY = 5
+
+# Seconds a request may take, by view name or URL namespace, before its
+# queries are cancelled and it is answered with 503. None means no limit.
+REQUEST_DEADLINE = 10
+REQUEST_DEADLINES = {
+    'recipe:recipe-list': 5,
+    'recipe:recipe-detail': 5,
+    'recipe:sync': 15,
+    'batch': 15,
+    'admin': 30,
 }
+REQUEST_DEADLINE_RETRY_AFTER = 5
+# The statement timeout is only lowered when it is this many ms too long.
+REQUEST_DEADLINE_SLACK_MS = 50
+
+# Requests profiled through the X-Profile header: how long a profile token
+# stays valid in seconds, the query time in ms from which queries are
+# EXPLAINed and how many functions of the profile are kept.
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_EXPLAIN_THRESHOLD_MS = 20
+PROFILE_STATS_LINES = 50
+
+# Batch endpoint: the most calls in one batch, the seconds the whole batch
+# may take, and threads running consecutive GETs (1 runs them in order).
+BATCH_MAX_REQUESTS = 20
+BATCH_TIMEOUT = 10
+BATCH_WORKERS = 1
+
+# Coalesced reads (recipe list, schema): seconds a result is fresh, seconds
+# it may still be served while one request recomputes it, the lease of that
+# request's lock, and how often requests with nothing to serve poll for it.
+COALESCE_TTL = 5
+COALESCE_STALE_TTL = 60
+COALESCE_LEASE = 5
+COALESCE_POLL_INTERVAL = 0.05
+# Largest pickled result cached, under memcached's 1 MB item limit.
+COALESCE_MAX_SIZE = 1000 * 1000
+# Per user reads are keyed by the user's data version, which changes only
+# in the cache of the process bumping it unless the cache is shared, so
+# they are not coalesced with a cache local to each process.
+COALESCE_USER_READS = not CACHES['default']['BACKEND'].endswith(
+    ('LocMemCache', 'DummyCache'))
+
+# Memory profiling of requests with tracemalloc, off unless MEMORY_PROFILE
+# is set: where each process saves its totals, the number of allocation
+# sites kept per URL name and the stack frames recorded per allocation.
+MEMORY_PROFILE = os.environ.get('MEMORY_PROFILE', '') == '1'
+MEMORY_PROFILE_DIR = os.environ.get(
+    'MEMORY_PROFILE_DIR', '/vol/web/memory-profile')
+MEMORY_PROFILE_TOP = 10
+MEMORY_PROFILE_FRAMES = 5
+
+# Audit log: the most events queued at once, events written per batch,
+# milliseconds between writes, and whether a background thread writes them
+# (otherwise each full batch is written by the request filling it; tests
+# flush explicitly). Months of events kept by the audit_partitions command.
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1000
+AUDIT_IN_BACKGROUND = True
+AUDIT_RETENTION_MONTHS = 12
+
+# Every this many recipe revisions, one stores all fields instead of the
+# changes, bounding how many deltas rebuilding a version applies.
+RECIPE_REVISION_KEYFRAME_INTERVAL = 20
+
+# Tag analytics: seconds per time bucket, buckets in the trending window,
+# names tracked as trending candidates per bucket, uses or seconds after
+# which a process merges its counts into the database, in a background
+# thread unless turned off, and seconds the trending tags are cached.
+TAG_ANALYTICS_BUCKET = 3600
+TAG_TRENDING_BUCKETS = 24
+TAG_TRENDING_TOP = 50
+TAG_ANALYTICS_FLUSH_EVENTS = 100
+TAG_ANALYTICS_FLUSH_INTERVAL = 10
+TAG_ANALYTICS_IN_BACKGROUND = True
+TAG_TRENDING_CACHE = 60
+
+# Archival of inactive users' recipes: days without activity before the
+# archive_inactive command archives a user, recipes per archive batch and
+# seconds between updates of a user's last_active.
+ARCHIVE_INACTIVE_DAYS = 365
+ARCHIVE_BATCH_SIZE = 500
+USER_ACTIVITY_INTERVAL = 24 * 3600
+
+# Public pages of shared recipes: seconds browsers and the CDN may cache
+# them. Edits purge them from the CDN, which may keep them much longer.
+# The CDN keeps pages not found for PUBLIC_RECIPE_MISSING_MAX_AGE.
+PUBLIC_RECIPE_MAX_AGE = 60
+PUBLIC_RECIPE_CDN_MAX_AGE = 24 * 3600
+PUBLIC_RECIPE_MISSING_MAX_AGE = 5 * 60
+
+# Purging from the CDN, see core.cdn: the function sending purges, and the
+# URL, extra headers (such as an API token) and timeout of its request.
+CDN_PURGER = 'core.cdn.purge_http'
+CDN_PURGE_URL = os.environ.get('CDN_PURGE_URL')
+CDN_PURGE_HEADERS = {}
+CDN_PURGE_TIMEOUT = 2
+
+# Health probes, see core.health: their paths, seconds between checks of
+# the dependencies, age after which a report counts as failed, and whether
+# a background thread checks (otherwise probes check when it is due).
+HEALTH_LIVENESS_PATH = '/healthz'
+HEALTH_READINESS_PATH = '/readyz'
+HEALTH_CHECK_INTERVAL = 5
+HEALTH_CHECK_MAX_AGE = 30
+HEALTH_CHECK_IN_BACKGROUND = True
@@ -0,0 +1,34 @@
+"""
+Settings for the tests.
+
+Run them with ``python manage.py test --settings=app.test_settings``.
+"""
+from app.settings import *  # noqa: F401,F403
+from app.settings import DATABASES, DATABASE_SHARD_NUMBERS
+
+# The tests exercise routing across shards with SQLite stand-ins.
+for number, alias in enumerate(('shard_a', 'shard_b'), 1):
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+    DATABASE_SHARD_NUMBERS[alias] = number
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# The tests run in one process, which the local cache is shared by.
+COALESCE_USER_READS = True
+
+# Tests flush the audit log and tag analytics, run health checks and
+# build similarity indexes themselves.
+AUDIT_IN_BACKGROUND = False
+HEALTH_CHECK_IN_BACKGROUND = False
+SIMILARITY_IN_BACKGROUND = False
+TAG_ANALYTICS_IN_BACKGROUND = False
+
+# Nothing else writes while the tests move users between shards or sync.
+SHARD_MOVE_GRACE = 0
+RECIPE_SYNC_LAG = 0
@@ -15,20 +15,21 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
+
+from core.batch import BatchView
+from core.views import SchemaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema', SpectacularAPIView.as_view(), name='api-schema'),
+    path('api/schema', SchemaView.as_view(), name='api-schema'),
     path(
         'api/docs',
         SpectacularSwaggerView.as_view(url_name='api-schema'),
         name='api-docs'
     ),
 
+    path('api/batch/', BatchView.as_view(), name='batch'),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
 ]
@@ -1,17 +1,27 @@
 """
 Django admin customization.
 """
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
+from django.utils.html import format_html_join
 from django.utils.translation import gettext_lazy as _
 
 from core import models
+from core.backends import users_by_email
+from core.paginator import EstimatedCountPaginator
+from core.sharding import shard_for_user
 
 
 class UserAdmin(BaseUserAdmin):
     """Define the admin pages for users."""
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name',)}),
@@ -43,6 +53,146 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        """Search by id or email prefix so the indexes can be used"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(id=int(term)), False
+
+        # Served by the lower(email) pattern index of 0025 on Postgres.
+        return queryset.alias(email_lower=Lower('email')).filter(
+            email_lower__startswith=term.lower()), False
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick the shard whose rows are listed, the first one by default"""
+    title = _('shard')
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+
+    def queryset(self, request, queryset):
+        if self.value() in settings.DATABASE_SHARDS:
+            return queryset.using(self.value())
+        return queryset.using(settings.DATABASE_SHARDS[0])
+
+    def choices(self, changelist):
+        # There is no list of every shard's rows, so no "All" choice.
+        current = self.value() or settings.DATABASE_SHARDS[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == current,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}),
+                'display': title,
+            }
+
+
+class RecipeAdmin(admin.ModelAdmin):
+    """
+    Define the admin pages for recipes.
+
+    The list shows one shard at a time, picked in the sidebar. Owners are
+    read from the default database, so they are prefetched, not joined.
+    """
+    ordering = ['-id']
+    list_display = ['title', 'user', 'time_minutes', 'price', 'updated_at']
+    list_filter = [ShardListFilter]
+    # Not False, which would join the owners on the recipes' shard.
+    list_select_related = ()
+    raw_id_fields = ['user', 'tag']
+    search_fields = ['title']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user')
+
+    def get_object(self, request, object_id, from_field=None):
+        """Return the recipe from the shard of its owner"""
+        field = self.model._meta.pk if from_field is None \
+            else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        queryset = self.get_queryset(request).filter(
+            **{field.name: object_id})
+        for alias in settings.DATABASE_SHARDS:
+            obj = queryset.using(alias).first()
+            if obj is not None:
+                # A user being moved has rows on both shards.
+                return queryset.using(shard_for_user(obj.user_id)).first()
+        return None
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        if obj is not None and 'tag' in form.base_fields:
+            form.base_fields['tag'].queryset = models.Tag.objects.using(
+                obj._state.db)
+        return form
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search by id, owner email or title prefix using indexes"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(id=int(term)), False
+        if '@' in term:
+            # Owners are on the default database, not the recipes' shard.
+            user_ids = list(users_by_email(term).values_list('id', flat=True))
+            return queryset.filter(user_id__in=user_ids), False
+
+        return queryset.filter(title__startswith=term), False
+
+
+class ProfileReportAdmin(admin.ModelAdmin):
+    """Read only pages for request profiles"""
+    ordering = ['-id']
+    list_display = ['id', 'method', 'path', 'status_code', 'duration_ms',
+                    'user', 'created']
+    list_select_related = ['user']
+    readonly_fields = ['user', 'method', 'path', 'status_code',
+                       'duration_ms', 'created', 'query_report', 'stats']
+    exclude = ['queries']
+
+    def query_report(self, obj):
+        """Show the SQL statements with their timings and plans"""
+        return format_html_join(
+            '\n', '<pre>{} ms [{}]\n{}\n{}</pre>',
+            (
+                (query['duration_ms'], query['alias'], query['sql'],
+                 query.get('explain') or '')
+                for query in obj.queries
+            ),
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class AuditEventAdmin(admin.ModelAdmin):
+    """Read only pages for the audit log"""
+    ordering = ['-created']
+    list_display = ['created', 'actor_id', 'action', 'model', 'object_id']
+    list_filter = ['action', 'model']
+    search_fields = ['object_id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.ProfileReport, ProfileReportAdmin)
+admin.site.register(models.AuditEvent, AuditEventAdmin)
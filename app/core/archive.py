@@ -0,0 +1,188 @@
+"""
+Archival of the recipes of inactive users.
+
+The recipes of a user inactive for ``ARCHIVE_INACTIVE_DAYS``, with their
+tag and ingredient links and revisions, are moved off the hot tables into
+``RecipeArchive`` rows, each a zlib compressed batch, in short
+transactions while the site stays up. The user is flagged ``archived`` and
+everything is moved back, ids and timestamps included, the next time they
+log in or authenticate. Batches and restores lock the user's row in the
+default database, so a restore waits for the batch under way and the
+next batch sees the user came back.
+"""
+import datetime
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from core.cdn import purge, share_key, user_key
+from core.coalescing import bump_data_version
+from core.models import (
+    Recipe,
+    RecipeArchive,
+    RecipeIngredient,
+    RecipeRevision,
+    User,
+)
+from core.sharding import shard_for_user
+
+# Rows archived with each recipe, by key in the payload.
+LINKED = {
+    'tags': Recipe.tag.through,
+    'ingredients': RecipeIngredient,
+    'revisions': RecipeRevision,
+}
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """JSON encoder keeping the microseconds of datetimes"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def lock_user(user_id):
+    """Lock the user's row until the transaction ends, return archived"""
+    return User.objects.select_for_update().filter(
+        pk=user_id).values_list('archived', flat=True).first()
+
+
+def _rows(queryset):
+    """Return the column values of every row of queryset"""
+    fields = [f.attname for f in queryset.model._meta.concrete_fields]
+    return [dict(zip(fields, row)) for row in queryset.values_list(*fields)]
+
+
+def _instances(model, rows):
+    """Return unsaved model instances from rows made by _rows"""
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+    return [
+        model(**{name: fields[name].to_python(value)
+                 for name, value in row.items()})
+        for row in rows
+    ]
+
+
+def archive_batch(user_id, using, batch_size):
+    """Move up to batch_size recipes of a user to the archive"""
+    with transaction.atomic(using=using):
+        ids = list(Recipe.objects.using(using).select_for_update().filter(
+            user_id=user_id).order_by('id').values_list(
+            'id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+
+        payload = {
+            'recipes': _rows(Recipe.objects.using(using).filter(id__in=ids)),
+        }
+        for key, model in LINKED.items():
+            queryset = model.objects.using(using).filter(recipe_id__in=ids)
+            payload[key] = _rows(queryset)
+            queryset._raw_delete(using)
+        Recipe.objects.using(using).filter(id__in=ids)._raw_delete(using)
+
+        RecipeArchive.objects.using(using).create(
+            user_id=user_id,
+            recipe_count=len(ids),
+            payload=zlib.compress(
+                json.dumps(payload, cls=ArchiveEncoder).encode()),
+        )
+    return len(ids)
+
+
+def archive_user(user, batch_size=None, sleep=0):
+    """Archive all of a user's recipes, return how many were moved"""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    using = shard_for_user(user.pk)
+    if not Recipe.objects.using(using).filter(user_id=user.pk).exists():
+        return 0
+
+    # Saving caches the flag with the token generation, so the next
+    # signed token triggers the restore.
+    with transaction.atomic():
+        locked = User.objects.select_for_update().get(pk=user.pk)
+        locked.archived = True
+        locked.save(update_fields=['archived'])
+    user.archived = True
+    bump_data_version(user.pk)
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            # The user may have come back since the last batch.
+            if not lock_user(user.pk):
+                break
+            moved = archive_batch(user.pk, using, batch_size)
+        if not moved:
+            break
+        archived += moved
+        if sleep:
+            time.sleep(sleep)
+
+    # Shared recipes are not public while archived.
+    purge([user_key(user.pk)])
+    return archived
+
+
+def _restore_rows(model, rows, using):
+    """Insert archived rows, keeping their ids and timestamps"""
+    objs = _instances(model, rows)
+    auto_now = [
+        f.name for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    model.objects.using(using).bulk_create(objs)
+    if auto_now:
+        # bulk_create stamps auto_now fields with the current time.
+        model.objects.using(using).bulk_update(
+            _instances(model, rows), auto_now)
+
+
+def restore_user(user_id):
+    """Move a user's archived recipes back, return how many"""
+    using = shard_for_user(user_id)
+    restored = 0
+    slugs = []
+    with transaction.atomic():
+        if not lock_user(user_id):
+            # Restored by another request meanwhile.
+            return 0
+        with transaction.atomic(using=using):
+            archives = RecipeArchive.objects.using(using).select_for_update(
+                ).filter(user_id=user_id).order_by('id')
+            for archive in archives:
+                payload = json.loads(zlib.decompress(archive.payload))
+                _restore_rows(Recipe, payload['recipes'], using)
+                slugs.extend(
+                    row['share_slug'] for row in payload['recipes']
+                    if row['share_slug'])
+                for key, model in LINKED.items():
+                    _restore_rows(model, payload[key], using)
+                restored += archive.recipe_count
+            archives.delete()
+        User.objects.filter(pk=user_id).update(archived=False)
+
+    bump_data_version(user_id)
+    # Drop the not found pages cached while the recipes were archived.
+    purge([share_key(slug) for slug in slugs])
+    return restored
+
+
+def user_seen(user):
+    """Record that a user is active, restoring their recipes if archived"""
+    now = timezone.now()
+    interval = settings.USER_ACTIVITY_INTERVAL
+    if user.last_active is None or \
+            (now - user.last_active).total_seconds() >= interval:
+        User.objects.filter(pk=user.pk).update(last_active=now)
+        user.last_active = now
+    if user.archived:
+        restore_user(user.pk)
+        user.archived = False
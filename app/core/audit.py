@@ -0,0 +1,124 @@
+"""
+Audit trail of changes to recipes, tags and users.
+
+Changes are not written in the request that makes them. Once its
+transaction commits, an event goes on a bounded in-process queue, and a
+background thread writes the queue with one ``bulk_create`` every
+``AUDIT_BATCH_SIZE`` events or ``AUDIT_FLUSH_INTERVAL`` milliseconds,
+whichever comes first. Whatever is left is written when the process exits.
+If the queue is full the request writes it itself, so events are delayed
+rather than lost.
+
+The actor is the user of the request being served, read from the request
+``AuditMiddleware`` remembers, after DRF has authenticated it.
+"""
+import atexit
+import contextvars
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+current_request = contextvars.ContextVar('audit_request', default=None)
+
+
+def current_actor_id():
+    """Return the id of the user making the current request, or None"""
+    request = current_request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+class AuditLog:
+    """Bounded queue of audit events and the thread writing them"""
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def start(self):
+        """Create the queue, and the thread if writing in the background"""
+        with self.lock:
+            if self.queue is not None:
+                return
+            self.queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+            if settings.AUDIT_IN_BACKGROUND:
+                self.thread = threading.Thread(
+                    target=self.run, name='audit-log', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def record(self, event):
+        """Queue an event, writing the queue here if it is full"""
+        self.start()
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                break
+            except queue.Full:
+                self.flush()
+
+        if self.queue.qsize() >= settings.AUDIT_BATCH_SIZE:
+            if self.thread is None:
+                self.flush()
+            else:
+                self.wakeup.set()
+
+    def take(self):
+        """Remove and return up to a batch of queued events"""
+        events = []
+        while len(events) < settings.AUDIT_BATCH_SIZE:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def flush(self):
+        """Write every queued event"""
+        if self.queue is None:
+            return
+        while True:
+            events = self.take()
+            if not events:
+                return
+            AuditEvent.objects.using('default').bulk_create(events)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.AUDIT_FLUSH_INTERVAL / 1000)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing audit events failed')
+            finally:
+                connections.close_all()
+
+
+audit_log = AuditLog()
+
+
+def audit(instance, action, changes=None):
+    """Record a change to instance once the transaction commits"""
+    event = AuditEvent(
+        created=timezone.now(),
+        actor_id=current_actor_id(),
+        model=instance._meta.label_lower,
+        object_id=str(instance.pk),
+        action=action,
+        changes=changes,
+    )
+    using = instance._state.db or 'default'
+    transaction.on_commit(lambda: audit_log.record(event), using=using)
@@ -0,0 +1,82 @@
+"""
+Authentication with signed access tokens and expiring authtoken tokens.
+"""
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+from core.archive import user_seen
+from core.models import User
+from core.tokens import (
+    InvalidToken,
+    auth_token_expired,
+    auth_token_needs_renewal,
+    check_access_token,
+)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate ``Authorization: Bearer <access token>`` headers.
+
+    The user is not loaded: ``request.user`` is a User with only its id
+    set, and other fields are fetched from the database if they are read.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header.')
+
+        try:
+            user_id = check_access_token(auth[1].decode())
+        except (InvalidToken, UnicodeError):
+            raise exceptions.AuthenticationFailed(
+                'Invalid or expired token.')
+
+        return User.from_db('default', ['id'], [user_id]), None
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication where unused tokens expire.
+
+    ``Token.created`` is moved forward as the token is used, so it holds
+    when the token was last used, to within ``TOKEN_RENEW_INTERVAL``. It is
+    written at most once per interval rather than on every request.
+    """
+
+    def authenticate_credentials(self, key):
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        if auth_token_expired(token):
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        if auth_token_needs_renewal(token):
+            # Matching on the old value lets only one of many concurrent
+            # requests write.
+            Token.objects.filter(key=key, created=token.created).update(
+                created=timezone.now())
+            user_seen(token.user)
+        elif token.user.archived:
+            user_seen(token.user)
+
+        return token.user, token
@@ -0,0 +1,38 @@
+"""
+Authentication backend matching emails case-insensitively.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+from core.models import User
+
+
+def users_by_email(email):
+    """Return the users whose email equals email, ignoring case"""
+    # Filters on lower(email), which the unique index in 0018 covers.
+    return User.objects.alias(email_lower=Lower('email')).filter(
+        email_lower=email.lower())
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticate with an email in any case, in one indexed query.
+
+    A password is hashed even when no user has the email so a miss takes
+    as long as a wrong password.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = users_by_email(username).get()
+        except User.DoesNotExist:
+            User().set_password(password)
+            return None
+        if user.check_password(password) and \
+                self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,225 @@
+"""
+Batch endpoint running several API calls in one HTTP request.
+
+The batch is authenticated and throttled once, taking a token from the
+read or write bucket for each of its calls, and each sub-request is
+resolved and dispatched in this process with that user forced on it, the
+way DRF's test client forces authentication. Only DRF views returning
+whole responses can be called. Sub-requests run in order on the
+request's database connection. With ``BATCH_WORKERS`` above 1, runs of
+consecutive GETs are spread over threads, each with its own connection
+and the request's deadline, cut short at the batch's timeout.
+"""
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core.deadlines import Deadline, DeadlineExceeded
+from core.throttling import BulkThrottle, TokenBucketThrottle
+
+TIMED_OUT = {'status': 504, 'body': {'detail': 'The batch timed out.'}}
+NOT_BATCHABLE = {
+    'status': 400, 'body': {'detail': 'This path cannot be batched.'}}
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """Serializer for one call in a batch"""
+    method = serializers.ChoiceField(
+        choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        """Only allow API routes, other than the batch itself"""
+        path = urlsplit(value).path
+        if not path.startswith('/api/') or path == '/api/batch/':
+            raise serializers.ValidationError('Not an API path.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for the calls of a batch"""
+    requests = BatchRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        """Check the batch is not too big"""
+        limit = settings.BATCH_MAX_REQUESTS
+        if len(value) > limit:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {limit} elements.')
+        return value
+
+
+class BatchReadThrottle(TokenBucketThrottle):
+    """Take a read token for each safe call of a batch"""
+    scope = 'read'
+    safe = True
+
+    def get_cost(self, request, view):
+        calls = request.data.get('requests') \
+            if isinstance(request.data, dict) else None
+        if not isinstance(calls, list):
+            return 0
+        # Batches over the limit are refused without running anything.
+        calls = calls[:settings.BATCH_MAX_REQUESTS]
+        return sum(
+            1 for call in calls if isinstance(call, dict) and
+            (call.get('method') in SAFE_METHODS) == self.safe)
+
+
+class BatchWriteThrottle(BatchReadThrottle):
+    """Take a write token for each unsafe call of a batch"""
+    scope = 'write'
+    safe = False
+
+
+def _sub_request(request, call):
+    """Return a request for one call, carrying the batch's auth"""
+    url = urlsplit(call['path'])
+    body = b''
+    if 'body' in call:
+        body = json.dumps(call['body']).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key.startswith('HTTP_') or key in (
+            'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'wsgi.url_scheme')
+    }
+    environ.update({
+        'REQUEST_METHOD': call['method'],
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    sub_request = WSGIRequest(environ)
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    # The batch took a read or write token for this call already; views'
+    # own buckets, such as the bulk one, still apply.
+    sub_request.batched = True
+    return sub_request
+
+
+def dispatch(request, call):
+    """Run one call and return its status and body"""
+    sub_request = _sub_request(request, call)
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return {'status': 404, 'body': {'detail': 'Not found.'}}
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None or not issubclass(view_class, APIView):
+        return NOT_BATCHABLE
+    sub_request.resolver_match = match
+
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if response.streaming:
+            response.close()
+            return NOT_BATCHABLE
+        if hasattr(response, 'render'):
+            response.render()
+    except DeadlineExceeded:
+        return {'status': 503,
+                'body': {'detail': 'The request took too long.'}}
+
+    body = response.content
+    if body and response.get('Content-Type', '').startswith(
+            'application/json'):
+        body = json.loads(body)
+    else:
+        body = body.decode(response.charset, errors='replace')
+    return {'status': response.status_code, 'body': body}
+
+
+def _dispatch_in_thread(request, call, expires):
+    """Run one call on this thread's connections, bounded by expires"""
+    deadline = Deadline()
+    deadline.expires = expires
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(deadline))
+            return dispatch(request, call)
+    finally:
+        connections.close_all()
+
+
+class BatchView(APIView):
+    """Run several API calls and return all their responses"""
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [BulkThrottle, BatchReadThrottle, BatchWriteThrottle]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        calls = serializer.validated_data['requests']
+        deadline = time.monotonic() + settings.BATCH_TIMEOUT
+
+        results = [None] * len(calls)
+        i = 0
+        while i < len(calls):
+            end = i + 1
+            if settings.BATCH_WORKERS > 1 and calls[i]['method'] == 'GET':
+                while end < len(calls) and calls[end]['method'] == 'GET':
+                    end += 1
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                results[i:] = [TIMED_OUT] * (len(calls) - i)
+                break
+            if end - i == 1:
+                results[i] = dispatch(request, calls[i])
+            else:
+                results[i:end] = self._dispatch_concurrently(
+                    request, calls[i:end], deadline)
+            i = end
+
+        return Response({'responses': results})
+
+    def _dispatch_concurrently(self, request, calls, deadline):
+        # Queries in the threads stop at the batch's timeout, or earlier
+        # at the request's deadline.
+        request_deadline = getattr(request._request, 'deadline', None)
+        expires = deadline
+        if request_deadline is not None and \
+                request_deadline.expires is not None:
+            expires = min(expires, request_deadline.expires)
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(settings.BATCH_WORKERS, len(calls)))
+        futures = [
+            executor.submit(_dispatch_in_thread, request, call, expires)
+            for call in calls
+        ]
+        wait(futures, timeout=deadline - time.monotonic())
+        # Calls not started are dropped. Running ones are waited for, so
+        # that no write outlives the batch; their queries hit the deadline.
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        return [
+            TIMED_OUT if future.cancelled() else future.result()
+            for future in futures
+        ]
@@ -0,0 +1,52 @@
+"""
+Purging of public responses cached by the CDN.
+
+Public responses name what they show in a ``Surrogate-Key`` header, and
+``purge`` asks the CDN to drop every cached response tagged with one of
+some keys once the transaction commits. ``CDN_PURGER`` is the function
+sending the request; the default posts the keys to ``CDN_PURGE_URL`` and
+does nothing without one.
+"""
+import logging
+import urllib.request
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def share_key(slug):
+    """Key of the public page of a shared recipe"""
+    return f'share-{slug}'
+
+
+def user_key(user_id):
+    """Key of every public page showing a user's data"""
+    return f'user-{user_id}'
+
+
+def purge_http(keys):
+    """Ask the CDN at CDN_PURGE_URL to drop the responses with keys"""
+    if not settings.CDN_PURGE_URL:
+        return
+    headers = {'Surrogate-Key': ' '.join(keys)}
+    headers.update(settings.CDN_PURGE_HEADERS)
+    request = urllib.request.Request(
+        settings.CDN_PURGE_URL, method='POST', headers=headers)
+    try:
+        urllib.request.urlopen(
+            request, timeout=settings.CDN_PURGE_TIMEOUT).close()
+    except OSError as exc:
+        # The pages then stay cached until they expire.
+        logger.warning('Could not purge %s from the CDN: %s', keys, exc)
+
+
+def purge(keys, using='default'):
+    """Purge the keys from the CDN once the transaction commits"""
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    purger = import_string(settings.CDN_PURGER)
+    transaction.on_commit(lambda: purger(keys), using=using)
@@ -0,0 +1,78 @@
+"""
+Single flight computation of expensive, identical reads.
+
+Results are cached under a key naming the request and, for per user data,
+the user's data version, which signals replace on every change. When the
+cached value is missing or older than ``COALESCE_TTL``, one request takes a
+short lease lock in the cache and recomputes it. Meanwhile the others are
+served the previous value for up to ``COALESCE_STALE_TTL`` seconds, or, if
+there is none, wait for the lock holder's result. Values pickling to more
+than ``COALESCE_MAX_SIZE`` bytes are not cached, as memcached refuses them;
+each request then computes its own.
+"""
+import hashlib
+import pickle
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def version_key(user_id):
+    return f'data_version:{user_id}'
+
+
+def data_version(user_id):
+    """Return the current version of a user's recipe data"""
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = bump_data_version(user_id)
+    return version
+
+
+def bump_data_version(user_id):
+    """Give a user's data a new version, retiring cached reads of it"""
+    version = secrets.token_hex(8)
+    cache.set(version_key(user_id), version, None)
+    return version
+
+
+def request_key(name, request, user_id=None):
+    """Return the key of a read by the request's path and query string"""
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    if user_id is None:
+        return f'coalesce:{name}:{path}'
+    return f'coalesce:{name}:{user_id}:{data_version(user_id)}:{path}'
+
+
+def coalesce(key, compute):
+    """Return the cached value of key, computing it once when needed"""
+    lock_key = f'{key}:lock'
+    give_up = time.monotonic() + settings.COALESCE_LEASE
+    while True:
+        entry = cache.get(key)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        if cache.add(lock_key, 1, settings.COALESCE_LEASE):
+            try:
+                value = compute()
+                entry = (value, time.time() + settings.COALESCE_TTL)
+                size = len(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+                if size <= settings.COALESCE_MAX_SIZE:
+                    cache.set(
+                        key,
+                        entry,
+                        settings.COALESCE_TTL + settings.COALESCE_STALE_TTL,
+                    )
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        if entry is not None:
+            return entry[0]
+        if time.monotonic() >= give_up:
+            # The lock holder is stuck or gone; do not wait any longer.
+            return compute()
+        time.sleep(settings.COALESCE_POLL_INTERVAL)
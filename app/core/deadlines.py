@@ -0,0 +1,142 @@
+"""
+Request deadlines enforced on every SQL query.
+
+A request gets a time budget from ``REQUEST_DEADLINES`` when its view is
+resolved. Each query then runs with whatever is left of it: on Postgres as
+the session's ``statement_timeout``, changed only when the remaining time
+has dropped noticeably below the value already set, and on SQLite through
+a progress handler that interrupts the statement. A query started after
+the deadline, or cut off by it, raises ``DeadlineExceeded``.
+
+Postgres undoes a ``SET`` made in a transaction or savepoint that rolls
+back. Each one made inside an atomic block is watched through an
+``on_commit`` callback: once Django has dropped the callback without
+running it, the timeout is back to what it was before.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError
+
+# Postgres error code of a statement cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+# Opcodes SQLite runs between checks of the deadline.
+SQLITE_PROGRESS_OPCODES = 10000
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of its time budget"""
+
+
+def budget_for(resolver_match):
+    """Return the seconds a request to a view may take, or None"""
+    budgets = settings.REQUEST_DEADLINES
+    for name in (resolver_match.view_name, resolver_match.namespace):
+        if name in budgets:
+            return budgets[name]
+    return settings.REQUEST_DEADLINE
+
+
+class Deadline:
+    """Execute wrapper bounding queries by the time left to a request"""
+
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.expires = None
+        self.timeouts = {}
+        # (commit event, timeout before) of SETs in open atomic blocks.
+        self.uncommitted = {}
+
+    def start(self, budget):
+        """Set the budget, counted from when the request started"""
+        if budget is not None:
+            self.expires = self.started + budget
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def __call__(self, execute, sql, params, many, context):
+        remaining = self.remaining()
+        if remaining is None:
+            return execute(sql, params, many, context)
+        if remaining <= 0:
+            raise DeadlineExceeded()
+
+        connection = context['connection']
+        if connection.vendor == 'postgresql':
+            return self._execute_postgresql(
+                execute, sql, params, many, context, remaining)
+        if connection.vendor == 'sqlite':
+            return self._execute_sqlite(
+                execute, sql, params, many, context)
+        return execute(sql, params, many, context)
+
+    def _execute_postgresql(self, execute, sql, params, many, context,
+                            remaining):
+        connection = context['connection']
+        timeout = max(int(remaining * 1000), 1)
+        current = self._current_timeout(connection)
+        if current is None or \
+                current - timeout > settings.REQUEST_DEADLINE_SLACK_MS:
+            # The raw cursor skips the execute wrappers.
+            context['cursor'].cursor.execute(
+                'SET statement_timeout = %s', [timeout])
+            if connection.in_atomic_block:
+                committed = threading.Event()
+                connection.on_commit(committed.set)
+                self.uncommitted.setdefault(connection.alias, []).append(
+                    (committed, current))
+            self.timeouts[connection.alias] = timeout
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) == QUERY_CANCELED:
+                raise DeadlineExceeded() from e
+            raise
+
+    def _current_timeout(self, connection):
+        """Return the timeout set on connection, minus rolled back SETs"""
+        alias = connection.alias
+        pending = self.uncommitted.get(alias)
+        while pending:
+            committed, previous = pending[-1]
+            if committed.is_set():
+                pending.clear()
+            elif any(entry[1] == committed.set
+                     for entry in connection.run_on_commit):
+                break
+            else:
+                # Its transaction or savepoint was rolled back.
+                pending.pop()
+                if previous is None:
+                    self.timeouts.pop(alias, None)
+                else:
+                    self.timeouts[alias] = previous
+        return self.timeouts.get(alias)
+
+    def _execute_sqlite(self, execute, sql, params, many, context):
+        connection = context['connection'].connection
+        connection.set_progress_handler(
+            lambda: self.remaining() <= 0, SQLITE_PROGRESS_OPCODES)
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'interrupted' in str(e):
+                raise DeadlineExceeded() from e
+            raise
+        finally:
+            connection.set_progress_handler(None, 0)
+
+    def reset(self, connections):
+        """Put back the statement timeout of connections it changed"""
+        for alias in self.timeouts:
+            connection = connections[alias]
+            if connection.connection is None:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('SET statement_timeout TO DEFAULT')
+        self.timeouts.clear()
+        self.uncommitted.clear()
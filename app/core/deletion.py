@@ -0,0 +1,201 @@
+"""
+Fast deletion of a user and everything they own.
+
+``User.delete()`` makes Django's collector load every recipe, tag and link
+row of the user into Python and send a signal per object. Here the rows are
+removed table by table with set based ``DELETE``s of ``batch_size`` rows,
+each in its own short transaction, children before parents. Instead of the
+per object signals, ``user_data_deleted`` is sent once at the end so caches
+and indexes can be dropped in one go.
+
+Progress is recorded in a ``UserDeletion`` row after every batch. Every
+step only deletes what is left, so a deletion cut short by a crash or a
+deploy is finished by running it again: ``resume_user_deletions`` picks
+up those that failed or stopped making progress.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.db import connections
+from django.utils import timezone
+from django.dispatch import Signal
+from rest_framework.authtoken.models import Token
+
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeArchive,
+    RecipeIngredient,
+    RecipeRevision,
+    RecipeTombstone,
+    RefreshToken,
+    Tag,
+    User,
+    UserDeletion,
+)
+from core.sharding import is_sharded, shard_for_user
+from core.tokens import revoke_tokens
+
+logger = logging.getLogger(__name__)
+
+# Sent with ``user_id`` and ``using`` once a user's data is gone.
+user_data_deleted = Signal()
+
+
+def _progress(record):
+    return {
+        'status': record.status,
+        'step': record.step,
+        'deleted': record.deleted,
+    }
+
+
+def deletion_progress(user_id):
+    """Return the progress of deleting a user, or None"""
+    record = UserDeletion.objects.filter(user_id=user_id).first()
+    return None if record is None else _progress(record)
+
+
+def _steps(user_id):
+    """Return (name, queryset) for each table, children first"""
+    return [
+        ('recipe tags', Recipe.tag.through.objects.filter(
+            recipe__user_id=user_id)),
+        ('tag links', Recipe.tag.through.objects.filter(
+            tag__user_id=user_id)),
+        ('recipe ingredients', RecipeIngredient.objects.filter(
+            recipe__user_id=user_id)),
+        ('ingredient links', RecipeIngredient.objects.filter(
+            ingredient__user_id=user_id)),
+        ('revisions', RecipeRevision.objects.filter(user_id=user_id)),
+        ('recipes', Recipe.objects.filter(user_id=user_id)),
+        ('tags', Tag.objects.filter(user_id=user_id)),
+        ('ingredients', Ingredient.objects.filter(user_id=user_id)),
+        ('tombstones', RecipeTombstone.objects.filter(user_id=user_id)),
+        ('archives', RecipeArchive.objects.filter(user_id=user_id)),
+        ('refresh tokens', RefreshToken.objects.filter(user_id=user_id)),
+        ('tokens', Token.objects.filter(user_id=user_id)),
+        ('admin log', LogEntry.objects.filter(user_id=user_id)),
+    ]
+
+
+def _delete_in_batches(queryset, using, batch_size):
+    """Delete the rows of queryset without the collector, yield the counts"""
+    queryset = queryset.using(using)
+    model = queryset.model
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield model._base_manager.using(using).filter(
+            pk__in=pks)._raw_delete(using)
+
+
+def delete_shard_data(user_id, using, batch_size=None):
+    """Delete a user's rows from one shard, e.g. after moving them away"""
+    batch_size = batch_size or settings.USER_DELETION_BATCH_SIZE
+    for name, queryset in _steps(user_id):
+        if is_sharded(queryset.model):
+            for _ in _delete_in_batches(queryset, using, batch_size):
+                pass
+
+
+def delete_user(user_id, using='default', batch_size=None):
+    """Delete a user and all their data, recording progress as it goes"""
+    batch_size = batch_size or settings.USER_DELETION_BATCH_SIZE
+    record, _ = UserDeletion.objects.get_or_create(
+        user_id=user_id, defaults={'using': using})
+    record.using = using
+    record.status = UserDeletion.RUNNING
+    shard = shard_for_user(user_id)
+    for name, queryset in _steps(user_id):
+        record.step = name
+        record.deleted.setdefault(name, 0)
+        record.save()
+        for count in _delete_in_batches(
+                queryset, shard if is_sharded(queryset.model) else using,
+                batch_size):
+            record.deleted[name] += count
+            record.save(update_fields=['deleted', 'updated'])
+
+    # Nothing is left for the collector to load.
+    User.objects.using(using).filter(pk=user_id).delete()
+    user_data_deleted.send(sender=User, user_id=user_id, using=using)
+
+    record.status = UserDeletion.DONE
+    record.step = None
+    record.save()
+    return _progress(record)
+
+
+def _delete_user_in_thread(user_id, using):
+    try:
+        delete_user(user_id, using)
+    except Exception:
+        UserDeletion.objects.filter(user_id=user_id).update(
+            status=UserDeletion.FAILED, updated=timezone.now())
+        raise
+    finally:
+        connections.close_all()
+
+
+def resume_user_deletions(batch_size=None):
+    """
+    Finish the deletions that failed or were abandoned, return their ids.
+
+    A pending or running deletion counts as abandoned once its progress
+    is older than ``USER_DELETION_STALE_AFTER`` seconds. Records of
+    deletions done more than ``USER_DELETION_TTL`` seconds ago are dropped.
+    """
+    now = timezone.now()
+    UserDeletion.objects.filter(
+        status=UserDeletion.DONE,
+        updated__lt=now - timedelta(seconds=settings.USER_DELETION_TTL),
+    ).delete()
+
+    stale = now - timedelta(seconds=settings.USER_DELETION_STALE_AFTER)
+    unfinished = UserDeletion.objects.filter(
+        status__in=[UserDeletion.PENDING, UserDeletion.RUNNING],
+        updated__lt=stale,
+    ) | UserDeletion.objects.filter(status=UserDeletion.FAILED)
+
+    resumed = []
+    for record in unfinished.order_by('started'):
+        try:
+            delete_user(record.user_id, record.using, batch_size)
+        except Exception:
+            logger.exception('Could not delete user %s', record.user_id)
+            UserDeletion.objects.filter(user_id=record.user_id).update(
+                status=UserDeletion.FAILED, updated=timezone.now())
+        else:
+            resumed.append(record.user_id)
+    return resumed
+
+
+def start_user_deletion(user, using='default'):
+    """
+    Lock a user out and delete their data.
+
+    The deletion runs in a background thread unless
+    ``USER_DELETION_IN_BACKGROUND`` is off. Starting it again for a user
+    whose deletion was cut short finishes it.
+    """
+    User.objects.using(using).filter(pk=user.pk).update(is_active=False)
+    revoke_tokens(user)
+    UserDeletion.objects.update_or_create(
+        user_id=user.pk,
+        defaults={'using': using, 'status': UserDeletion.PENDING})
+    if not settings.USER_DELETION_IN_BACKGROUND:
+        return delete_user(user.pk, using)
+
+    thread = threading.Thread(
+        target=_delete_user_in_thread,
+        args=(user.pk, using),
+        name=f'delete-user-{user.pk}',
+        daemon=True,
+    )
+    thread.start()
+    return thread
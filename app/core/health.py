@@ -0,0 +1,142 @@
+"""
+Liveness and readiness of the process for the orchestrator's probes.
+
+``/healthz`` only shows the process answers. ``/readyz`` reports whether
+its dependencies work: every database is reachable, with its latency,
+the cache answers and no migration is pending. Those checks run in a
+background thread every ``HEALTH_CHECK_INTERVAL`` seconds and probes read
+the last report, so a probe never waits on I/O however often it comes. A
+report older than ``HEALTH_CHECK_MAX_AGE`` counts as a failure, in case
+the checks themselves hang.
+"""
+import logging
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import OperationalError
+from psycopg2 import OperationalError as Psycopg2OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the database is unavailable, also awaited by wait_for_db.
+DATABASE_ERRORS = (Psycopg2OperationalError, OperationalError)
+
+
+def check_database(alias):
+    """Run a trivial query on a database, return its latency in ms"""
+    connection = connections[alias]
+    start = time.monotonic()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DATABASE_ERRORS:
+        # Reconnect on the next check rather than reuse a broken link.
+        connection.close()
+        raise
+    return (time.monotonic() - start) * 1000
+
+
+def check_cache():
+    """Write and read back a value in the cache, return the latency in ms"""
+    value = secrets.token_hex(8)
+    start = time.monotonic()
+    cache.set('health_check', value, 60)
+    if cache.get('health_check') != value:
+        raise RuntimeError('Cache did not return the value written')
+    return (time.monotonic() - start) * 1000
+
+
+def pending_migrations(alias):
+    """Return how many migrations are not applied on a database"""
+    executor = MigrationExecutor(connections[alias])
+    return len(executor.migration_plan(executor.loader.graph.leaf_nodes()))
+
+
+class HealthChecker:
+    """Last report on the dependencies and the thread refreshing it"""
+
+    def __init__(self):
+        # (time.monotonic() of the checks, their results), or None.
+        self.last = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # Databases found fully migrated, which they then stay.
+        self.migrated = set()
+
+    def start(self):
+        """Start refreshing the report in the background"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='health-check', daemon=True)
+            self.thread.start()
+
+    def _check(self, checks, name, probe, *args):
+        try:
+            checks[name] = {
+                'ok': True, 'latency_ms': round(probe(*args), 2)}
+        except Exception as exc:
+            logger.warning('Health check %s failed: %r', name, exc)
+            checks[name] = {'ok': False, 'error': type(exc).__name__}
+
+    def refresh(self):
+        """Check every dependency and store the report"""
+        checks = {}
+        for alias in settings.DATABASE_SHARDS:
+            self._check(checks, f'database:{alias}', check_database, alias)
+        self._check(checks, 'cache', check_cache)
+
+        pending = 0
+        try:
+            for alias in settings.DATABASE_SHARDS:
+                if alias not in self.migrated:
+                    count = pending_migrations(alias)
+                    if not count:
+                        self.migrated.add(alias)
+                    pending += count
+            checks['migrations'] = {'ok': not pending, 'pending': pending}
+        except Exception as exc:
+            logger.warning('Health check migrations failed: %r', exc)
+            checks['migrations'] = {'ok': False, 'error': type(exc).__name__}
+
+        self.last = (time.monotonic(), checks)
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Health check failed')
+            time.sleep(settings.HEALTH_CHECK_INTERVAL)
+
+    def readiness(self):
+        """Return (ready, report) from the last checks"""
+        if settings.HEALTH_CHECK_IN_BACKGROUND:
+            self.start()
+        elif self.last is None or time.monotonic() - self.last[0] >= \
+                settings.HEALTH_CHECK_INTERVAL:
+            # Without the thread, as in tests, probes check when it is due.
+            self.refresh()
+
+        last = self.last
+        if last is None:
+            return False, {'status': 'starting', 'checks': {}}
+        checked_at, checks = last
+        age = time.monotonic() - checked_at
+        ready = age < settings.HEALTH_CHECK_MAX_AGE and \
+            all(check['ok'] for check in checks.values())
+        return ready, {
+            'status': 'ok' if ready else 'unavailable',
+            'age': round(age, 1),
+            'checks': checks,
+        }
+
+
+health_checker = HealthChecker()
@@ -0,0 +1,46 @@
+"""
+Django command to archive the recipes of inactive users
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import archive_user
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command moving inactive users' recipes to the archive"""
+    help = (
+        'Move the recipes of users inactive for --days to the compressed '
+        'archive. They come back when the user logs in again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_INACTIVE_DAYS)
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        users = User.objects.filter(
+            last_active__lt=cutoff, archived=False).order_by('pk')
+        archived_users = recipes = 0
+        for user in users.iterator():
+            moved = archive_user(
+                user, options['batch_size'], options['sleep'])
+            if moved:
+                archived_users += 1
+                recipes += moved
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {recipes} recipes of {archived_users} users'))
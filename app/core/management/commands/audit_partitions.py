@@ -0,0 +1,107 @@
+"""
+Django command to create and drop the monthly audit log partitions
+"""
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import AuditEvent
+
+PARTITION = re.compile(r'^core_auditevent_y(\d{4})m(\d{2})$')
+
+
+def add_months(month, count):
+    """Return the first of the month count months after month"""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f'core_auditevent_y{month.year:04d}m{month.month:02d}'
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition of a month, taking its rows from the default one.
+
+    Postgres refuses a partition for values the default partition holds, so
+    the table is filled with them before it is attached. Inserts wait for
+    the lock meanwhile, rather than land in the default partition.
+    """
+    name = partition_name(month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return
+    bounds = [month, add_months(month, 1)]
+    cursor.execute('LOCK TABLE core_auditevent IN SHARE ROW EXCLUSIVE MODE')
+    cursor.execute(
+        f'CREATE TABLE {name} (LIKE core_auditevent INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM core_auditevent_default '
+        f'WHERE created >= %s AND created < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved', bounds)
+    cursor.execute(
+        f'ALTER TABLE core_auditevent ATTACH PARTITION {name} '
+        f'FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+class Command(BaseCommand):
+    """Django command keeping the audit log partitioned by month"""
+    help = (
+        'Create audit log partitions for the coming months and drop '
+        'the ones past retention. Without Postgres, old events are '
+        'deleted instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Months after the current one to create partitions for.')
+        parser.add_argument(
+            '--retain', type=int, default=settings.AUDIT_RETENTION_MONTHS,
+            help='Months of events to keep, the current one included.')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        this_month = timezone.now().replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0)
+        cutoff = add_months(this_month, 1 - options['retain'])
+        connection = connections['default']
+
+        if connection.vendor != 'postgresql':
+            deleted, _ = AuditEvent.objects.filter(created__lt=cutoff).delete()
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} audit events'))
+            return
+
+        last = add_months(this_month, options['months_ahead'])
+        with connection.cursor() as cursor:
+            for count in range(options['months_ahead'] + 1):
+                # One short transaction each, as it locks out inserts.
+                with transaction.atomic():
+                    create_partition(cursor, add_months(this_month, count))
+
+            cursor.execute(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = 'core_auditevent'::regclass")
+            dropped = []
+            for (name,) in cursor.fetchall():
+                match = PARTITION.match(name)
+                if match is None:
+                    continue
+                month = datetime(
+                    int(match[1]), int(match[2]), 1, tzinfo=this_month.tzinfo)
+                if month < cutoff:
+                    # Dropping a partition is instant, unlike a DELETE.
+                    cursor.execute(f'DROP TABLE {name}')
+                    dropped.append(name)
+
+        # Events from before partitions existed sit in the default one.
+        AuditEvent.objects.filter(created__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Partitions ready until {partition_name(last)}, '
+            f'dropped {len(dropped)}'))
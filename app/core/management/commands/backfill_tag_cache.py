@@ -0,0 +1,53 @@
+"""
+Django command to fill in and check the tag list stored on recipes
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+from core.tag_cache import build_tag_cache
+
+
+class Command(BaseCommand):
+    """Django command to backfill Recipe.tag_cache"""
+    help = 'Rebuild the denormalized tag list of every recipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report recipes whose tag list is out of date.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        using = options['database']
+        batch_size = options['batch_size']
+        recipes = Recipe.objects.using(using).order_by('id')
+        last_id = 0
+        checked = stale = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last_id).values_list(
+                'id', 'tag_cache')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            checked += len(batch)
+
+            caches = build_tag_cache([id for id, _ in batch], using)
+            outdated = [
+                Recipe(id=id, tag_cache=caches[id])
+                for id, current in batch if current != caches[id]
+            ]
+            stale += len(outdated)
+            if outdated and not options['verify']:
+                Recipe.objects.using(using).bulk_update(
+                    outdated, ['tag_cache'])
+
+        if options['verify'] and stale:
+            raise CommandError(
+                f'{stale} of {checked} recipes have an outdated tag list')
+        verb = 'Checked' if options['verify'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {checked} recipes, {stale} were out of date'))
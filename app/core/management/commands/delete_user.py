@@ -0,0 +1,30 @@
+"""
+Django command to delete a user and all their data
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.deletion import delete_user
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to delete a user without the cascade collector"""
+    help = 'Delete a user and their recipes, tags and tokens in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        using = options['database']
+        user_id = User.objects.using(using).filter(
+            email=options['email']).values_list('pk', flat=True).first()
+        if user_id is None:
+            raise CommandError(f'No user with email {options["email"]}')
+
+        progress = delete_user(user_id, using, options['batch_size'])
+        for name, count in progress['deleted'].items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Deleted user {user_id}'))
@@ -0,0 +1,46 @@
+"""
+Django command to print the memory profile of requests by URL name
+"""
+from django.core.management.base import BaseCommand
+
+from core.memory import load_stats, reset_stats
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    """Django command showing the totals of MemoryProfilingMiddleware"""
+    help = 'Show the peak memory and top allocation sites by URL name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sites', type=int, default=3,
+            help='Allocation sites to show per URL name.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Delete the recorded totals instead.')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Memory profile reset'))
+            return
+
+        stats = load_stats()
+        if not stats:
+            self.stdout.write('No requests recorded.')
+            return
+
+        ranked = sorted(
+            stats.items(), key=lambda item: item[1]['peak_max'], reverse=True)
+        for name, entry in ranked:
+            mean = entry['peak_total'] / entry['requests']
+            self.stdout.write(
+                f'{name}: {entry["requests"]} requests, peak '
+                f'{entry["peak_max"] / MB:.2f} MB, mean {mean / MB:.2f} MB')
+            for site in entry['top'][:options['sites']]:
+                self.stdout.write(
+                    f'  {site["size"] / MB:.2f} MB in {site["count"]} blocks')
+                for frame in site['traceback']:
+                    self.stdout.write(f'    {frame}')
@@ -0,0 +1,176 @@
+"""
+Django command to move a user's recipe data to another shard
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.deletion import delete_shard_data
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeRevision,
+    RecipeTombstone,
+    Tag,
+    User,
+)
+from core.sharding import set_user_shard, shard_for_user
+
+LINK_MODELS = [Recipe.tag.through, RecipeIngredient]
+
+
+class Command(BaseCommand):
+    """
+    Django command moving a user between shards while they keep working.
+
+    Everything is copied while the user is still served from the old
+    shard. Their writes are then refused while whatever changed in the
+    meantime, found through ``updated_at`` and tombstones, is copied again,
+    after a grace period for writes already under way. The directory is
+    then switched and the old rows deleted. Ids are kept, which the shards'
+    own id ranges allow.
+    """
+    help = "Move a user's recipes, tags and ingredients to another shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('shard')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help='Seconds to wait for writes under way when the user is '
+                 'frozen, SHARD_MOVE_GRACE by default.')
+
+    def copy_rows(self, queryset, target):
+        """Insert or update the rows of queryset on target, keeping ids"""
+        model = queryset.model
+        fields = [
+            f for f in model._meta.concrete_fields if not f.primary_key]
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id).order_by('pk')[
+                :self.batch_size])
+            if not batch:
+                return
+            last_id = batch[-1].pk
+
+            ids = [obj.pk for obj in batch]
+            on_target = model.objects.using(target).filter(pk__in=ids)
+            if on_target.exclude(user_id=self.user.pk).exists():
+                # Only rows created before the shards had id ranges.
+                raise CommandError(
+                    f'{model._meta.verbose_name} ids of this user are '
+                    f'already taken on {target}')
+            existing = set(on_target.values_list('pk', flat=True))
+
+            # bulk_create sets auto_now fields, so put the values back.
+            values = [[getattr(obj, f.attname) for f in fields]
+                      for obj in batch]
+            model.objects.using(target).bulk_create(
+                [obj for obj in batch if obj.pk not in existing])
+            for obj, row in zip(batch, values):
+                for field, value in zip(fields, row):
+                    setattr(obj, field.attname, value)
+            model.objects.using(target).bulk_update(
+                batch, [f.name for f in fields])
+
+            if model is Recipe:
+                self.copy_links(ids, target)
+
+    def copy_links(self, recipe_ids, target):
+        """Replace the tag and ingredient rows of recipes on target"""
+        for model in LINK_MODELS:
+            rows = list(model.objects.using(self.source).filter(
+                recipe_id__in=recipe_ids))
+            model.objects.using(target).filter(
+                recipe_id__in=recipe_ids).delete()
+            for row in rows:
+                row.pk = None
+            model.objects.using(target).bulk_create(rows)
+
+    def copy(self, target, since=None):
+        """Copy the user's data, or only what changed after since"""
+        recipes = Recipe.objects.using(self.source).filter(user=self.user)
+        tombstones = RecipeTombstone.objects.using(self.source).filter(
+            user=self.user)
+        # Revisions are never changed, only added.
+        revisions = RecipeRevision.objects.using(self.source).filter(
+            user=self.user)
+        if since is not None:
+            recipes = recipes.filter(updated_at__gt=since)
+            tombstones = tombstones.filter(deleted_at__gt=since)
+            revisions = revisions.filter(created__gt=since)
+
+        for model in (Tag, Ingredient):
+            self.copy_rows(model.objects.using(self.source).filter(
+                user=self.user), target)
+        self.copy_rows(recipes, target)
+        self.copy_rows(revisions, target)
+        self.copy_rows(tombstones, target)
+
+        deleted = list(tombstones.values_list('recipe_id', flat=True))
+        for model in LINK_MODELS + [RecipeRevision]:
+            model.objects.using(target).filter(
+                recipe_id__in=deleted).delete()
+        Recipe.objects.using(target).filter(
+            user=self.user, id__in=deleted)._raw_delete(target)
+
+    def remove_deleted(self, target):
+        """Delete tags and ingredients no longer on the source from target"""
+        for model, link, field in (
+                (Tag, Recipe.tag.through, 'tag_id'),
+                (Ingredient, RecipeIngredient, 'ingredient_id')):
+            kept = set(model.objects.using(self.source).filter(
+                user=self.user).values_list('pk', flat=True))
+            gone = [pk for pk in model.objects.using(target).filter(
+                user=self.user).values_list('pk', flat=True)
+                if pk not in kept]
+            link.objects.using(target).filter(
+                **{f'{field}__in': gone})._raw_delete(target)
+            model.objects.using(target).filter(pk__in=gone)._raw_delete(
+                target)
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        target = options['shard']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f'{target} is not one of DATABASE_SHARDS')
+        try:
+            self.user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}')
+        if self.user.archived:
+            raise CommandError(
+                'The user is archived; their recipes move back on their '
+                'next login')
+        self.batch_size = options['batch_size']
+        self.source = shard_for_user(self.user.pk)
+        if self.source == target:
+            self.stdout.write(f'User is already on {target}')
+            return
+
+        grace = options['grace']
+        if grace is None:
+            grace = settings.SHARD_MOVE_GRACE
+        # Writes committing late carry times from before they committed,
+        # so changes are looked for from the grace period before the copy.
+        since = timezone.now() - timedelta(seconds=grace)
+        self.copy(target)
+
+        set_user_shard(self.user.pk, self.source, frozen=True)
+        try:
+            time.sleep(grace)
+            self.copy(target, since)
+            self.remove_deleted(target)
+        except BaseException:
+            set_user_shard(self.user.pk, self.source)
+            raise
+        set_user_shard(self.user.pk, target)
+
+        delete_shard_data(self.user.pk, self.source, self.batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved user {self.user.pk} from {self.source} to {target}'))
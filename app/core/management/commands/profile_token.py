@@ -0,0 +1,23 @@
+"""
+Django command to issue a request profiling token
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.profiling import create_profile_token
+
+
+class Command(BaseCommand):
+    """Django command printing an X-Profile header for a staff user"""
+    help = 'Print an X-Profile header value that profiles requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        user = User.objects.filter(
+            email=options['email'], is_staff=True).first()
+        if user is None:
+            raise CommandError(f'No staff user with email {options["email"]}')
+        self.stdout.write(create_profile_token(user))
@@ -0,0 +1,54 @@
+"""
+Django command to delete expired auth and refresh tokens
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import RefreshToken
+from core.tokens import auth_token_cutoff
+
+
+class Command(BaseCommand):
+    """Django command to purge expired tokens"""
+    help = 'Delete expired tokens in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def purge(self, queryset, order_by, batch_size, sleep):
+        """Delete the rows of queryset a batch at a time"""
+        deleted = 0
+        while True:
+            # Walking the index picks a small batch without a table scan,
+            # and each batch is deleted in its own short transaction.
+            pks = list(queryset.order_by(order_by).values_list(
+                'pk', flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            # Still filtered, in case a token was renewed meanwhile.
+            deleted += queryset.filter(pk__in=pks).delete()[0]
+            if sleep:
+                time.sleep(sleep)
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        batch_size, sleep = options['batch_size'], options['sleep']
+        tokens = self.purge(
+            Token.objects.filter(created__lt=auth_token_cutoff()),
+            'created', batch_size, sleep,
+        )
+        refresh_tokens = self.purge(
+            RefreshToken.objects.filter(expires_at__lte=timezone.now()),
+            'expires_at', batch_size, sleep,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {tokens} tokens and {refresh_tokens} refresh tokens'))
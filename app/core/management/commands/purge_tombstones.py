@@ -0,0 +1,47 @@
+"""
+Django command to delete the tombstones sync cursors no longer need
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import RecipeTombstone
+
+
+class Command(BaseCommand):
+    """Django command to purge old tombstones of deleted recipes"""
+    help = (
+        'Delete tombstones older than RECIPE_SYNC_TOMBSTONE_DAYS on every '
+        'shard, in small batches. Older sync cursors get a full resync.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        cutoff = timezone.now() - timedelta(
+            days=settings.RECIPE_SYNC_TOMBSTONE_DAYS)
+        deleted = 0
+        for alias in settings.DATABASE_SHARDS:
+            tombstones = RecipeTombstone.objects.using(alias)
+            while True:
+                pks = list(tombstones.filter(deleted_at__lt=cutoff).order_by(
+                    'deleted_at').values_list(
+                    'pk', flat=True)[:options['batch_size']])
+                if not pks:
+                    break
+                deleted += tombstones.filter(pk__in=pks).delete()[0]
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} tombstones'))
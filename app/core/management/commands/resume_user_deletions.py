@@ -0,0 +1,25 @@
+"""
+Django command to finish user deletions that were cut short
+"""
+from django.core.management.base import BaseCommand
+
+from core.deletion import resume_user_deletions
+
+
+class Command(BaseCommand):
+    """Django command to resume failed or abandoned user deletions"""
+    help = (
+        'Finish deleting the users whose deletion failed or made no '
+        'progress for USER_DELETION_STALE_AFTER seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        resumed = resume_user_deletions(options['batch_size'])
+        for user_id in resumed:
+            self.stdout.write(f'Deleted user {user_id}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumed {len(resumed)} deletions'))
@@ -0,0 +1,32 @@
+"""
+Django command to print a stored request profile
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ProfileReport
+
+
+class Command(BaseCommand):
+    """Django command showing a ProfileReport"""
+    help = 'Show the SQL and the profile of a profiled request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('id', type=int)
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        try:
+            report = ProfileReport.objects.get(pk=options['id'])
+        except ProfileReport.DoesNotExist:
+            raise CommandError(f'No profile with id {options["id"]}')
+
+        self.stdout.write(
+            f'{report.method} {report.path} -> {report.status_code} in '
+            f'{report.duration_ms:.1f} ms, {len(report.queries)} queries')
+        for query in report.queries:
+            self.stdout.write(
+                f'\n{query["duration_ms"]} ms [{query["alias"]}] '
+                f'{query["sql"]}')
+            if query.get('explain'):
+                self.stdout.write(query['explain'])
+        self.stdout.write('\n' + report.stats)
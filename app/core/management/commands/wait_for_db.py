@@ -4,11 +4,10 @@ django command to wait fo db to be available
 """
 import time
 
-from django.db.utils import OperationalError
-from psycopg2 import OperationalError as psycopg2_OP_error
-
 from django.core.management.base import BaseCommand
 
+from core.health import DATABASE_ERRORS
+
 
 class Command(BaseCommand):
     """Django command for wait fo database"""
@@ -21,7 +20,7 @@ class Command(BaseCommand):
             try:
                 self.check(databases=['default'])
                 db_up = True
-            except (psycopg2_OP_error, OperationalError):
+            except DATABASE_ERRORS:
                 self.stdout.write(
                     "Database is unavailable ...waiting for 1 second")
                 time.sleep(1)
@@ -0,0 +1,150 @@
+"""
+Memory profiling of requests with tracemalloc.
+
+With ``MEMORY_PROFILE`` on, each request records how far its Python
+allocations peaked above where they started and which lines allocated the
+most of the memory still held when it ends. tracemalloc is process wide,
+so only one request per process is measured at a time and requests
+overlapping it in other threads are not measured. Every process keeps
+totals per URL name and writes them to its own JSON file in
+``MEMORY_PROFILE_DIR``; ``manage.py memory_profile`` merges them.
+"""
+import json
+import os
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+_measuring = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def start_tracing(frames):
+    """Start tracemalloc unless it is already running, return True if so"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def top_sites(before, after, limit):
+    """Return the lines whose allocations grew most between snapshots"""
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]
+    differences = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), 'traceback')
+    return [
+        {
+            'size': difference.size_diff,
+            'count': difference.count_diff,
+            'traceback': [
+                f'{frame.filename}:{frame.lineno}'
+                for frame in difference.traceback
+            ],
+        }
+        for difference in differences[:limit]
+        if difference.size_diff > 0
+    ]
+
+
+class Measurement:
+    """Peak and top allocation sites of the code run inside it"""
+
+    def __init__(self, top=None, frames=None):
+        self.top = settings.MEMORY_PROFILE_TOP if top is None else top
+        self.frames = frames or settings.MEMORY_PROFILE_FRAMES
+        self.peak = None
+        self.sites = []
+
+    def __enter__(self):
+        self.started = start_tracing(self.frames)
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot() if self.top else None
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.peak = tracemalloc.get_traced_memory()[1] - self.baseline
+        if self.top:
+            self.sites = top_sites(
+                self.before, tracemalloc.take_snapshot(), self.top)
+        self.before = None
+        if self.started:
+            tracemalloc.stop()
+
+
+def stats_path(pid=None):
+    return os.path.join(
+        settings.MEMORY_PROFILE_DIR, f'{pid or os.getpid()}.json')
+
+
+def record(name, measurement):
+    """Add a request to the totals of its URL name and save them"""
+    with _stats_lock:
+        entry = _stats.setdefault(
+            name, {'requests': 0, 'peak_total': 0, 'peak_max': 0, 'top': []})
+        entry['requests'] += 1
+        entry['peak_total'] += measurement.peak
+        if measurement.peak >= entry['peak_max']:
+            entry['peak_max'] = measurement.peak
+            entry['top'] = measurement.sites
+
+        os.makedirs(settings.MEMORY_PROFILE_DIR, exist_ok=True)
+        path = stats_path()
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(_stats, f)
+        os.replace(f'{path}.tmp', path)
+
+
+def load_stats():
+    """Return the totals of all processes merged by URL name"""
+    merged = {}
+    directory = settings.MEMORY_PROFILE_DIR
+    if not os.path.isdir(directory):
+        return merged
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename)) as f:
+            stats = json.load(f)
+        for name, entry in stats.items():
+            total = merged.setdefault(
+                name,
+                {'requests': 0, 'peak_total': 0, 'peak_max': 0, 'top': []})
+            total['requests'] += entry['requests']
+            total['peak_total'] += entry['peak_total']
+            if entry['peak_max'] >= total['peak_max']:
+                total['peak_max'] = entry['peak_max']
+                total['top'] = entry['top']
+    return merged
+
+
+def reset_stats():
+    """Forget the totals of this process and delete all saved ones"""
+    with _stats_lock:
+        _stats.clear()
+    directory = settings.MEMORY_PROFILE_DIR
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(directory, filename))
+
+
+def profile_memory(get_response, request):
+    """Run a request, measuring it if no other request is measured"""
+    if not _measuring.acquire(blocking=False):
+        return get_response(request)
+    try:
+        with Measurement() as measurement:
+            response = get_response(request)
+    finally:
+        _measuring.release()
+
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        record(match.view_name, measurement)
+    return response
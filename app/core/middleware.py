@@ -0,0 +1,150 @@
+"""
+Middleware for the project.
+"""
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from core.audit import current_request
+from core.deadlines import Deadline, DeadlineExceeded, budget_for
+from core.health import health_checker
+from core.memory import profile_memory
+from core.profiling import profile_request, profiling_user_id
+from core.sharding import ShardMoving
+
+
+class HealthCheckMiddleware:
+    """
+    Answer the orchestrator's liveness and readiness probes.
+
+    Placed first so probes skip sessions, authentication and the rest.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == settings.HEALTH_LIVENESS_PATH:
+            return JsonResponse({'status': 'ok'})
+        if request.path == settings.HEALTH_READINESS_PATH:
+            ready, report = health_checker.readiness()
+            return JsonResponse(report, status=200 if ready else 503)
+        return self.get_response(request)
+
+
+class RateLimitHeadersMiddleware:
+    """Add RateLimit-* headers for requests that went through a throttle"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        info = getattr(request, 'ratelimit', None)
+        if info is not None:
+            limit, remaining, reset = info
+            response['RateLimit-Limit'] = limit
+            response['RateLimit-Remaining'] = remaining
+            response['RateLimit-Reset'] = reset
+
+        return response
+
+
+class QueryDeadlineMiddleware:
+    """
+    Bound the SQL time of a request by the budget of its view.
+
+    Requests running out of time are answered with 503 and Retry-After.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.deadline = Deadline()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(request.deadline))
+                return self.get_response(request)
+        finally:
+            request.deadline.reset(connections)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.deadline.start(budget_for(request.resolver_match))
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, DeadlineExceeded):
+            return None
+        response = JsonResponse(
+            {'detail': 'The request took too long, try again later.'},
+            status=503,
+        )
+        response['Retry-After'] = settings.REQUEST_DEADLINE_RETRY_AFTER
+        return response
+
+
+class ShardMovingMiddleware:
+    """Answer writes refused while the user's data moves with 503"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, ShardMoving):
+            return None
+        response = JsonResponse(
+            {'detail': 'Your data is being moved, try again shortly.'},
+            status=503,
+        )
+        response['Retry-After'] = settings.SHARD_MOVE_GRACE
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile requests of staff users sending their X-Profile token"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token is None:
+            return self.get_response(request)
+
+        user_id = profiling_user_id(token)
+        if user_id is None:
+            return self.get_response(request)
+        return profile_request(self.get_response, request, user_id)
+
+
+class MemoryProfilingMiddleware:
+    """Record the memory peak of requests by URL name, if turned on"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.MEMORY_PROFILE:
+            return self.get_response(request)
+        return profile_memory(self.get_response, request)
+
+
+class AuditMiddleware:
+    """Remember the request being served, whose user audit events name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX core_recipe_tag_cache_gin ON core_recipe '
+            'USING gin (tag_cache jsonb_path_ops)'
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX core_recipe_tag_cache_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_created_at_recipetombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_cache',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(
+            create_gin_index,
+            drop_gin_index,
+            hints={'model_name': 'recipe'},
+        ),
+    ]
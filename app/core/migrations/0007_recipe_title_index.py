@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_tag_cache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='title',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index authtoken tokens by when they were last used, for purging"""
+
+    dependencies = [
+        ('core', '0010_refreshtoken_user_token_generation'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS authtoken_token_created_idx '
+            'ON authtoken_token (created)',
+            'DROP INDEX IF EXISTS authtoken_token_created_idx',
+        ),
+    ]
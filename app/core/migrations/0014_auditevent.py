@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:25
+
+import datetime
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# Postgres needs the partition key in the primary key of a partitioned
+# table. The current and next months get their partitions here and later
+# months from the audit_partitions command; rows of months without one
+# land in the default partition.
+PARTITIONED_TABLE = """
+CREATE TABLE core_auditevent (
+    id bigserial NOT NULL,
+    created timestamp with time zone NOT NULL,
+    actor_id bigint NULL,
+    model varchar(100) NOT NULL,
+    object_id varchar(64) NOT NULL,
+    action varchar(10) NOT NULL,
+    changes jsonb NULL,
+    PRIMARY KEY (id, created)
+) PARTITION BY RANGE (created);
+CREATE TABLE core_auditevent_default PARTITION OF core_auditevent DEFAULT;
+"""
+
+MONTH_PARTITION = """
+CREATE TABLE core_auditevent_y{start:%Y}m{start:%m} PARTITION OF core_auditevent
+FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');
+"""
+
+
+def create_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(PARTITIONED_TABLE)
+        start = datetime.datetime.now(datetime.timezone.utc).date().replace(
+            day=1)
+        for _ in range(2):
+            end = (start + datetime.timedelta(days=31)).replace(day=1)
+            schema_editor.execute(MONTH_PARTITION.format(
+                start=start, end=end))
+            start = end
+    else:
+        schema_editor.create_model(apps.get_model('core', 'AuditEvent'))
+
+
+def drop_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('core', 'AuditEvent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_profilereport'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='AuditEvent',
+                fields=[
+                    ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                    ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                    ('model', models.CharField(max_length=100)),
+                    ('object_id', models.CharField(max_length=64)),
+                    ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                    ('changes', models.JSONField(blank=True, null=True)),
+                ],
+            ),
+        ]),
+        migrations.RunPython(
+            create_table, drop_table, hints={'model_name': 'auditevent'}),
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['model', 'object_id'], name='core_audite_model_011e86_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['created'], name='core_audite_created_38eb53_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_reciperevision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(unique=True)),
+                ('counts', models.BinaryField()),
+                ('top', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagUsers',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('name', models.CharField(max_length=255)),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tagusers',
+            constraint=models.UniqueConstraint(fields=('bucket', 'name'), name='unique_tag_users'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Make emails unique ignoring case, and index login lookups"""
+
+    dependencies = [
+        ('core', '0017_recipe_archive'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX IF NOT EXISTS core_user_email_lower_uniq '
+            'ON core_user (lower(email))',
+            'DROP INDEX IF EXISTS core_user_email_lower_uniq',
+            hints={'model_name': 'user'},
+        ),
+    ]
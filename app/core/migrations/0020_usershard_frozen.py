@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_recipe_share_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usershard',
+            name='frozen',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db import migrations
+
+# Ids each shard may give out, as core.sharding.SHARD_ID_RANGE.
+ID_RANGE = 2 ** 40
+
+TABLES = [
+    'core_tag',
+    'core_ingredient',
+    'core_recipe',
+    'core_reciperevision',
+    'core_recipetombstone',
+]
+
+
+def set_id_ranges(apps, schema_editor):
+    """Make each shard number new rows from its own range of ids"""
+    connection = schema_editor.connection
+    number = settings.DATABASE_SHARD_NUMBERS.get(connection.alias)
+    if number is None:
+        return
+    first, last = number * ID_RANGE + 1, (number + 1) * ID_RANGE
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'SELECT MAX(id) FROM {table}')
+            start = max(first, (cursor.fetchone()[0] or 0) + 1)
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(
+                    f'ALTER SEQUENCE {sequence} MINVALUE 1 MAXVALUE {last} '
+                    f'RESTART WITH {start}')
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'DELETE FROM sqlite_sequence WHERE name = %s', [table])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    [table, start - 1])
+
+
+class Migration(migrations.Migration):
+    """Give each shard its own range of ids, so users move with their ids"""
+
+    dependencies = [
+        ('core', '0020_usershard_frozen'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            set_id_ranges, migrations.RunPython.noop,
+            hints={'model_name': 'recipe'},
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_shard_id_ranges'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipetombstone',
+            name='core_recipe_user_id_3b75f0_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipetombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'id'], name='core_recipe_user_id_c45a42_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetombstone',
+            index=models.Index(fields=['deleted_at'], name='core_recipe_deleted_ac4dbd_idx'),
+        ),
+    ]
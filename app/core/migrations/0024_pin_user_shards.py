@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations
+
+# Where the ring places users is the code's, not this migration's: it
+# pins users where their data already is.
+from core.sharding import hashed_shard
+
+BATCH_SIZE = 1000
+
+
+def pin_users(apps, schema_editor):
+    """Write every user the directory has no entry for to it"""
+    User = apps.get_model('core', 'User')
+    UserShard = apps.get_model('core', 'UserShard')
+    using = schema_editor.connection.alias
+    users = User.objects.using(using).filter(
+        usershard__isnull=True).order_by('pk')
+    last = 0
+    while True:
+        ids = list(users.filter(pk__gt=last).values_list(
+            'pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        UserShard.objects.using(using).bulk_create([
+            UserShard(user_id=user_id, alias=hashed_shard(
+                user_id, settings.DATABASE_SHARDS))
+            for user_id in ids
+        ])
+        last = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_userdeletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(pin_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS core_user_email_lower_like '
+            'ON core_user (lower(email) text_pattern_ops)'
+        )
+
+
+def drop_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS core_user_email_lower_like')
+
+
+class Migration(migrations.Migration):
+    """Index lower(email) for the prefix searches of the user admin"""
+
+    dependencies = [
+        ('core', '0024_pin_user_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_pattern_index,
+            drop_pattern_index,
+            hints={'model_name': 'user'},
+        ),
+    ]
@@ -5,6 +5,10 @@ Database Models for project
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from core.sharding import shard_for_user, shard_for_values
+from core.units import UNIT_CHOICES, normalize_unit
 
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -44,36 +48,337 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped to revoke every signed access token issued to the user.
+    token_generation = models.PositiveIntegerField(default=0)
+    # When the user last logged in or used a token, to within a day.
+    last_active = models.DateTimeField(default=timezone.now, db_index=True)
+    # Whether the user's recipes were moved to RecipeArchive.
+    archived = models.BooleanField(default=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
 
+class RefreshToken(models.Model):
+    """Long lived token exchanged for signed access tokens"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='refresh_tokens',
+    )
+    key_hash = models.CharField(max_length=64, unique=True)
+    generation = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Refresh token of {self.user_id}'
+
+
+class UserShard(models.Model):
+    """Directory entry pinning a user's recipe data to a shard"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    alias = models.CharField(max_length=64)
+    # Set while move_user_shard copies the user's data, refusing writes.
+    frozen = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user_id} on {self.alias}'
+
+
+class UserDeletion(models.Model):
+    """Progress of deleting a user, kept after the user row is gone"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Not a foreign key: the user row is deleted before the record is done.
+    user_id = models.BigIntegerField(primary_key=True)
+    using = models.CharField(max_length=64, default='default')
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    step = models.CharField(max_length=64, null=True, blank=True)
+    # Rows deleted so far by step name, summed over resumed runs.
+    deleted = models.JSONField(default=dict)
+    started = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'deletion of {self.user_id}: {self.status}'
+
+
+class ShardedQuerySet(models.QuerySet):
+    """Queryset of rows stored on their owner's shard"""
+
+    def for_user(self, user):
+        """Return the user's rows, read from the user's shard"""
+        return self.using(shard_for_user(user.pk)).filter(user=user)
+
+    def create(self, **kwargs):
+        """Create the row on the shard of its owner"""
+        if self._db is None:
+            alias = shard_for_values(kwargs)
+            if alias is not None:
+                return self.using(alias).create(**kwargs)
+        return super().create(**kwargs)
+
+
 class Recipe(models.Model):
     """Recipe models"""
+    # The user may be stored on another database than this row.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
-    title = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, db_index=True)
     description = models.TextField(blank=True)
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
+    image = models.ImageField(
+        null=True,
+        blank=True,
+        upload_to='uploads/recipe',
+    )
     tag = models.ManyToManyField('Tag')
-    
+    ingredients = models.ManyToManyField(
+        'Ingredient',
+        through='RecipeIngredient',
+        blank=True,
+    )
+    # Copy of the tags as [{'id', 'name'}] so lists and tag filters can
+    # skip the join table. Kept up to date by core.signals.
+    tag_cache = models.JSONField(default=list, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Unguessable name of the public page of a shared recipe.
+    share_slug = models.CharField(
+        max_length=32, unique=True, null=True, blank=True, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+        ]
 
     def __str__(self):
         return self.title
 
+
 class Tag(models.Model):
     """tag for filtering the recipes"""
     name = models.CharField(max_length=255)
+    # The user may be stored on another database than this row.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class Ingredient(models.Model):
+    """Ingredient used by recipes"""
+    name = models.CharField(max_length=255)
+    # The user may be stored on another database than this row.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
 
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    """Quantity of an ingredient needed by a recipe"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=3)
+    unit = models.CharField(max_length=16, choices=UNIT_CHOICES)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """Store the unit under its canonical name"""
+        self.unit = normalize_unit(self.unit)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.quantity} {self.unit} {self.ingredient}'
+
+
+class RecipeTombstone(models.Model):
+    """Record of a deleted recipe for clients syncing changes"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    recipe_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class ProfileReport(models.Model):
+    """Profile of one request, taken for a staff user"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    queries = models.JSONField(default=list)
+    stats = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+
+class AuditEvent(models.Model):
+    """
+    A change to a recipe, tag or user.
+
+    On Postgres the table is partitioned by month of ``created``.
+    """
+    ACTIONS = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    created = models.DateTimeField(default=timezone.now)
+    # Not foreign keys: events outlive the users and objects they name.
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    changes = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id']),
+            models.Index(fields=['created']),
+        ]
+
+    def __str__(self):
+        return f'{self.action} {self.model} {self.object_id}'
+
+
+class RecipeRevision(models.Model):
+    """
+    One version of a recipe's fields.
+
+    Keyframes hold every field. Other revisions hold only the fields that
+    changed since the one before, with the description as a text delta.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='+',
+    )
+    number = models.PositiveIntegerField()
+    # Names of the fields changed, kept for keyframes too.
+    changed = models.JSONField(default=list)
+    keyframe = models.BooleanField(default=False)
+    data = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'number'], name='unique_recipe_revision'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} revision {self.number}'
+
+
+class TagUsage(models.Model):
+    """Count-min sketch of how often tag names were used in a time bucket"""
+    bucket = models.DateTimeField(unique=True)
+    counts = models.BinaryField()
+    # The most used names of the bucket and their estimated uses.
+    top = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'tag usage from {self.bucket}'
+
+
+class TagUsers(models.Model):
+    """HyperLogLog of the users who used a tag name in a time bucket"""
+    bucket = models.DateTimeField()
+    name = models.CharField(max_length=255)
+    registers = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'name'], name='unique_tag_users'),
+        ]
+
+    def __str__(self):
+        return f'users of {self.name} from {self.bucket}'
+
+
+class RecipeArchive(models.Model):
+    """A batch of an inactive user's recipes, compressed"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='+',
+    )
+    recipe_count = models.PositiveIntegerField()
+    # zlib compressed JSON of the recipes, their links and revisions.
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.recipe_count} recipes of {self.user_id}'
@@ -0,0 +1,46 @@
+"""
+Paginator for admin changelists over large tables.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's row estimate for big unfiltered tables.
+
+    ``COUNT(*)`` on Postgres reads the whole table. When nothing filters the
+    queryset and ``pg_class.reltuples`` says the table is larger than
+    ``ADMIN_ESTIMATED_COUNT_THRESHOLD`` rows, that estimate is used instead.
+    """
+
+    @cached_property
+    def count(self):
+        """Return the total number of objects, estimated when large"""
+        estimate = self.estimate()
+        if estimate is not None and \
+                estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+
+        return super().count
+
+    def estimate(self):
+        """Return the planner's row estimate or None if unavailable"""
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        return row[0] if row else None
@@ -0,0 +1,124 @@
+"""
+On demand profiling of single requests.
+
+A staff user sends ``X-Profile: <token>``, where the token comes from
+``manage.py profile_token``. That request runs under cProfile with its SQL
+recorded, and the report is stored as a ``ProfileReport`` if the request
+authenticated the staff user the token was issued to; the token alone is
+not enough. Reports leave out the parameters of queries, which hold user
+data. Requests without the header go straight through.
+"""
+import cProfile
+import io
+import pstats
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+from core.models import ProfileReport, User
+
+SALT = 'core.profiling'
+
+
+def create_profile_token(user):
+    """Return the X-Profile header value for a staff user"""
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def profiling_user_id(token):
+    """Return the id of the user a profile token was issued to, or None"""
+    try:
+        return int(signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _profiled_user(request, user_id):
+    """Return the request's user if the token was issued to them"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or user.pk != user_id:
+        return None
+    # The flags may have changed since the request loaded the user.
+    return User.objects.filter(
+        pk=user_id, is_staff=True, is_active=True).first()
+
+
+class QueryRecorder:
+    """Execute wrapper recording each statement and its duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': None if many else params,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+def explain(query):
+    """Return the plan of a recorded SELECT, or None"""
+    if not query['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+    connection = connections[query['alias']]
+    prefix = connection.ops.explain_query_prefix()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {query["sql"]}', query['params'])
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+
+
+def profile_request(get_response, request, user_id):
+    """Run a request under the profiler, store the report if it was theirs"""
+    recorder = QueryRecorder()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration = (time.perf_counter() - start) * 1000
+
+    # Known only now that DRF has authenticated the request.
+    user = _profiled_user(request, user_id)
+    if user is None:
+        return response
+
+    for query in recorder.queries:
+        if query['duration_ms'] >= settings.PROFILE_EXPLAIN_THRESHOLD_MS:
+            query['explain'] = explain(query)
+        del query['params']
+
+    stats = io.StringIO()
+    pstats.Stats(profiler, stream=stats).sort_stats(
+        'cumulative').print_stats(settings.PROFILE_STATS_LINES)
+
+    report = ProfileReport.objects.create(
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[:255],
+        status_code=response.status_code,
+        duration_ms=duration,
+        queries=recorder.queries,
+        stats=stats.getvalue(),
+    )
+    response['X-Profile-Id'] = report.pk
+    return response
@@ -0,0 +1,52 @@
+"""
+Database router sending recipe data to the owner's shard.
+"""
+from core.sharding import SHARDED_MODELS, is_sharded, shard_for_user
+
+GLOBAL_DATABASE = 'default'
+
+
+class ShardRouter:
+    """
+    Route sharded models by the object in the hints, the rest to default.
+
+    Querysets carry no hints, so queries over sharded models pick their
+    database with ``.using()`` or the ``for_user()`` queryset method.
+    """
+
+    def _db_for(self, model, instance=None, **hints):
+        if not is_sharded(model):
+            # Such as the owner of a sharded row.
+            if instance is not None and is_sharded(type(instance)):
+                return GLOBAL_DATABASE
+            return None
+        if instance is None:
+            return None
+        if instance._meta.model_name == 'user':
+            return shard_for_user(instance.pk)
+        if instance._state.db:
+            return instance._state.db
+        user_id = getattr(instance, 'user_id', None)
+        return shard_for_user(user_id) if user_id is not None else None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows point at their owner on the global database.
+        if is_sharded(type(obj1)) != is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == GLOBAL_DATABASE:
+            return None
+        if app_label in ('auth', 'contenttypes') or \
+                (app_label, model_name) == ('core', 'user'):
+            # Early migrations created the recipe tables with foreign keys
+            # to users, so shards keep empty copies of the user tables.
+            return True
+        return app_label == 'core' and model_name in SHARDED_MODELS
@@ -0,0 +1,156 @@
+"""
+Sharding of recipe data by user.
+
+Users, tokens and everything else stay on the ``default`` database. The
+recipes, tags and ingredients of a user, and the rows linking them, live
+together on one of the ``DATABASE_SHARDS``. A new user is placed on a
+consistent hash ring of the shard aliases and pinned there by a row of
+the ``UserShard`` directory, written when the user is created; users
+from before the directory were pinned by a migration. The ring therefore
+only places new users: adding a shard moves nobody, and
+``move_user_shard`` changes a user's pin.
+
+The directory is kept in the database and cached in the shared cache, and
+changes to it are written to both. While a user is moved their entry is
+frozen, and saves and deletes of their rows raise ``ShardMoving``, as do
+writes to a shard the user is no longer on. Each shard numbers its rows in
+its own range of ids (see ``DATABASE_SHARD_NUMBERS``), so moved rows keep
+their ids.
+"""
+import bisect
+import hashlib
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+# Points each shard gets on the ring; more points even out the load.
+VIRTUAL_NODES = 64
+
+# Ids a shard may give out: shard n numbers rows from n * SHARD_ID_RANGE.
+SHARD_ID_RANGE = 2 ** 40
+
+SHARDED_MODELS = {
+    'recipe',
+    'recipe_tag',
+    'tag',
+    'ingredient',
+    'recipeingredient',
+    'recipetombstone',
+    'reciperevision',
+    'recipearchive',
+}
+
+
+class ShardMoving(Exception):
+    """The user's data is being moved to another shard"""
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'core' and \
+        model._meta.model_name in SHARDED_MODELS
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+@lru_cache(maxsize=8)
+def _ring(shards):
+    return sorted(
+        (_hash(f'{alias}:{i}'), alias)
+        for alias in shards for i in range(VIRTUAL_NODES)
+    )
+
+
+def hashed_shard(user_id, shards):
+    """Return the shard a user id falls on in the hash ring of shards"""
+    ring = _ring(tuple(shards))
+    i = bisect.bisect(ring, (_hash(str(user_id)), ''))
+    return ring[i % len(ring)][1]
+
+
+def directory_key(user_id):
+    return f'user_shard:v3:{user_id}'
+
+
+def pin_user_shard(user_id):
+    """Write a user's place on the ring to the directory, unless pinned"""
+    UserShard = apps.get_model('core', 'UserShard')
+    UserShard.objects.using('default').get_or_create(
+        user_id=user_id,
+        defaults={'alias': hashed_shard(user_id, settings.DATABASE_SHARDS)},
+    )
+
+
+def directory_entry(user_id):
+    """
+    Return (alias, frozen) of a user from the directory.
+
+    A user missing from it, which creating users and the migration
+    pinning the earlier ones should leave none of, is pinned now.
+    """
+    entry = cache.get(directory_key(user_id))
+    if entry is None:
+        UserShard = apps.get_model('core', 'UserShard')
+        entry = UserShard.objects.using('default').filter(
+            user_id=user_id).values_list('alias', 'frozen').first()
+        if entry is None:
+            pin_user_shard(user_id)
+            entry = UserShard.objects.using('default').filter(
+                user_id=user_id).values_list('alias', 'frozen').get()
+        # Not set: an entry written by set_user_shard since the read wins.
+        cache.add(directory_key(user_id), entry, None)
+    return entry
+
+
+def shard_for_user(user_id):
+    """Return the alias of the database holding a user's recipe data"""
+    shards = settings.DATABASE_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    return directory_entry(user_id)[0]
+
+
+def check_writable(user_id, using):
+    """Raise ShardMoving unless the user's rows may be written on using"""
+    if len(settings.DATABASE_SHARDS) == 1:
+        return
+    alias, frozen = directory_entry(user_id)
+    if frozen or alias != using:
+        raise ShardMoving()
+
+
+def set_user_shard(user_id, alias, frozen=False):
+    """Pin a user's data to a shard in the directory"""
+    UserShard = apps.get_model('core', 'UserShard')
+    UserShard.objects.using('default').update_or_create(
+        user_id=user_id, defaults={'alias': alias, 'frozen': frozen})
+    cache.set(directory_key(user_id), (alias, frozen), None)
+
+
+def owner_id(instance):
+    """Return the id of the user owning a sharded row"""
+    if hasattr(instance, 'user_id'):
+        return instance.user_id
+    return instance.recipe.user_id
+
+
+def shard_for_values(values):
+    """
+    Return the shard implied by model field values, or None.
+
+    Looks for the owner (``user`` or ``user_id``) or, for link rows, a
+    related object already stored on a shard.
+    """
+    user = values.get('user')
+    if user is not None:
+        return shard_for_user(user.pk)
+    if values.get('user_id') is not None:
+        return shard_for_user(values['user_id'])
+    for value in values.values():
+        state = getattr(value, '_state', None)
+        if state is not None and state.db and is_sharded(type(value)):
+            return state.db
+    return None
@@ -0,0 +1,165 @@
+"""
+Signal handlers keeping derived data up to date.
+"""
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.db import transaction
+from django.dispatch import receiver
+
+from core.audit import audit
+from core.coalescing import bump_data_version
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeRevision,
+    RecipeTombstone,
+    Tag,
+    User,
+)
+from core.sharding import check_writable, owner_id, pin_user_shard
+from core.tag_cache import refresh_tag_cache
+from core.tokens import refresh_generation
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Ingredient)
+@receiver(pre_save, sender=RecipeIngredient)
+@receiver(pre_save, sender=RecipeRevision)
+@receiver(pre_save, sender=RecipeTombstone)
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def refuse_moving_writes(sender, instance, using, raw=False, **kwargs):
+    """Refuse writes to a user's data while it is moved to another shard"""
+    if not raw:
+        check_writable(owner_id(instance), using)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def refuse_moving_links(sender, instance, action, using, **kwargs):
+    """Refuse tagging a user's recipes while they are moved"""
+    if action.startswith('pre_'):
+        check_writable(instance.user_id, using)
+
+
+@receiver(post_delete, sender=Recipe)
+def record_recipe_deleted(sender, instance, using, **kwargs):
+    """Leave a tombstone so syncing clients learn about the deletion"""
+    RecipeTombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        recipe_id=instance.id,
+    )
+
+
+def tagged_recipe_ids(tag, using):
+    return list(Recipe.tag.through.objects.using(using).filter(
+        tag_id=tag.pk).values_list('recipe_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, using,
+                        **kwargs):
+    """Refresh the tag list of recipes whose tags change"""
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        refresh_tag_cache([instance.pk], using)
+    elif reverse and action in ('post_add', 'post_remove'):
+        refresh_tag_cache(pk_set, using)
+    elif reverse and action == 'pre_clear':
+        # The links are gone after the clear, so find the recipes first.
+        instance._tagged_recipe_ids = tagged_recipe_ids(instance, using)
+    elif reverse and action == 'post_clear':
+        refresh_tag_cache(instance.__dict__.pop('_tagged_recipe_ids'), using)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, using, **kwargs):
+    """Refresh the tag list of recipes using a renamed tag"""
+    if not created:
+        refresh_tag_cache(tagged_recipe_ids(instance, using), using)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, using, **kwargs):
+    """Remember the recipes of a tag before its links are deleted"""
+    instance._tagged_recipe_ids = tagged_recipe_ids(instance, using)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using, **kwargs):
+    """Refresh the tag list of recipes that used a deleted tag"""
+    refresh_tag_cache(instance.__dict__.pop('_tagged_recipe_ids', []), using)
+
+
+@receiver(post_save, sender=User)
+def recache_token_generation(sender, instance, created, using, **kwargs):
+    """Check signed tokens of a changed user, e.g. deactivated, anew"""
+    if not created:
+        transaction.on_commit(
+            lambda: refresh_generation(instance.pk), using=using)
+
+
+def data_changed(user_id, using):
+    """Retire cached reads of a user's data, now and once committed"""
+    bump_data_version(user_id)
+    # A read between now and the commit may cache the old rows again.
+    transaction.on_commit(lambda: bump_data_version(user_id), using=using)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def recipe_data_saved(sender, instance, using, **kwargs):
+    """Retire cached reads of the owner's recipes and tags"""
+    data_changed(instance.user_id, using)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def recipe_links_changed(sender, instance, action, using, **kwargs):
+    """Retire cached reads of the owner's recipes when tags are linked"""
+    if action.startswith('post_'):
+        data_changed(instance.user_id, using)
+
+
+@receiver(post_save, sender=User)
+def pin_new_user(sender, instance, created, raw=False, **kwargs):
+    """Pin a new user's data to the shard the ring places them on"""
+    if created and not raw:
+        pin_user_shard(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def new_data_version(sender, instance, created, **kwargs):
+    """Start a new user's data on a version of its own"""
+    if created:
+        bump_data_version(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+def audit_saved(sender, instance, created, update_fields, **kwargs):
+    """Audit recipes and tags being created or changed"""
+    changes = sorted(update_fields) if update_fields else None
+    audit(instance, 'create' if created else 'update', changes)
+
+
+@receiver(post_save, sender=User)
+def audit_user_created(sender, instance, created, **kwargs):
+    """Audit new users; UserSerializer audits changes to them"""
+    if created:
+        audit(instance, 'create')
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=User)
+def audit_deleted(sender, instance, **kwargs):
+    """Audit recipes, tags and users being deleted"""
+    audit(instance, 'delete')
@@ -0,0 +1,35 @@
+"""
+Helpers for the denormalized tag list stored on each recipe.
+"""
+from django.utils import timezone
+
+from core.models import Recipe
+
+
+def build_tag_cache(recipe_ids, using='default'):
+    """Return {recipe id: [{'id', 'name'}]} read from the join table"""
+    caches = {recipe_id: [] for recipe_id in recipe_ids}
+    links = Recipe.tag.through.objects.using(using).filter(
+        recipe_id__in=caches,
+    ).order_by('recipe_id', 'tag_id').values_list(
+        'recipe_id', 'tag_id', 'tag__name',
+    )
+    for recipe_id, tag_id, name in links:
+        caches[recipe_id].append({'id': tag_id, 'name': name})
+
+    return caches
+
+
+def refresh_tag_cache(recipe_ids, using='default'):
+    """Rewrite the tag list of the given recipes and mark them modified"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    now = timezone.now()
+    recipes = [
+        Recipe(id=recipe_id, tag_cache=cache, updated_at=now)
+        for recipe_id, cache in build_tag_cache(recipe_ids, using).items()
+    ]
+    Recipe.objects.using(using).bulk_update(
+        recipes, ['tag_cache', 'updated_at'])
@@ -0,0 +1,107 @@
+"""
+Helpers for tests.
+"""
+import weakref
+from contextlib import contextmanager
+
+from core.memory import Measurement
+
+MB = 1024 * 1024
+
+# Every CachingProxy alive, for purge_proxies.
+PROXIES = weakref.WeakSet()
+
+
+class MemoryBudgetMixin:
+    """TestCase mixin asserting how much memory code may allocate"""
+
+    @contextmanager
+    def assertMemoryBudget(self, megabytes, sites=0):
+        """
+        Fail if the Python allocations inside peak above megabytes.
+
+        Tracing is several times slower with sites, the number of top
+        allocation sites listed on failure, so they are off by default.
+        """
+        with Measurement(top=sites, frames=1) as measurement:
+            yield measurement
+
+        if measurement.peak > megabytes * MB:
+            top = ''.join(
+                f'\n{site["size"] / MB:.2f} MB at {site["traceback"][-1]}'
+                for site in measurement.sites)
+            self.fail(
+                f'Allocated up to {measurement.peak / MB:.2f} MB, over the '
+                f'budget of {megabytes} MB.{top}')
+
+
+def cache_lifetime(response):
+    """Return the seconds a shared cache may keep a response"""
+    directives = {}
+    for directive in response.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value
+    if 'public' not in directives or \
+            'private' in directives or 'no-store' in directives:
+        return 0
+    return int(directives.get('s-maxage') or directives.get('max-age') or 0)
+
+
+class CachingProxy:
+    """
+    Stand-in for the CDN in front of a test client.
+
+    GET responses are cached for their s-maxage, or max-age, if public,
+    stale ones revalidated with their ETag, and ones tagged with purged
+    surrogate keys dropped. ``origin_requests`` counts the requests that
+    reached the site; ``advance`` moves the proxy's clock.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.entries = {}
+        self.now = 0
+        self.origin_requests = 0
+        PROXIES.add(self)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def get(self, path):
+        entry = self.entries.get(path)
+        if entry is not None and entry['expires'] > self.now:
+            return entry['response']
+
+        headers = {}
+        if entry is not None and entry['response'].has_header('ETag'):
+            headers['HTTP_IF_NONE_MATCH'] = entry['response']['ETag']
+        self.origin_requests += 1
+        response = self.client.get(path, **headers)
+        if response.status_code == 304 and entry is not None:
+            entry['expires'] = self.now + cache_lifetime(response)
+            return entry['response']
+
+        lifetime = cache_lifetime(response)
+        if lifetime:
+            self.entries[path] = {
+                'response': response,
+                'expires': self.now + lifetime,
+                'keys': set(response.get('Surrogate-Key', '').split()),
+            }
+        else:
+            self.entries.pop(path, None)
+        return response
+
+    def purge(self, keys):
+        """Drop the cached responses tagged with any of keys"""
+        keys = set(keys)
+        self.entries = {
+            path: entry for path, entry in self.entries.items()
+            if not entry['keys'] & keys
+        }
+
+
+def purge_proxies(keys):
+    """CDN_PURGER purging every CachingProxy"""
+    for proxy in list(PROXIES):
+        proxy.purge(keys)
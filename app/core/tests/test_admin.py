@@ -1,12 +1,17 @@
 """
 Tests for the Django Admin modifications
 """
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from core.models import Recipe
+from core.paginator import EstimatedCountPaginator
+from core.sharding import set_user_shard
+
 
 class AdminSiteTests(TestCase):
     """Test for the Django Admin """
@@ -47,3 +52,119 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_user_search(self):
+        """Test searching users by email prefix"""
+        url = reverse('admin:core_user_changelist')
+        res = self.client.get(url, {'q': 'USER@'})
+
+        self.assertEqual(list(res.context['cl'].result_list), [self.user])
+
+    def test_recipe_list(self):
+        """Test the recipe list page shows recipes"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1)
+        url = reverse('admin:core_recipe_changelist')
+
+        res = self.client.get(url)
+
+        self.assertContains(res, recipe.title)
+        self.assertContains(res, self.user.email)
+
+    def test_recipe_search(self):
+        """Test searching recipes by id, owner and title prefix"""
+        soup = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1)
+        Recipe.objects.create(
+            user=self.admin_user, title='Pie', time_minutes=5, price=1)
+        url = reverse('admin:core_recipe_changelist')
+
+        for term in (str(soup.id), self.user.email.upper(), 'Sou'):
+            res = self.client.get(url, {'q': term})
+            self.assertEqual(list(res.context['cl'].result_list), [soup])
+
+    def test_edit_recipe_page(self):
+        """Test the edit recipe page works properly"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1)
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_a'])
+class AdminShardTests(TestCase):
+    """Test the recipe admin pages over shards"""
+    databases = {'default', 'shard_a'}
+
+    def setUp(self):
+        self.client = Client()
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        self.client.force_login(admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        set_user_shard(self.user.pk, 'shard_a')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1)
+
+    def test_recipe_list_by_shard(self):
+        """Test the list shows the chosen shard's recipes"""
+        url = reverse('admin:core_recipe_changelist')
+
+        res = self.client.get(url)
+        self.assertEqual(list(res.context['cl'].result_list), [])
+
+        res = self.client.get(url, {'shard': 'shard_a'})
+        self.assertEqual(list(res.context['cl'].result_list), [self.recipe])
+        self.assertContains(res, self.user.email)
+
+        res = self.client.get(url, {'shard': 'shard_a', 'q': self.user.email})
+        self.assertEqual(list(res.context['cl'].result_list), [self.recipe])
+
+    def test_edit_recipe_page(self):
+        """Test a recipe on another shard can be opened"""
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context['original'], self.recipe)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Test the paginator used by admin changelists"""
+
+    def test_exact_count_without_estimate(self):
+        """Test the exact count is used when there is no estimate"""
+        queryset = get_user_model().objects.all()
+        get_user_model().objects.create_user('a@example.com', 'pass123')
+
+        paginator = EstimatedCountPaginator(queryset, 10)
+
+        self.assertIsNone(paginator.estimate())
+        self.assertEqual(paginator.count, 1)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_estimate_used_above_threshold(self):
+        """Test a large estimate replaces the exact count"""
+        queryset = get_user_model().objects.all()
+        with patch.object(EstimatedCountPaginator, 'estimate',
+                          return_value=5000):
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 5000)
+
+        with patch.object(EstimatedCountPaginator, 'estimate',
+                          return_value=10):
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 0)
+
+    def test_filtered_queryset_not_estimated(self):
+        """Test filtered querysets are always counted exactly"""
+        queryset = get_user_model().objects.filter(is_staff=True)
+
+        self.assertIsNone(EstimatedCountPaginator(queryset, 10).estimate())
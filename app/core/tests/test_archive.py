@@ -0,0 +1,177 @@
+"""
+Tests for archiving the recipes of inactive users
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import archive
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeArchive,
+    RecipeIngredient,
+    RecipeRevision,
+    Tag,
+)
+from core import tokens
+from core.tokens import create_access_token
+
+ACCESS_URL = reverse('user:token-access')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com', days_inactive=400):
+    user = get_user_model().objects.create_user(email, 'testpass123')
+    user.last_active = timezone.now() - timedelta(days=days_inactive)
+    user.save()
+    return user
+
+
+def create_recipe(user, title='Sample'):
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=5, price=Decimal('5.50'),
+        description='Boil it.')
+
+
+def snapshot(user):
+    """Return the user's recipe data as comparable values"""
+    recipes = Recipe.objects.filter(user=user).order_by('id')
+    return {
+        'recipes': list(recipes.values()),
+        'tags': list(Recipe.tag.through.objects.filter(
+            recipe__user=user).order_by('id').values()),
+        'ingredients': list(RecipeIngredient.objects.filter(
+            recipe__user=user).order_by('id').values()),
+        'revisions': list(RecipeRevision.objects.filter(
+            user=user).order_by('id').values()),
+    }
+
+
+class ArchiveTests(TestCase):
+    """Test moving recipes to the archive and back"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        for i in range(3):
+            recipe = create_recipe(self.user, f'Recipe {i}')
+            recipe.tag.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient,
+                quantity=Decimal('1.5'), unit='g')
+            RecipeRevision.objects.create(
+                recipe=recipe, user=self.user, number=1, keyframe=True,
+                data={'title': recipe.title})
+
+    def test_archive_user(self):
+        moved = archive.archive_user(self.user, batch_size=2)
+
+        self.assertEqual(moved, 3)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+        self.assertFalse(RecipeRevision.objects.exists())
+        self.assertFalse(Recipe.tag.through.objects.exists())
+        self.assertEqual(RecipeArchive.objects.count(), 2)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.archived)
+
+    def test_restore_user(self):
+        before = snapshot(self.user)
+        archive.archive_user(self.user, batch_size=2)
+
+        restored = archive.restore_user(self.user.pk)
+
+        self.assertEqual(restored, 3)
+        self.assertEqual(snapshot(self.user), before)
+        self.assertFalse(RecipeArchive.objects.exists())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.archived)
+
+    def test_user_without_recipes_not_archived(self):
+        other = create_user('other@example.com')
+
+        self.assertEqual(archive.archive_user(other), 0)
+        other.refresh_from_db()
+        self.assertFalse(other.archived)
+
+    def test_archival_stops_when_user_returns(self):
+        archive_batch = archive.archive_batch
+
+        def restore_after_batch(*args):
+            moved = archive_batch(*args)
+            archive.restore_user(self.user.pk)
+            return moved
+
+        with patch('core.archive.archive_batch', restore_after_batch):
+            archive.archive_user(self.user, batch_size=1)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(RecipeArchive.objects.exists())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.archived)
+
+    def test_command_archives_inactive_users(self):
+        active = create_user('active@example.com', days_inactive=10)
+        create_recipe(active)
+        out = StringIO()
+
+        call_command('archive_inactive', '--days', '365', stdout=out)
+
+        self.assertIn('Archived 3 recipes of 1 users', out.getvalue())
+        self.assertEqual(Recipe.objects.filter(user=active).count(), 1)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_login_restores(self):
+        archive.archive_user(self.user)
+
+        res = APIClient().post(ACCESS_URL, {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.user.refresh_from_db()
+        self.assertGreater(
+            self.user.last_active, timezone.now() - timedelta(minutes=1))
+
+    def test_access_token_request_restores(self):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {create_access_token(self.user)}')
+        client.get(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_user(self.user)
+        # A request that read the user before the archival fills in
+        # the cache too late.
+        cache.add(tokens.generation_key(self.user.pk),
+                  (self.user.token_generation, False))
+
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 3)
+
+    def test_auth_token_request_restores(self):
+        token = Token.objects.create(user=self.user)
+        archive.archive_user(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
@@ -0,0 +1,128 @@
+"""
+Tests for the audit log
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.audit import audit_log
+from core.management.commands.audit_partitions import (
+    add_months,
+    partition_name,
+)
+from core.models import AuditEvent, Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+ME_URL = reverse('user:me')
+
+
+def recipe_payload():
+    return {'title': 'Sample', 'time_minutes': 5, 'price': Decimal('5.50')}
+
+
+class AuditLogTests(TestCase):
+    """Test recording changes in the audit log"""
+
+    def setUp(self):
+        audit_log.flush()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123', name='Test')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_create_audited(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPES_URL, recipe_payload())
+        audit_log.flush()
+
+        event = AuditEvent.objects.get(model='core.recipe')
+        self.assertEqual(event.action, 'create')
+        self.assertEqual(event.object_id, str(res.data['id']))
+        self.assertEqual(event.actor_id, self.user.id)
+
+    def test_recipe_delete_audited(self):
+        recipe = Recipe.objects.create(user=self.user, **recipe_payload())
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        audit_log.flush()
+
+        event = AuditEvent.objects.get(model='core.recipe')
+        self.assertEqual(event.action, 'delete')
+        self.assertEqual(event.actor_id, self.user.id)
+
+    def test_user_update_audits_field_names(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(ME_URL, {'name': 'New', 'password': 'newpass1'})
+        audit_log.flush()
+
+        event = AuditEvent.objects.get(model='core.user')
+        self.assertEqual(event.action, 'update')
+        self.assertEqual(event.changes, ['name', 'password'])
+
+    def test_rolled_back_change_not_audited(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            Recipe.objects.create(user=self.user, **recipe_payload())
+        audit_log.flush()
+
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_events_buffered(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(user=self.user, **recipe_payload())
+
+        self.assertFalse(AuditEvent.objects.exists())
+        audit_log.flush()
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+    @override_settings(AUDIT_BATCH_SIZE=2)
+    def test_full_batch_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(user=self.user, **recipe_payload())
+            Recipe.objects.create(user=self.user, **recipe_payload())
+
+        with self.assertNumQueries(0):
+            audit_log.flush()
+        self.assertEqual(AuditEvent.objects.count(), 2)
+
+
+class AuditPartitionsTests(TestCase):
+    """Test the audit_partitions command without Postgres"""
+
+    def test_old_events_deleted(self):
+        now = timezone.now()
+        AuditEvent.objects.create(
+            created=now - timedelta(days=400), model='core.recipe',
+            object_id='1', action='create')
+        recent = AuditEvent.objects.create(
+            created=now, model='core.recipe', object_id='2', action='create')
+
+        call_command('audit_partitions', '--retain', '12', stdout=StringIO())
+
+        self.assertEqual(list(AuditEvent.objects.all()), [recent])
+
+    @skipUnless(connection.vendor == 'postgresql', 'partitions')
+    def test_partition_takes_rows_from_default(self):
+        month = add_months(timezone.now(), 5)
+        event = AuditEvent.objects.create(
+            created=month, model='core.recipe', object_id='1',
+            action='create')
+
+        call_command('audit_partitions', '--months-ahead', '5',
+                     stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM core_auditevent '
+                'WHERE id = %s', [event.id])
+            self.assertEqual(cursor.fetchone()[0], partition_name(month))
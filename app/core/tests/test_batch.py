@@ -0,0 +1,180 @@
+"""
+Tests for the batch API
+"""
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from user.views import ManageUsersView
+
+BATCH_URL = reverse('batch')
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+SYNC_URL = reverse('recipe:sync')
+
+
+class PublicBatchApiTests(TestCase):
+    """Test unauthenticated batch requests"""
+
+    def test_auth_required(self):
+        res = APIClient().post(BATCH_URL, {
+            'requests': [{'method': 'GET', 'path': ME_URL}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(TestCase):
+    """Test batch requests of an authenticated user"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123', name='Test')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *calls):
+        return self.client.post(
+            BATCH_URL, {'requests': list(calls)}, format='json')
+
+    def test_startup_calls(self):
+        """Test several reads come back in one response"""
+        Recipe.objects.create(user=self.user, title='Soup', time_minutes=5,
+                              price=Decimal('1.00'))
+
+        res = self.batch(
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': RECIPES_URL},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, recipes = res.data['responses']
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], 'user@example.com')
+        self.assertEqual([r['title'] for r in recipes['body']], ['Soup'])
+
+    def test_calls_run_in_order(self):
+        res = self.batch(
+            {'method': 'POST', 'path': RECIPES_URL, 'body': {
+                'title': 'Soup', 'time_minutes': 5, 'price': '1.00'}},
+            {'method': 'GET', 'path': RECIPES_URL + '?tags=1'},
+            {'method': 'GET', 'path': RECIPES_URL},
+        )
+
+        created, filtered, listed = res.data['responses']
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(filtered['body'], [])
+        self.assertEqual(listed['body'][0]['id'], created['body']['id'])
+
+    def test_unknown_path(self):
+        res = self.batch({'method': 'GET', 'path': '/api/nothing/'})
+
+        self.assertEqual(res.data['responses'][0]['status'], 404)
+
+    def test_non_api_path_rejected(self):
+        res = self.batch({'method': 'GET', 'path': '/admin/'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BATCH_MAX_REQUESTS=1)
+    def test_size_limit(self):
+        res = self.batch(
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': ME_URL},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BATCH_TIMEOUT=0)
+    def test_timeout(self):
+        res = self.batch({'method': 'GET', 'path': ME_URL})
+
+        self.assertEqual(res.data['responses'][0]['status'], 504)
+
+    @override_settings(BATCH_WORKERS=2)
+    def test_concurrent_gets(self):
+        res = self.batch(
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': ME_URL},
+        )
+
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [200, 200])
+
+    def test_non_drf_view_rejected(self):
+        res = self.batch({
+            'method': 'GET',
+            'path': reverse('recipe:thumbnail', args=['0' * 64 + '.jpg', 64]),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['responses'][0]['status'], 400)
+
+    def test_streaming_response_rejected(self):
+        with patch('user.views.ManageUsersView.retrieve',
+                   return_value=StreamingHttpResponse(iter([b'{}']))):
+            res = self.batch({'method': 'GET', 'path': ME_URL})
+
+        self.assertEqual(res.data['responses'][0]['status'], 400)
+
+    def test_charged_once_per_call(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        rates = {'read': '3/min', 'write': '1/min', 'bulk': '30/min'}
+        with patch.dict(api_settings.DEFAULT_THROTTLE_RATES, rates):
+            res = self.batch(*[{'method': 'GET', 'path': ME_URL}] * 3)
+            self.assertEqual(
+                [r['status'] for r in res.data['responses']], [200] * 3)
+
+            res = self.batch({'method': 'GET', 'path': ME_URL})
+            self.assertEqual(
+                res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            res = self.batch(*[{'method': 'PATCH', 'path': ME_URL,
+                                'body': {'name': 'New'}}] * 2)
+            self.assertEqual(
+                res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Test')
+
+    def test_bulk_calls_use_bulk_bucket(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        rates = {'read': '600/min', 'write': '120/min', 'bulk': '3/min'}
+        with patch.dict(api_settings.DEFAULT_THROTTLE_RATES, rates):
+            res = self.batch(*[{'method': 'GET', 'path': SYNC_URL}] * 3)
+
+        # The batch itself took the first bulk token.
+        self.assertEqual(
+            [r['status'] for r in res.data['responses']], [200, 200, 429])
+
+    @override_settings(BATCH_WORKERS=2, BATCH_TIMEOUT=0.2)
+    def test_running_calls_waited_for(self):
+        started = threading.Event()
+        finished = []
+        retrieve = ManageUsersView.retrieve
+
+        def slow_retrieve(view, request, *args, **kwargs):
+            started.set()
+            time.sleep(0.4)
+            finished.append(True)
+            return retrieve(view, request, *args, **kwargs)
+
+        with patch('user.views.ManageUsersView.retrieve', slow_retrieve):
+            res = self.batch(*[{'method': 'GET', 'path': ME_URL}] * 3)
+
+        statuses = [r['status'] for r in res.data['responses']]
+        self.assertEqual(len(finished), 2)
+        self.assertEqual(statuses[2], 504)
+        self.assertNotIn(504, statuses[:2])
@@ -0,0 +1,184 @@
+"""
+Tests for coalesced reads
+"""
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.coalescing import coalesce
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SCHEMA_URL = reverse('api-schema')
+
+
+class CoalesceTests(SimpleTestCase):
+    """Test computing a value once"""
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='new')
+
+    def test_fresh_value_reused(self):
+        self.assertEqual(coalesce('key', self.compute), 'new')
+        self.assertEqual(coalesce('key', self.compute), 'new')
+
+        self.compute.assert_called_once()
+
+    def test_stale_value_served_while_locked(self):
+        cache.set('key', ('old', time.time() - 1))
+        cache.add('key:lock', 1)
+
+        self.assertEqual(coalesce('key', self.compute), 'old')
+        self.compute.assert_not_called()
+
+    def test_stale_value_recomputed(self):
+        cache.set('key', ('old', time.time() - 1))
+
+        self.assertEqual(coalesce('key', self.compute), 'new')
+        self.assertFalse(cache.get('key:lock'))
+
+    @override_settings(COALESCE_POLL_INTERVAL=0.01)
+    def test_waits_for_lock_holder(self):
+        cache.add('key:lock', 1)
+
+        def finish():
+            time.sleep(0.05)
+            cache.set('key', ('computed', time.time() + 5))
+            cache.delete('key:lock')
+
+        holder = threading.Thread(target=finish)
+        holder.start()
+        value = coalesce('key', self.compute)
+        holder.join()
+
+        self.assertEqual(value, 'computed')
+        self.compute.assert_not_called()
+
+    @override_settings(COALESCE_LEASE=0)
+    def test_computes_after_lease(self):
+        cache.add('key:lock', 1)
+
+        self.assertEqual(coalesce('key', self.compute), 'new')
+
+    @override_settings(COALESCE_MAX_SIZE=100)
+    def test_oversized_value_not_cached(self):
+        self.compute.return_value = 'x' * 1000
+
+        self.assertEqual(coalesce('key', self.compute), 'x' * 1000)
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.get('key:lock'))
+        self.assertEqual(coalesce('key', self.compute), 'x' * 1000)
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_lock_released_on_error(self):
+        self.compute.side_effect = ValueError
+
+        with self.assertRaises(ValueError):
+            coalesce('key', self.compute)
+        self.assertFalse(cache.get('key:lock'))
+
+
+class CoalescedApiTests(TestCase):
+    """Test the coalesced API reads"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, **params):
+        return Recipe.objects.create(
+            user=self.user,
+            title=params.get('title', 'Sample recipe'),
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+
+    def test_recipe_list_reused(self):
+        self.create_recipe()
+        self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    @override_settings(COALESCE_USER_READS=False)
+    def test_recipe_list_not_coalesced_with_local_cache(self):
+        self.create_recipe()
+        self.client.get(RECIPES_URL)
+        # Another process changed the data, bumping its own cache only.
+        Recipe.objects.filter(user=self.user).update(title='Changed')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data[0]['title'], 'Changed')
+
+    def test_recipe_list_by_query(self):
+        recipe = self.create_recipe()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+        self.create_recipe(title='Untagged')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'tags': str(tag.id)})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_recipe_list_after_change(self):
+        self.client.get(RECIPES_URL)
+
+        self.client.post(RECIPES_URL, {
+            'title': 'New recipe',
+            'time_minutes': 5,
+            'price': Decimal('2.50'),
+        })
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_recipe_list_after_tag_rename(self):
+        recipe = self.create_recipe()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+        self.client.get(RECIPES_URL)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Vegetarian')
+
+    def test_recipe_list_per_user(self):
+        self.create_recipe()
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data, [])
+
+    def test_schema_reused(self):
+        res = self.client.get(SCHEMA_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with mock.patch(
+                'drf_spectacular.generators.SchemaGenerator.get_schema',
+        ) as get_schema:
+            res = self.client.get(SCHEMA_URL)
+
+        get_schema.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -1,12 +1,20 @@
 
+from datetime import timedelta
+from io import StringIO
 from re import S  # noqa
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, RefreshToken, Tag
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -30,3 +38,81 @@ class CommandTests(SimpleTestCase):
         call_command("wait_for_db")
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BackfillTagCacheTests(TestCase):
+    """Test the backfill_tag_cache command"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=1)
+        self.tag = Tag.objects.create(user=user, name='Vegan')
+        self.recipe.tag.add(self.tag)
+        Recipe.objects.update(tag_cache=[])
+
+    def test_verify_reports_outdated(self):
+        """Test verifying fails without changing anything"""
+        with self.assertRaises(CommandError):
+            call_command('backfill_tag_cache', verify=True, stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_cache, [])
+
+    def test_backfill(self):
+        """Test backfilling rewrites outdated tag lists"""
+        call_command('backfill_tag_cache', batch_size=1, stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_cache,
+                         [{'id': self.tag.id, 'name': 'Vegan'}])
+        call_command('backfill_tag_cache', verify=True, stdout=StringIO())
+
+
+class PurgeTokensTests(TestCase):
+    """Test the purge_tokens command"""
+
+    def test_purge_expired_tokens(self):
+        """Test only expired tokens are deleted"""
+        users = [
+            get_user_model().objects.create_user(
+                f'user{i}@example.com', 'testpass123')
+            for i in range(3)
+        ]
+        old = timezone.now() - timedelta(days=365)
+        for user in users[:2]:
+            Token.objects.create(user=user)
+        Token.objects.filter(user__in=users[:2]).update(created=old)
+        fresh = Token.objects.create(user=users[2])
+        RefreshToken.objects.create(
+            user=users[0], key_hash='a' * 64, generation=0, expires_at=old)
+        RefreshToken.objects.create(
+            user=users[0], key_hash='b' * 64, generation=0,
+            expires_at=timezone.now() + timedelta(days=1))
+
+        call_command('purge_tokens', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(Token.objects.all()), [fresh])
+        self.assertEqual(
+            list(RefreshToken.objects.values_list('key_hash', flat=True)),
+            ['b' * 64])
+
+    def test_renewed_token_kept(self):
+        """Test a token renewed while its batch is deleted is kept"""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        token = Token.objects.create(user=user)
+        Token.objects.filter(pk=token.pk).update(
+            created=timezone.now() - timedelta(days=365))
+
+        def renew_after_select(rows):
+            pks = list(rows)
+            Token.objects.filter(pk=token.pk).update(created=timezone.now())
+            return pks
+
+        with patch('core.management.commands.purge_tokens.list',
+                   renew_after_select, create=True):
+            call_command('purge_tokens', stdout=StringIO())
+
+        self.assertTrue(Token.objects.filter(pk=token.pk).exists())
@@ -0,0 +1,123 @@
+"""
+Tests for request deadlines
+"""
+from unittest import skipUnless
+from unittest.mock import MagicMock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.deadlines import Deadline, DeadlineExceeded
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SLOW_SQLITE_QUERY = (
+    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n '
+    'WHERE i < 100000000) SELECT count(*) FROM n'
+)
+
+
+class DeadlineTests(TestCase):
+    """Test queries are bounded by the deadline"""
+
+    def test_no_budget(self):
+        deadline = Deadline()
+        deadline.start(None)
+
+        with connection.execute_wrapper(deadline):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+    def test_query_after_deadline(self):
+        deadline = Deadline()
+        deadline.start(0)
+
+        with connection.execute_wrapper(deadline):
+            with self.assertRaises(DeadlineExceeded):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+
+    def fake_postgresql(self):
+        """Return a deadline and a query on a stand-in Postgres connection"""
+        fake = MagicMock(vendor='postgresql', alias='default',
+                         in_atomic_block=True, run_on_commit=[])
+        fake.on_commit.side_effect = \
+            lambda func: fake.run_on_commit.append((set(), func))
+        context = {'connection': fake, 'cursor': MagicMock()}
+        deadline = Deadline()
+        deadline.start(10)
+
+        def query():
+            deadline(MagicMock(), 'SELECT 1', None, False, context)
+            return context['cursor'].cursor.execute.call_count
+
+        return fake, query
+
+    @override_settings(REQUEST_DEADLINE_SLACK_MS=60000)
+    def test_timeout_set_again_after_rollback(self):
+        fake, query = self.fake_postgresql()
+
+        self.assertEqual(query(), 1)
+        self.assertEqual(query(), 1)
+        # Rolling back drops the transaction's on_commit callbacks.
+        fake.run_on_commit.clear()
+
+        self.assertEqual(query(), 2)
+
+    @override_settings(REQUEST_DEADLINE_SLACK_MS=60000)
+    def test_timeout_kept_after_commit(self):
+        fake, query = self.fake_postgresql()
+        query()
+
+        for _, func in fake.run_on_commit:
+            func()
+        fake.run_on_commit.clear()
+        fake.in_atomic_block = False
+
+        self.assertEqual(query(), 1)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite fallback')
+    def test_slow_query_interrupted_sqlite(self):
+        deadline = Deadline()
+        deadline.start(0.05)
+
+        with connection.execute_wrapper(deadline):
+            with self.assertRaises(DeadlineExceeded):
+                with connection.cursor() as cursor:
+                    cursor.execute(SLOW_SQLITE_QUERY)
+
+    @skipUnless(connection.vendor == 'postgresql', 'statement_timeout')
+    def test_slow_query_cancelled_postgresql(self):
+        deadline = Deadline()
+        deadline.start(0.1)
+
+        with connection.execute_wrapper(deadline):
+            with self.assertRaises(DeadlineExceeded):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(2)')
+
+
+class DeadlineMiddlewareTests(TestCase):
+    """Test requests running out of time get a 503"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(REQUEST_DEADLINES={'recipe:recipe-list': 0})
+    def test_expired_deadline(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '5')
+
+    @override_settings(REQUEST_DEADLINES={'recipe:recipe-list': None})
+    def test_unlimited_view(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,158 @@
+"""
+Tests for deleting users and their data
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core import deletion
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTombstone,
+    Tag,
+    UserDeletion,
+)
+
+
+def create_user(email):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+def create_recipe_data(user, count=3):
+    """Create recipes with tags and ingredients for a user"""
+    tag = Tag.objects.create(user=user, name='Vegan')
+    ingredient = Ingredient.objects.create(user=user, name='Salt')
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user, title=f'Recipe {i}', time_minutes=5,
+            price=Decimal('1.00'))
+        recipe.tag.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, quantity=1, unit='g')
+
+
+class DeleteUserTests(TestCase):
+    """Test the batched user deletion"""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.other = create_user('other@example.com')
+        create_recipe_data(self.user)
+        create_recipe_data(self.other)
+        Token.objects.create(user=self.user)
+
+    def test_delete_user_data(self):
+        """Test only the user's rows are deleted"""
+        progress = deletion.delete_user(self.user.pk, batch_size=2)
+
+        self.assertEqual(progress['status'], 'done')
+        self.assertEqual(progress['deleted']['recipes'], 3)
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertEqual(Recipe.tag.through.objects.count(), 3)
+        self.assertEqual(RecipeIngredient.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertFalse(Token.objects.exists())
+
+    def test_no_tombstones(self):
+        """Test recipes are removed without per recipe signals"""
+        deletion.delete_user(self.user.pk)
+
+        self.assertFalse(RecipeTombstone.objects.exists())
+
+    def test_signal_sent_once(self):
+        with patch.object(deletion.user_data_deleted, 'send') as send:
+            deletion.delete_user(self.user.pk)
+
+        send.assert_called_once_with(
+            sender=get_user_model(), user_id=self.user.pk, using='default')
+
+    @override_settings(USER_DELETION_IN_BACKGROUND=False)
+    def test_start_user_deletion(self):
+        deletion.start_user_deletion(self.user)
+
+        self.assertEqual(
+            deletion.deletion_progress(self.user.pk)['status'], 'done')
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_delete_user_command(self):
+        out = StringIO()
+
+        call_command('delete_user', 'user@example.com', stdout=out)
+
+        self.assertIn('recipes: 3', out.getvalue())
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+
+    def interrupted_deletion(self):
+        """Delete the user's data until the tags step fails"""
+        delete_in_batches = deletion._delete_in_batches
+
+        def failing(queryset, using, batch_size):
+            if queryset.model is Tag:
+                raise RuntimeError('Connection lost')
+            return delete_in_batches(queryset, using, batch_size)
+
+        with patch('core.deletion._delete_in_batches', side_effect=failing):
+            with self.assertRaises(RuntimeError):
+                deletion.delete_user(self.user.pk, batch_size=2)
+
+    def test_progress_persisted(self):
+        self.interrupted_deletion()
+
+        progress = deletion.deletion_progress(self.user.pk)
+        self.assertEqual(progress['status'], 'running')
+        self.assertEqual(progress['step'], 'tags')
+        self.assertEqual(progress['deleted']['recipes'], 3)
+        self.assertTrue(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+
+    @override_settings(USER_DELETION_STALE_AFTER=0)
+    def test_resume_interrupted_deletion(self):
+        self.interrupted_deletion()
+
+        resumed = deletion.resume_user_deletions()
+
+        self.assertEqual(resumed, [self.user.pk])
+        progress = deletion.deletion_progress(self.user.pk)
+        self.assertEqual(progress['status'], 'done')
+        self.assertEqual(progress['deleted']['recipes'], 3)
+        self.assertEqual(progress['deleted']['tags'], 1)
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_running_deletion_not_resumed(self):
+        self.interrupted_deletion()
+
+        self.assertEqual(deletion.resume_user_deletions(), [])
+        self.assertTrue(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+
+    def test_failed_deletion_resumed_by_command(self):
+        self.interrupted_deletion()
+        UserDeletion.objects.filter(user_id=self.user.pk).update(
+            status=UserDeletion.FAILED)
+        out = StringIO()
+
+        call_command('resume_user_deletions', stdout=out)
+
+        self.assertIn(f'Deleted user {self.user.pk}', out.getvalue())
+        self.assertEqual(
+            deletion.deletion_progress(self.user.pk)['status'], 'done')
+
+    @override_settings(USER_DELETION_TTL=0)
+    def test_done_records_dropped(self):
+        deletion.delete_user(self.user.pk)
+
+        deletion.resume_user_deletions()
+
+        self.assertIsNone(deletion.deletion_progress(self.user.pk))
@@ -0,0 +1,89 @@
+"""
+Tests for the liveness and readiness probes
+"""
+import time
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import health
+
+LIVENESS_URL = '/healthz'
+READINESS_URL = '/readyz'
+
+
+@patch('core.middleware.health_checker', new_callable=health.HealthChecker)
+class HealthCheckTests(TestCase):
+    """Test the probes"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_liveness_without_queries(self, checker):
+        with self.assertNumQueries(0):
+            res = self.client.get(LIVENESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_ready(self, checker):
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        report = res.json()
+        self.assertEqual(report['status'], 'ok')
+        self.assertTrue(report['checks']['database:default']['ok'])
+        self.assertIn('latency_ms', report['checks']['database:default'])
+        self.assertTrue(report['checks']['cache']['ok'])
+        self.assertEqual(report['checks']['migrations']['pending'], 0)
+
+    def test_probe_reads_last_report(self, checker):
+        self.client.get(READINESS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @patch('core.health.check_database', side_effect=OperationalError)
+    def test_database_down(self, patched_check, checker):
+        with self.assertLogs('core.health', 'WARNING'):
+            res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()['checks']['database:default'], {
+            'ok': False, 'error': 'OperationalError'})
+
+    @override_settings(HEALTH_CHECK_MAX_AGE=0)
+    def test_old_report_fails(self, checker):
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()['status'], 'unavailable')
+
+    @override_settings(HEALTH_CHECK_IN_BACKGROUND=True)
+    def test_background_checks(self, checker):
+        with patch.object(checker, 'refresh') as patched_refresh:
+            res = self.client.get(READINESS_URL)
+            self.assertEqual(
+                res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(res.json()['status'], 'starting')
+
+            give_up = time.monotonic() + 5
+            while not patched_refresh.called and time.monotonic() < give_up:
+                time.sleep(0.01)
+        self.assertTrue(patched_refresh.called)
+
+    def test_migrations_checked_until_applied(self, checker):
+        with patch('core.health.pending_migrations',
+                   side_effect=[2, 0, 0]) as patched_pending:
+            checker.refresh()
+            self.assertFalse(checker.last[1]['migrations']['ok'])
+            checker.refresh()
+            checker.refresh()
+
+        self.assertTrue(checker.last[1]['migrations']['ok'])
+        self.assertEqual(patched_pending.call_count, 2)
@@ -0,0 +1,82 @@
+"""
+Tests for memory profiling of requests
+"""
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.memory import Measurement, load_stats, reset_stats
+from core.testing import MemoryBudgetMixin
+
+ME_URL = reverse('user:me')
+
+
+class MeasurementTests(MemoryBudgetMixin, SimpleTestCase):
+    """Test measuring allocations"""
+
+    def test_peak_and_sites(self):
+        with Measurement(top=3) as measurement:
+            data = bytearray(4 * 1024 * 1024)
+
+        self.assertGreaterEqual(measurement.peak, 4 * 1024 * 1024)
+        self.assertIn('test_memory.py', measurement.sites[0]['traceback'][-1])
+        self.assertGreaterEqual(measurement.sites[0]['size'], len(data))
+
+    def test_budget_exceeded(self):
+        with self.assertRaisesMessage(AssertionError, 'over the budget'):
+            with self.assertMemoryBudget(1):
+                data = bytearray(2 * 1024 * 1024)
+                del data
+
+
+class MemoryProfilingMiddlewareTests(TestCase):
+    """Test recording the memory of requests by URL name"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            MEMORY_PROFILE=True, MEMORY_PROFILE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(reset_stats)
+
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_records_url_name(self):
+        self.client.get(ME_URL)
+        self.client.get(ME_URL)
+
+        entry = load_stats()['user:me']
+        self.assertEqual(entry['requests'], 2)
+        self.assertGreater(entry['peak_max'], 0)
+        self.assertTrue(entry['top'])
+
+    @override_settings(MEMORY_PROFILE=False)
+    def test_off_by_default(self):
+        self.client.get(ME_URL)
+
+        self.assertEqual(load_stats(), {})
+
+    def test_command_shows_stats(self):
+        self.client.get(ME_URL)
+        out = StringIO()
+
+        call_command('memory_profile', stdout=out)
+
+        self.assertIn('user:me: 1 requests', out.getvalue())
+
+    def test_command_reset(self):
+        self.client.get(ME_URL)
+
+        call_command('memory_profile', '--reset', stdout=StringIO())
+
+        self.assertEqual(load_stats(), {})
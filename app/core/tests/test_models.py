@@ -84,3 +84,78 @@ class ModelsTests(TestCase):
         tag = models.Tag.objects.create(user=user, name='Tag1')
 
         self.assertEqual(str(tag), tag.name)
+
+    def test_deleting_recipe_leaves_tombstone(self):
+        """Test deleting a recipe records a tombstone for syncing"""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Name of recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        recipe_id = recipe.id
+
+        recipe.delete()
+
+        tombstone = models.RecipeTombstone.objects.get(user=user)
+        self.assertEqual(tombstone.recipe_id, recipe_id)
+
+    def test_recipe_tag_cache_follows_tags(self):
+        """Test the stored tag list follows tag changes"""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Name of recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        vegan = models.Tag.objects.create(user=user, name='Vegan')
+        dessert = models.Tag.objects.create(user=user, name='Dessert')
+
+        recipe.tag.add(vegan, dessert)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_cache, [
+            {'id': vegan.id, 'name': 'Vegan'},
+            {'id': dessert.id, 'name': 'Dessert'},
+        ])
+
+        vegan.name = 'Plant based'
+        vegan.save()
+        dessert.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_cache,
+                         [{'id': vegan.id, 'name': 'Plant based'}])
+
+        vegan.recipe_set.clear()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tag_cache, [])
+
+    def test_recipe_ingredient_unit_normalized(self):
+        """Test ingredient units are stored under their canonical name"""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Name of recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        ingredient = models.Ingredient.objects.create(user=user, name='Salt')
+
+        for unit, expected in [('Tablespoons', 'tbsp'), ('G', 'g'),
+                               ('lbs', 'lb'), ('cups', 'cup')]:
+            item = models.RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=ingredient,
+                quantity=Decimal('1'),
+                unit=unit,
+            )
+            self.assertEqual(item.unit, expected)
+
+        with self.assertRaises(ValueError):
+            models.RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=ingredient,
+                quantity=Decimal('1'),
+                unit='handful',
+            )
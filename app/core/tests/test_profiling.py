@@ -0,0 +1,95 @@
+"""
+Tests for on demand request profiling
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import ProfileReport
+from core.profiling import create_profile_token
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ProfilingTests(TestCase):
+    """Test profiling requests through the X-Profile header"""
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123')
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_profiled(self, token):
+        return self.client.get(RECIPES_URL, HTTP_X_PROFILE=token)
+
+    def get_profiled_by_staff(self):
+        self.client.force_authenticate(self.staff)
+        return self.get_profiled(create_profile_token(self.staff))
+
+    @override_settings(PROFILE_EXPLAIN_THRESHOLD_MS=0)
+    def test_profile_request(self):
+        """Test a staff token stores a report with SQL and plans"""
+        res = self.get_profiled_by_staff()
+
+        report = ProfileReport.objects.get(pk=res['X-Profile-Id'])
+        self.assertEqual(report.user, self.staff)
+        self.assertEqual(report.path, RECIPES_URL)
+        self.assertEqual(report.status_code, 200)
+        self.assertIn('function calls', report.stats)
+        selects = [q for q in report.queries
+                   if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertTrue(all(q['explain'] for q in selects))
+        self.assertFalse(any('params' in q for q in report.queries))
+
+    def test_token_of_another_user_ignored(self):
+        """Test a staff token does not profile other users' requests"""
+        res = self.get_profiled(create_profile_token(self.staff))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_unauthenticated_request_not_profiled(self):
+        res = APIClient().get(
+            RECIPES_URL, HTTP_X_PROFILE=create_profile_token(self.staff))
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_non_staff_token_ignored(self):
+        res = self.get_profiled(create_profile_token(self.user))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_bad_token_ignored(self):
+        res = self.get_profiled('not-a-token')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_show_profile(self):
+        res = self.get_profiled_by_staff()
+        out = StringIO()
+
+        call_command('show_profile', res['X-Profile-Id'], stdout=out)
+
+        self.assertIn(f'GET {RECIPES_URL} -> 200', out.getvalue())
+
+    def test_admin_page(self):
+        res = self.get_profiled_by_staff()
+        self.client.force_login(self.staff)
+
+        res = self.client.get(reverse(
+            'admin:core_profilereport_change', args=[res['X-Profile-Id']]))
+
+        self.assertEqual(res.status_code, 200)
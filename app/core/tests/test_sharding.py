@@ -0,0 +1,214 @@
+"""
+Tests for sharding recipe data by user
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTombstone,
+    Tag,
+    UserShard,
+)
+from core.sharding import (
+    SHARD_ID_RANGE,
+    ShardMoving,
+    hashed_shard,
+    set_user_shard,
+    shard_for_user,
+)
+
+SHARDS = ['shard_a', 'shard_b']
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 5,
+        'price': Decimal('1.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class HashRingTests(TestCase):
+    """Test assigning users to shards"""
+
+    def test_stable(self):
+        self.assertEqual(hashed_shard(42, SHARDS), hashed_shard(42, SHARDS))
+
+    def test_adding_shard_moves_few_users(self):
+        """Test users only move to the new shard"""
+        before = {id: hashed_shard(id, SHARDS) for id in range(1000)}
+        after = {id: hashed_shard(id, SHARDS + ['shard_c'])
+                 for id in range(1000)}
+
+        moved = [id for id in before if before[id] != after[id]]
+        self.assertTrue(all(after[id] == 'shard_c' for id in moved))
+        self.assertLess(len(moved), 500)
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardRoutingTests(TestCase):
+    """Test recipe data is stored on the owner's shard"""
+    databases = {'default', 'shard_a', 'shard_b'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.shard = shard_for_user(self.user.pk)
+        self.other = [alias for alias in SHARDS if alias != self.shard][0]
+
+    def test_create_on_user_shard(self):
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+
+        self.assertTrue(
+            Recipe.objects.using(self.shard).filter(pk=recipe.pk).exists())
+        self.assertFalse(Recipe.objects.using(self.other).exists())
+        self.assertEqual(
+            Recipe.tag.through.objects.using(self.shard).count(), 1)
+        recipe = Recipe.objects.using(self.shard).get(pk=recipe.pk)
+        self.assertEqual(recipe.tag_cache, [{'id': tag.id, 'name': 'Vegan'}])
+
+    def test_api_uses_user_shard(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.using(self.shard).count(), 1)
+
+        res = client.get(RECIPES_URL)
+        self.assertEqual([r['title'] for r in res.data], ['Soup'])
+
+        res = client.delete(reverse('recipe:recipe-detail',
+                                    args=[res.data[0]['id']]))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            RecipeTombstone.objects.using(self.shard).count(), 1)
+
+    def test_users_pinned_when_created(self):
+        self.assertEqual(
+            UserShard.objects.get(user=self.user).alias, self.shard)
+
+    def test_adding_shard_keeps_users(self):
+        """Test a new shard on the ring does not move existing users"""
+        users = [create_user(f'user{i}@example.com') for i in range(20)]
+        placed = {user.pk: shard_for_user(user.pk) for user in users}
+        cache.clear()
+
+        with self.settings(DATABASE_SHARDS=['default'] + SHARDS):
+            moved = [
+                user.pk for user in users
+                if hashed_shard(user.pk, ['default'] + SHARDS) !=
+                placed[user.pk]
+            ]
+            self.assertTrue(moved)
+            for user in users:
+                self.assertEqual(shard_for_user(user.pk), placed[user.pk])
+
+    def test_unpinned_user_pinned_on_lookup(self):
+        UserShard.objects.filter(user=self.user).delete()
+        cache.clear()
+
+        self.assertEqual(shard_for_user(self.user.pk), self.shard)
+        self.assertEqual(
+            UserShard.objects.get(user=self.user).alias, self.shard)
+
+    def test_move_user_shard(self):
+        """Test moving a user keeps their data and ids"""
+        recipe = create_recipe(self.user, title='Soup')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, quantity=2, unit='g')
+        recipe = Recipe.objects.using(self.shard).get(pk=recipe.pk)
+
+        call_command('move_user_shard', self.user.email, self.other,
+                     stdout=StringIO())
+
+        self.assertEqual(shard_for_user(self.user.pk), self.other)
+        self.assertFalse(Recipe.objects.using(self.shard).exists())
+        self.assertFalse(Tag.objects.using(self.shard).exists())
+        moved = Recipe.objects.using(self.other).get(pk=recipe.pk)
+        self.assertEqual(moved.created_at, recipe.created_at)
+        self.assertEqual(moved.updated_at, recipe.updated_at)
+        self.assertEqual(list(moved.tag.all()), [tag])
+        self.assertEqual(moved.tag_cache, recipe.tag_cache)
+        self.assertEqual(
+            RecipeIngredient.objects.using(self.other).get().quantity, 2)
+
+        cache.clear()
+        self.assertEqual(shard_for_user(self.user.pk), self.other)
+
+    def test_move_to_shard_with_other_users(self):
+        """Test a user moves next to others without their ids clashing"""
+        neighbour = next(
+            user for user in (create_user(f'user{i}@example.com')
+                              for i in range(20))
+            if shard_for_user(user.pk) == self.other)
+        theirs = create_recipe(neighbour, title='Stew')
+        Tag.objects.create(user=neighbour, name='Spicy')
+        recipe = create_recipe(self.user, title='Soup')
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        call_command('move_user_shard', self.user.email, self.other,
+                     stdout=StringIO())
+        created = create_recipe(self.user, title='Pie')
+
+        self.assertNotEqual(recipe.pk, theirs.pk)
+        self.assertGreater(recipe.pk, SHARD_ID_RANGE)
+        self.assertEqual(
+            Recipe.objects.using(self.other).get(pk=theirs.pk).user,
+            neighbour)
+        self.assertEqual(
+            set(Recipe.objects.using(self.other).filter(
+                user=self.user).values_list('title', flat=True)),
+            {'Soup', 'Pie'})
+        self.assertNotIn(created.pk, {recipe.pk, theirs.pk})
+        self.assertEqual(Tag.objects.using(self.other).count(), 2)
+
+    def test_writes_refused_while_moving(self):
+        recipe = create_recipe(self.user)
+        set_user_shard(self.user.pk, self.shard, frozen=True)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00'})
+
+        self.assertEqual(res.status_code, 503)
+        self.assertIn('Retry-After', res)
+        with self.assertRaises(ShardMoving), \
+                transaction.atomic(using=self.shard):
+            recipe.delete()
+        self.assertEqual(Recipe.objects.using(self.shard).count(), 1)
+
+    def test_write_to_old_shard_refused(self):
+        """Test a worker holding rows of a moved user cannot change them"""
+        recipe = create_recipe(self.user)
+        set_user_shard(self.user.pk, self.other)
+
+        recipe.title = 'Lost'
+        with self.assertRaises(ShardMoving):
+            recipe.save()
@@ -0,0 +1,159 @@
+"""
+Tests for the token bucket throttles.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import TokenBucketThrottle, parse_rate
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+RATES = {
+    'REST_FRAMEWORK': {
+        'DEFAULT_THROTTLE_RATES': {
+            'read': '3/min',
+            'write': '1/min',
+            'login': '2/min',
+            'bulk': None,
+        },
+    },
+}
+
+
+class ParseRateTests(TestCase):
+    """Test reading throttle rates"""
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('100/min'), (100, 60))
+        self.assertEqual(parse_rate('5/s'), (5, 1))
+        self.assertEqual(parse_rate('1000/day'), (1000, 86400))
+        self.assertEqual(parse_rate(None), (None, None))
+
+
+@override_settings(**RATES)
+class ThrottleApiTests(TestCase):
+    """Test throttling the API endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_read_bucket_exhausted(self):
+        """Test reads are throttled once the bucket is empty"""
+        for remaining in (2, 1, 0):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res['RateLimit-Limit'], '3')
+            self.assertEqual(res['RateLimit-Remaining'], str(remaining))
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['RateLimit-Remaining'], '0')
+        self.assertEqual(res['Retry-After'], '20')
+
+    def test_read_and_write_buckets_separate(self):
+        """Test using up the write bucket leaves reads alone"""
+        payload = {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'}
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_buckets_are_per_user(self):
+        """Test one user using up their bucket does not affect another"""
+        for _ in range(4):
+            self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_login_throttled(self):
+        """Test login attempts are throttled by client address"""
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+
+class TokenBucketTests(TestCase):
+    """Test the token bucket refill"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _throttle(self, now):
+        throttle = TokenBucketThrottle()
+        throttle.scope = 'read'
+        throttle.timer = lambda: now
+        return throttle
+
+    @override_settings(**RATES)
+    def test_tokens_come_back_over_time(self):
+        """Test a drained bucket refills one token per interval"""
+        request = APIClient().get(RECIPES_URL).wsgi_request
+        with patch.object(TokenBucketThrottle, 'get_ident_for',
+                          return_value='1'):
+            for _ in range(3):
+                self.assertTrue(
+                    self._throttle(1000).allow_request(request, None))
+            throttle = self._throttle(1000)
+            self.assertFalse(throttle.allow_request(request, None))
+            self.assertEqual(throttle.wait(), 20)
+
+            self.assertFalse(
+                self._throttle(1019).allow_request(request, None))
+            self.assertTrue(
+                self._throttle(1020).allow_request(request, None))
+            self.assertFalse(
+                self._throttle(1020).allow_request(request, None))
+
+            for _ in range(3):
+                self.assertTrue(
+                    self._throttle(2000).allow_request(request, None))
+
+    @override_settings(**RATES)
+    def test_busy_bucket_kept(self):
+        """Test a bucket in constant use does not expire and refill"""
+        request = APIClient().get(RECIPES_URL).wsgi_request
+        clock = [1000]
+        allowed = 0
+        with patch.object(TokenBucketThrottle, 'get_ident_for',
+                          return_value='1'), \
+                patch('time.time', side_effect=lambda: clock[0]):
+            for second in range(300):
+                clock[0] = 1000 + second
+                allowed += self._throttle(clock[0]).allow_request(
+                    request, None)
+
+        # A full bucket of 3, then one token every 20 seconds.
+        self.assertEqual(allowed, 3 + 299 // 20)
@@ -0,0 +1,154 @@
+"""
+Token bucket throttles for the API.
+
+The buckets are kept in the Django cache as a single integer per client
+(the "theoretical arrival time" of the generic cell rate algorithm), so
+every request costs an atomic ``incr`` and a ``touch`` on the cache and no
+locking.
+"""
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Turn a rate like '100/min' into (requests, duration in seconds)"""
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base throttle holding a token bucket of ``rate`` requests per period.
+
+    A full bucket allows a burst of the whole rate, after which tokens come
+    back at an even pace. Rates come from ``DEFAULT_THROTTLE_RATES`` by
+    scope; a scope without a rate is not throttled. The calls of a batch
+    are charged by the batch itself, so they skip the throttles of their
+    views unless ``skip_in_batch`` is off.
+    """
+    scope = None
+    cache = default_cache
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+    timer = time.time
+    skip_in_batch = True
+
+    def get_scope(self, request, view):
+        """Return the name of the bucket for this request"""
+        return self.scope
+
+    def get_cost(self, request, view):
+        """Return how many tokens the request takes from the bucket"""
+        return 1
+
+    def get_ident_for(self, request):
+        """Return the client the bucket belongs to"""
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+    def get_rate(self, scope):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+    def allow_request(self, request, view):
+        http_request = getattr(request, '_request', request)
+        if self.skip_in_batch and getattr(http_request, 'batched', False):
+            return True
+        scope = self.get_scope(request, view)
+        self.num_requests, duration = parse_rate(self.get_rate(scope))
+        if self.num_requests is None:
+            return True
+        cost = self.get_cost(request, view)
+        if not cost:
+            return True
+
+        key = self.cache_format % {
+            'scope': scope,
+            'ident': self.get_ident_for(request),
+        }
+        now = int(self.timer() * 1000000)
+        self.duration = duration * 1000000
+        interval = max(self.duration // self.num_requests, 1)
+        charge = interval * cost
+        timeout = duration + 1
+
+        tat = self._incr(key, charge, now, timeout)
+        if tat - charge < now:
+            # The bucket has refilled completely while idle, restart it
+            # from now. Racing resets can let a handful of extra requests
+            # through, which is fine for a throttle.
+            tat = now + charge
+            self.cache.set(key, tat, timeout)
+
+        self.now = now
+        self.interval = interval
+        self.tat = tat
+        allowed = tat - now <= self.duration
+        if not allowed:
+            tat = self.cache.decr(key, charge)
+        # incr keeps the expiry of the key's creation, which would empty a
+        # busy bucket; keep it until the bucket has refilled instead.
+        self.cache.touch(key, -(-(tat - now) // 1000000) + 1)
+        self._record(request, allowed)
+        return allowed
+
+    def _incr(self, key, interval, now, timeout):
+        """Atomically add an interval to the bucket, creating it if needed"""
+        try:
+            return self.cache.incr(key, interval)
+        except ValueError:
+            if self.cache.add(key, now + interval, timeout):
+                return now + interval
+            return self.cache.incr(key, interval)
+
+    def _record(self, request, allowed):
+        """Keep the tightest bucket on the request for RateLimit headers"""
+        if allowed:
+            remaining = (self.now + self.duration - self.tat) // self.interval
+        else:
+            remaining = 0
+        reset = -(-(min(self.tat, self.now + self.duration) - self.now)
+                  // 1000000)
+        info = (self.num_requests, int(remaining), int(reset))
+        http_request = getattr(request, '_request', request)
+        current = getattr(http_request, 'ratelimit', None)
+        if current is None or info[1] < current[1]:
+            http_request.ratelimit = info
+
+    def wait(self):
+        """Return the seconds until the next request would be allowed"""
+        return max(self.tat - self.duration - self.now, 0) / 1000000
+
+
+class ReadWriteThrottle(TokenBucketThrottle):
+    """Separate buckets for safe (read) and unsafe (write) requests"""
+
+    def get_scope(self, request, view):
+        if request.method in SAFE_METHODS:
+            return 'read'
+        return 'write'
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Bucket for login attempts, keyed by the client address"""
+    scope = 'login'
+    # Every attempt counts, batched or not.
+    skip_in_batch = False
+
+    def get_ident_for(self, request):
+        return self.get_ident(request)
+
+
+class BulkThrottle(TokenBucketThrottle):
+    """Bucket for endpoints that work on many objects per request"""
+    scope = 'bulk'
+    # Batches only pay for plain reads and writes; bulk calls in them
+    # still take their own tokens.
+    skip_in_batch = False
@@ -0,0 +1,157 @@
+"""
+Signed access tokens, database backed refresh tokens and the expiry of
+authtoken tokens.
+
+An access token is ``<user id>:<generation>`` signed with a timestamp, so
+checking one needs no database query. Bumping a user's token generation
+revokes every access token issued before; the current generation of each
+user, with whether they are archived, is kept in the cache. Changes to the
+user write the cache from the database once committed, while requests
+only fill it in when it is empty, so they cannot put back an older value.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.archive import restore_user, user_seen
+from core.models import RefreshToken, User
+
+ACCESS_SALT = 'core.tokens.access'
+
+
+class InvalidToken(Exception):
+    """The token is malformed, expired or revoked"""
+
+
+def generation_key(user_id):
+    return f'token_generation:{user_id}'
+
+
+def _generation_row(user_id):
+    return User.objects.filter(
+        pk=user_id, is_active=True,
+    ).values_list('token_generation', 'archived').first()
+
+
+def refresh_generation(user_id):
+    """Cache the token generation of a user as it is in the database"""
+    row = _generation_row(user_id)
+    if row is None:
+        cache.delete(generation_key(user_id))
+    else:
+        cache.set(generation_key(user_id), row,
+                  settings.TOKEN_GENERATION_CACHE_TIMEOUT)
+
+
+def get_generation(user_id):
+    """Return the current token generation of a user, or None"""
+    key = generation_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _generation_row(user_id)
+        if entry is None:
+            return None
+        cache.add(key, entry, settings.TOKEN_GENERATION_CACHE_TIMEOUT)
+    generation, archived = entry
+    if archived:
+        restore_user(user_id)
+        refresh_generation(user_id)
+    return generation
+
+
+def create_access_token(user):
+    """Return a signed access token for the user"""
+    signer = signing.TimestampSigner(salt=ACCESS_SALT)
+    return signer.sign(f'{user.pk}:{user.token_generation}')
+
+
+def check_access_token(token):
+    """Return the user id of a valid access token"""
+    signer = signing.TimestampSigner(salt=ACCESS_SALT)
+    try:
+        value = signer.unsign(token, max_age=settings.ACCESS_TOKEN_LIFETIME)
+        user_id, generation = (int(part) for part in value.split(':'))
+    except (signing.BadSignature, ValueError):
+        raise InvalidToken()
+
+    if get_generation(user_id) != generation:
+        raise InvalidToken()
+    return user_id
+
+
+def auth_token_cutoff():
+    """Return the time before which unused authtoken tokens expired"""
+    return timezone.now() - timedelta(seconds=settings.TOKEN_LIFETIME)
+
+
+def auth_token_expired(token):
+    return token.created < auth_token_cutoff()
+
+
+def auth_token_needs_renewal(token):
+    return token.created < timezone.now() - timedelta(
+        seconds=settings.TOKEN_RENEW_INTERVAL)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_refresh_token(user):
+    """Store a new refresh token for the user and return its key"""
+    key = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user,
+        key_hash=hash_key(key),
+        generation=user.token_generation,
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.REFRESH_TOKEN_LIFETIME),
+    )
+    return key
+
+
+def create_token_pair(user):
+    """Return a response body with new access and refresh tokens"""
+    return {
+        'access': create_access_token(user),
+        'refresh': create_refresh_token(user),
+        'expires_in': settings.ACCESS_TOKEN_LIFETIME,
+    }
+
+
+def rotate_refresh_token(key):
+    """
+    Exchange a refresh token for a new token pair.
+
+    The refresh token is used up, so a stolen one works at most once.
+    """
+    with transaction.atomic():
+        token = RefreshToken.objects.select_for_update().select_related(
+            'user').filter(key_hash=hash_key(key)).first()
+        if token is None:
+            raise InvalidToken()
+        token.delete()
+
+    user = token.user
+    if token.expires_at <= timezone.now() or not user.is_active or \
+            token.generation != user.token_generation:
+        raise InvalidToken()
+    user_seen(user)
+    return create_token_pair(user)
+
+
+def revoke_tokens(user):
+    """Revoke every access and refresh token of the user"""
+    User.objects.filter(pk=user.pk).update(
+        token_generation=F('token_generation') + 1)
+    RefreshToken.objects.filter(user=user).delete()
+    # Written rather than deleted: a request that read the old generation
+    # meanwhile could otherwise cache it again.
+    refresh_generation(user.pk)
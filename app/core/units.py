@@ -0,0 +1,58 @@
+"""
+Units for recipe ingredient quantities.
+
+Every unit belongs to a dimension and converts to that dimension's base
+unit (grams, millilitres or pieces) by a fixed factor.
+"""
+
+MASS = 'g'
+VOLUME = 'ml'
+COUNT = 'piece'
+
+UNITS = {
+    'mg': (MASS, 0.001),
+    'g': (MASS, 1.0),
+    'kg': (MASS, 1000.0),
+    'oz': (MASS, 28.349523125),
+    'lb': (MASS, 453.59237),
+    'ml': (VOLUME, 1.0),
+    'l': (VOLUME, 1000.0),
+    'tsp': (VOLUME, 4.92892159375),
+    'tbsp': (VOLUME, 14.78676478125),
+    'cup': (VOLUME, 236.5882365),
+    'piece': (COUNT, 1.0),
+}
+
+ALIASES = {
+    'milligram': 'mg',
+    'gram': 'g',
+    'gr': 'g',
+    'kilogram': 'kg',
+    'kilo': 'kg',
+    'ounce': 'oz',
+    'pound': 'lb',
+    'lbs': 'lb',
+    'millilitre': 'ml',
+    'milliliter': 'ml',
+    'litre': 'l',
+    'liter': 'l',
+    'teaspoon': 'tsp',
+    'tablespoon': 'tbsp',
+    'pc': 'piece',
+    'pcs': 'piece',
+    '': 'piece',
+}
+
+UNIT_CHOICES = [(unit, unit) for unit in UNITS]
+
+
+def normalize_unit(unit):
+    """Return the canonical name of a unit or raise ValueError"""
+    name = unit.strip().lower().rstrip('.')
+    if name not in UNITS and name.endswith('s'):
+        name = name[:-1]
+    name = ALIASES.get(name, name)
+    if name not in UNITS:
+        raise ValueError(f'Unknown unit: {unit}')
+
+    return name
@@ -0,0 +1,18 @@
+"""
+Views shared by the whole API.
+"""
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework.response import Response
+
+from core.coalescing import coalesce, request_key
+
+
+class SchemaView(SpectacularAPIView):
+    """OpenAPI schema, generated once for identical concurrent requests"""
+
+    def _get_schema_response(self, request):
+        key = request_key('schema', request)
+        schema = coalesce(
+            key, lambda: super(SchemaView, self)._get_schema_response(
+                request).data)
+        return Response(schema)
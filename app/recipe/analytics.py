@@ -0,0 +1,261 @@
+"""
+Platform wide tag analytics from sketches.
+
+Every use of a tag, i.e. linking it to a recipe, is counted under the tag's
+normalized name in the time bucket it happened in: a count-min sketch per
+bucket estimates the uses of each name and a HyperLogLog per bucket and
+name the distinct users. Each process counts into its own sketches and
+merges them into ``TagUsage`` and ``TagUsers`` every
+``TAG_ANALYTICS_FLUSH_EVENTS`` uses or ``TAG_ANALYTICS_FLUSH_INTERVAL``
+seconds, and when it exits. A background thread does the merging so
+requests never wait on it, and counts that fail to merge are kept for the
+next try. Reading the trending tags touches a fixed number of buckets
+however many tags and recipes there are.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import Tag, TagUsage, TagUsers
+from recipe.sketches import CountMinSketch, HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+TRENDING_KEY = 'tags_trending:{limit}'
+
+
+def normalize(name):
+    return name.strip().lower()
+
+
+def bucket_start(when):
+    """Return the start of the time bucket when falls in"""
+    size = settings.TAG_ANALYTICS_BUCKET
+    return when - timedelta(seconds=when.timestamp() % size)
+
+
+def keep_top(top, usage):
+    """Re-estimate candidate names and keep the most used ones"""
+    estimates = {name: usage.query(name) for name in top}
+    names = sorted(estimates, key=estimates.get, reverse=True)
+    names = names[:settings.TAG_TRENDING_TOP]
+    return {name: estimates[name] for name in names}
+
+
+class BucketSketches:
+    """Uses and users of tag names in one bucket, counted in this process"""
+
+    def __init__(self):
+        self.usage = CountMinSketch()
+        self.top = {}
+        self.users = {}
+
+    def add(self, name, user_id, count):
+        self.usage.add(name, count)
+        self.users.setdefault(name, HyperLogLog()).add(user_id)
+        estimate = self.usage.query(name)
+        if name in self.top or len(self.top) < settings.TAG_TRENDING_TOP:
+            self.top[name] = estimate
+            return
+        smallest = min(self.top, key=self.top.get)
+        if estimate > self.top[smallest]:
+            del self.top[smallest]
+            self.top[name] = estimate
+
+    def merge(self, other):
+        """Add the counts of other, from the same bucket"""
+        self.usage.merge(other.usage)
+        for name, users in other.users.items():
+            if name in self.users:
+                self.users[name].merge(users)
+            else:
+                self.users[name] = users
+        self.top = keep_top(set(self.top) | set(other.top), self.usage)
+
+
+def merge_into_db(bucket, sketches):
+    """Add the counts of one bucket to the stored sketches"""
+    with transaction.atomic(using='default'):
+        usage, created = TagUsage.objects.using('default').get_or_create(
+            bucket=bucket,
+            defaults={
+                'counts': sketches.usage.to_bytes(),
+                'top': sketches.top,
+            },
+        )
+        if not created:
+            usage = TagUsage.objects.using('default').select_for_update().get(
+                pk=usage.pk)
+            merged = CountMinSketch.from_bytes(usage.counts)
+            merged.merge(sketches.usage)
+            usage.counts = merged.to_bytes()
+            usage.top = keep_top(set(usage.top) | set(sketches.top), merged)
+            usage.save(update_fields=['counts', 'top'])
+
+        for name, users in sketches.users.items():
+            row, created = TagUsers.objects.using('default').get_or_create(
+                bucket=bucket, name=name,
+                defaults={'registers': users.to_bytes()},
+            )
+            if not created:
+                row = TagUsers.objects.using('default').select_for_update(
+                    ).get(pk=row.pk)
+                merged = HyperLogLog.from_bytes(row.registers)
+                merged.merge(users)
+                row.registers = merged.to_bytes()
+                row.save(update_fields=['registers'])
+
+
+class TagAnalytics:
+    """Sketches of this process waiting to be merged into the database"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+        self.registered = False
+        self.thread = None
+        self.wakeup = threading.Event()
+
+    def start(self):
+        """Start the flushing thread if merging in the background"""
+        if not self.registered:
+            atexit.register(self.flush)
+            self.registered = True
+        if settings.TAG_ANALYTICS_IN_BACKGROUND and self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name='tag-analytics', daemon=True)
+            self.thread.start()
+
+    def record(self, user_id, names, count=1, when=None):
+        """Count uses of tag names by a user"""
+        bucket = bucket_start(when or timezone.now())
+        with self.lock:
+            self.start()
+            sketches = self.buckets.setdefault(bucket, BucketSketches())
+            for name in names:
+                sketches.add(normalize(name), user_id, count)
+                self.pending += 1
+            due = self.pending >= settings.TAG_ANALYTICS_FLUSH_EVENTS or \
+                time.monotonic() - self.flushed_at >= \
+                settings.TAG_ANALYTICS_FLUSH_INTERVAL
+        if due:
+            if self.thread is None:
+                self.flush()
+            else:
+                self.wakeup.set()
+
+    def restore(self, buckets):
+        """Put back sketches that could not be merged into the database"""
+        with self.lock:
+            for bucket, sketches in buckets.items():
+                if bucket in self.buckets:
+                    sketches.merge(self.buckets[bucket])
+                self.buckets[bucket] = sketches
+
+    def flush(self):
+        """Merge the counted uses into the database"""
+        with self.lock:
+            buckets, self.buckets = self.buckets, {}
+            self.pending = 0
+            self.flushed_at = time.monotonic()
+        for bucket in sorted(buckets):
+            try:
+                merge_into_db(bucket, buckets[bucket])
+            except Exception:
+                # Each bucket merges in its own transaction, so only this
+                # one and the ones after it are still to be counted.
+                self.restore({
+                    later: sketches for later, sketches in buckets.items()
+                    if later >= bucket
+                })
+                raise
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.TAG_ANALYTICS_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Merging tag analytics failed')
+            finally:
+                connections.close_all()
+
+
+tag_analytics = TagAnalytics()
+
+
+def record_tags_linked(recipe_or_tag, reverse, pk_set, using):
+    """Count the tags linked to a recipe, or a tag linked to recipes"""
+    if reverse:
+        names, count = [recipe_or_tag.name], len(pk_set)
+    else:
+        names = list(Tag.objects.using(using).filter(
+            pk__in=pk_set).values_list('name', flat=True))
+        count = 1
+    tag_analytics.record(recipe_or_tag.user_id, names, count)
+
+
+def trending(limit):
+    """
+    Return the most used tag names of the last TAG_TRENDING_BUCKETS.
+
+    Names are ordered by how much more they were used than in the same
+    number of buckets before.
+    """
+    key = TRENDING_KEY.format(limit=limit)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    size = timedelta(seconds=settings.TAG_ANALYTICS_BUCKET)
+    window = settings.TAG_TRENDING_BUCKETS
+    current = bucket_start(timezone.now())
+    recent_start = current - (window - 1) * size
+    previous_start = recent_start - window * size
+
+    recent, previous = CountMinSketch(), CountMinSketch()
+    candidates = set()
+    for usage in TagUsage.objects.using('default').filter(
+            bucket__gte=previous_start):
+        counts = CountMinSketch.from_bytes(usage.counts)
+        if usage.bucket >= recent_start:
+            recent.merge(counts)
+            candidates.update(usage.top)
+        else:
+            previous.merge(counts)
+
+    tags = [
+        {
+            'name': name,
+            'uses': recent.query(name),
+            'previous_uses': previous.query(name),
+        }
+        for name in candidates
+    ]
+    tags.sort(key=lambda t: (t['previous_uses'] - t['uses'], t['name']))
+    tags = tags[:limit]
+
+    users = {}
+    for row in TagUsers.objects.using('default').filter(
+            bucket__gte=recent_start, name__in=[t['name'] for t in tags]):
+        sketch = HyperLogLog.from_bytes(row.registers)
+        if row.name in users:
+            users[row.name].merge(sketch)
+        else:
+            users[row.name] = sketch
+    for tag in tags:
+        tag['users'] = users[tag['name']].count() if tag['name'] in users \
+            else 0
+
+    cache.set(key, tags, settings.TAG_TRENDING_CACHE)
+    return tags
@@ -0,0 +1,307 @@
+"""
+Server-Sent Events feed of recipe and tag changes.
+
+Clients keep ``GET /api/recipe/events/`` open instead of polling the recipe
+list, and fetch what changed through the sync endpoint when told to. The
+feed is a plain ASGI app mounted in front of Django in ``app.asgi``: an idle
+connection is one bounded ``asyncio.Queue`` and a pending read, with no
+thread or database connection held.
+
+Model signals publish after the transaction commits. On Postgres the event
+goes through ``NOTIFY`` and every worker process ``LISTEN``s on the event
+loop, so a change made in one worker reaches clients connected to any
+other, reconnecting when the connection is lost. Without Postgres events
+are delivered within the process.
+
+The credentials of a stream are checked again at the first heartbeat
+after every ``RECIPE_EVENTS_RECHECK`` seconds, and the stream ends once
+they are revoked, expired or the user deactivated. Checks run on the
+thread pool with their database connection managed as in a request.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from core.tokens import InvalidToken, auth_token_expired, check_access_token
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'recipe_events'
+PATH = '/api/recipe/events/'
+
+
+class Broker:
+    """Per user queues of the event streams open in this process"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.loop = None
+        self.listener = None
+
+    def subscribe(self, user_id):
+        """Return a new queue receiving the user's events"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            if self.listener is not None:
+                self.listener.stop()
+            if connections['default'].vendor == 'postgresql':
+                self.listener = PostgresListener(self)
+                self.listener.start(self.loop)
+        queue = asyncio.Queue(maxsize=settings.RECIPE_EVENTS_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(user_id, None)
+
+    def _resync(self, queue):
+        """Replace what a queue holds by a request to re-read everything"""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({'type': 'resync'})
+
+    def deliver(self, user_id, event):
+        """Put an event on the user's queues; runs on the event loop"""
+        for queue in self.subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client this far behind re-reads from the sync endpoint.
+                self._resync(queue)
+
+    def resync(self):
+        """Tell every stream to re-read, as events may have been missed"""
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self._resync(queue)
+
+    def publish(self, user_id, event):
+        """Deliver an event from any thread of this process"""
+        if self.loop is not None and user_id in self.subscribers:
+            self.loop.call_soon_threadsafe(self.deliver, user_id, event)
+
+
+class PostgresListener:
+    """Feeds a broker with events other processes send through NOTIFY"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.connection = None
+        self.loop = None
+        self.fileno = None
+        self.stopped = False
+
+    def start(self, loop):
+        self.loop = loop
+        self.connect()
+
+    def connect(self, reconnecting=False):
+        """LISTEN on a new connection, retrying later if that fails"""
+        if self.stopped:
+            return
+        params = connections['default'].get_connection_params()
+        # Keepalives notice a connection dropped without a word.
+        params.update(keepalives=1, keepalives_idle=30,
+                      keepalives_interval=10, keepalives_count=3)
+        try:
+            self.connection = psycopg2.connect(**params)
+            self.connection.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+        except psycopg2.Error as exc:
+            logger.warning('Could not listen for recipe events: %s', exc)
+            self.retry()
+            return
+        self.fileno = self.connection.fileno()
+        self.loop.add_reader(self.fileno, self.read)
+        if reconnecting:
+            # Events sent while disconnected are lost.
+            self.broker.resync()
+
+    def close(self):
+        if self.fileno is not None:
+            self.loop.remove_reader(self.fileno)
+            self.fileno = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def retry(self):
+        self.close()
+        self.loop.call_later(
+            settings.RECIPE_EVENTS_RECONNECT_DELAY, self.connect, True)
+
+    def stop(self):
+        self.stopped = True
+        self.close()
+
+    def read(self):
+        try:
+            self.connection.poll()
+        except psycopg2.Error as exc:
+            logger.warning('Lost the recipe events connection: %s', exc)
+            self.retry()
+            return
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            message = json.loads(notify.payload)
+            self.broker.deliver(message['user'], message['event'])
+
+
+broker = Broker()
+
+
+def publish(user_id, event, using='default'):
+    """Send an event to the user's streams once the transaction commits"""
+    def send():
+        # Workers listen on the default database, whichever shard changed.
+        if connections['default'].vendor != 'postgresql':
+            broker.publish(user_id, event)
+            return
+        payload = json.dumps({'user': user_id, 'event': event})
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+    transaction.on_commit(send, using=using)
+
+
+def authenticate(headers, query_string):
+    """
+    Return the id of the user a stream request is for, or None.
+
+    Browsers cannot set headers on an EventSource, so an access token can
+    also be passed as ``?access_token=``.
+    """
+    keyword, _, key = headers.get(b'authorization', b'').decode(
+        'latin-1').partition(' ')
+    if not key:
+        tokens = parse_qs(query_string.decode('latin-1')).get('access_token')
+        keyword, key = 'Bearer', tokens[0] if tokens else ''
+
+    if keyword.lower() == 'bearer':
+        try:
+            return check_access_token(key)
+        except InvalidToken:
+            return None
+    if keyword.lower() == 'token':
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token and token.user.is_active and not auth_token_expired(token):
+            return token.user_id
+    return None
+
+
+def _authenticate_in_thread(headers, query_string):
+    """Authenticate on a pool thread, dropping its broken connections"""
+    close_old_connections()
+    try:
+        return authenticate(headers, query_string)
+    finally:
+        close_old_connections()
+
+
+check_credentials = sync_to_async(
+    _authenticate_in_thread, thread_sensitive=False)
+
+
+def format_event(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(scope, receive, send):
+    """ASGI app serving one user's event stream"""
+    headers = dict(scope['headers'])
+    query_string = scope.get('query_string', b'')
+    user_id = await check_credentials(headers, query_string)
+    if user_id is None:
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'www-authenticate', b'Bearer'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'{"detail":"Invalid or missing token."}',
+        })
+        return
+
+    queue = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    checked_at = loop.time()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    next_event = None
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'retry: 5000\n\n',
+            'more_body': True,
+        })
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.RECIPE_EVENTS_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                break
+            if next_event in done:
+                body = format_event(next_event.result())
+                next_event = None
+            else:
+                if loop.time() - checked_at >= settings.RECIPE_EVENTS_RECHECK:
+                    checked_at = loop.time()
+                    try:
+                        valid = await check_credentials(
+                            headers, query_string) == user_id
+                    except DatabaseError as exc:
+                        # Checked again later rather than dropping streams.
+                        logger.warning('Could not recheck a stream: %r', exc)
+                        valid = True
+                    if not valid:
+                        # The client reconnects and is refused.
+                        await send(
+                            {'type': 'http.response.body', 'body': b''})
+                        break
+                # Keeps proxies from closing the idle connection.
+                body = b': ping\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+    finally:
+        if next_event is not None:
+            next_event.cancel()
+        disconnected.cancel()
+        broker.unsubscribe(user_id, queue)
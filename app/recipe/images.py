@@ -0,0 +1,150 @@
+"""
+Storage and thumbnails for recipe images.
+
+Uploads are streamed to a temporary file by Django's upload handlers, hashed
+chunk by chunk and moved into storage under the SHA-256 of their content, so
+the whole image is never held in memory and identical uploads share a file.
+Thumbnails are made after the request by a small process pool, and a
+thumbnail requested before it exists is queued there too rather than
+decoded in the request.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+
+IMAGE_DIR = 'uploads/recipe'
+THUMBNAIL_DIR = 'uploads/recipe/thumbnails'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Thumbnails queued by open_thumbnail and not made yet.
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class InvalidImage(Exception):
+    """The upload is not an image Pillow can read"""
+
+
+class ThumbnailPending(Exception):
+    """The thumbnail is queued to be made"""
+
+
+def thumbnail_name(source, size):
+    """Return the storage name of a thumbnail of the image ``source``"""
+    digest = os.path.splitext(os.path.basename(source))[0]
+    return f'{THUMBNAIL_DIR}/{digest}_{size}.jpg'
+
+
+def save_image(upload):
+    """Store an uploaded image under its content hash and return the name"""
+    try:
+        with Image.open(upload) as image:
+            extension = image.format.lower()
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise InvalidImage()
+
+    sha = hashlib.sha256()
+    for chunk in upload.chunks():
+        sha.update(chunk)
+    name = f'{IMAGE_DIR}/{sha.hexdigest()}.{extension}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+
+    return name
+
+
+def make_thumbnails(source, targets):
+    """
+    Write a JPEG thumbnail of ``source`` for each (size, path) in targets.
+
+    Runs in the worker processes, so it only deals with file paths.
+    """
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        for size, path in targets:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers must never see a half written thumbnail.
+            thumbnail.save(f'{path}.tmp', 'JPEG', quality=85)
+            os.replace(f'{path}.tmp', path)
+
+
+def _thumbnail_targets(name, sizes):
+    return [
+        (size, default_storage.path(thumbnail_name(name, size)))
+        for size in sizes
+    ]
+
+
+def get_executor():
+    """Return the process pool for thumbnails, starting it if needed"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RECIPE_THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _log_failure(name, future):
+    """Log the error of a thumbnail job, which nobody waits for"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Making thumbnails of %s failed', name,
+                     exc_info=future.exception())
+
+
+def schedule_thumbnails(name, sizes=None):
+    """
+    Make the thumbnails of a stored image off the request path.
+
+    Returns the future of the job, or None when ``RECIPE_THUMBNAIL_WORKERS``
+    is 0 and the thumbnails were made right away.
+    """
+    source = default_storage.path(name)
+    targets = _thumbnail_targets(
+        name, sizes or settings.RECIPE_THUMBNAIL_SIZES)
+    if settings.RECIPE_THUMBNAIL_WORKERS:
+        future = get_executor().submit(make_thumbnails, source, targets)
+        future.add_done_callback(lambda f: _log_failure(name, f))
+        return future
+
+    make_thumbnails(source, targets)
+    return None
+
+
+def open_thumbnail(filename, size):
+    """
+    Return an open thumbnail file.
+
+    Returns None when there is no such image. A thumbnail not made yet is
+    queued in the pool, once, and ``ThumbnailPending`` raised meanwhile.
+    """
+    source = f'{IMAGE_DIR}/{os.path.basename(filename)}'
+    name = thumbnail_name(source, size)
+    if not default_storage.exists(name):
+        if not default_storage.exists(source):
+            return None
+        with _pending_lock:
+            if name in _pending:
+                raise ThumbnailPending()
+            future = schedule_thumbnails(source, [size])
+            if future is not None:
+                _pending.add(name)
+                future.add_done_callback(lambda f: _pending.discard(name))
+                raise ThumbnailPending()
+
+    return default_storage.open(name)
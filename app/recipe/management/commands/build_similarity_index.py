@@ -0,0 +1,32 @@
+"""
+Django command to rebuild the "similar recipes" indexes
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipe.similarity import build_index
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the similarity index of users"""
+    help = 'Rebuild the TF-IDF similarity index of every user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Only rebuild the index of this user id.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for the command"""
+        users = options['users'] or get_user_model().objects.order_by(
+            'id').values_list('id', flat=True).iterator()
+        count = 0
+        for user_id in users:
+            build_index(user_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} indexes'))
@@ -0,0 +1,163 @@
+"""
+Revision history of recipes stored as deltas.
+
+Each revision holds only the fields that changed since the one before, the
+description as a word level delta: ``['=', n]`` keeps n characters,
+``['-', n]`` skips n and ``['+', text]`` inserts text. Every
+``RECIPE_REVISION_KEYFRAME_INTERVAL`` revisions a keyframe holds every
+field instead, so rebuilding a version applies a bounded number of deltas.
+New revisions are diffed against the last recorded version, which keeps the
+chain consistent even if a recipe was changed without recording one. A
+recipe created before revisions were recorded gets a keyframe of its row
+before its first update. The recipe's row is locked while a revision is
+recorded, so concurrent saves record theirs one after the other.
+"""
+import re
+from decimal import Decimal
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Recipe, RecipeRevision
+
+FIELDS = ['title', 'description', 'time_minutes', 'price', 'link']
+TOKEN = re.compile(r'\s+|\S+')
+
+
+class UnknownRevision(Exception):
+    """The recipe has no revision with that number"""
+
+
+def snapshot(recipe):
+    """Return the versioned fields of a recipe"""
+    state = {field: getattr(recipe, field) for field in FIELDS}
+    state['price'] = str(state['price'])
+    return state
+
+
+def text_delta(old, new):
+    """Return the delta turning old into new"""
+    a, b = TOKEN.findall(old), TOKEN.findall(new)
+    delta = []
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            delta.append(['=', len(''.join(a[i1:i2]))])
+            continue
+        if i2 > i1:
+            delta.append(['-', len(''.join(a[i1:i2]))])
+        if j2 > j1:
+            delta.append(['+', ''.join(b[j1:j2])])
+    return delta
+
+
+def apply_delta(old, delta):
+    """Return old with a delta from text_delta applied"""
+    parts = []
+    position = 0
+    for op, value in delta:
+        if op == '=':
+            parts.append(old[position:position + value])
+            position += value
+        elif op == '-':
+            position += value
+        else:
+            parts.append(value)
+    return ''.join(parts)
+
+
+def diff(old, new):
+    """Return the changes from one snapshot to another"""
+    changes = {}
+    for field in FIELDS:
+        if old[field] == new[field]:
+            continue
+        if field == 'description':
+            changes[field] = text_delta(old[field], new[field])
+        else:
+            changes[field] = new[field]
+    return changes
+
+
+def apply(state, changes):
+    """Return a snapshot with the changes of a revision applied"""
+    state = dict(state)
+    for field, value in changes.items():
+        if field == 'description':
+            state[field] = apply_delta(state[field], value)
+        else:
+            state[field] = value
+    return state
+
+
+def rebuild(recipe, number=None):
+    """Return (number, snapshot) of a revision, by default the latest"""
+    revisions = RecipeRevision.objects.using(recipe._state.db).filter(
+        recipe=recipe)
+    keyframes = revisions.filter(keyframe=True)
+    if number is not None:
+        keyframes = keyframes.filter(number__lte=number)
+    keyframe = keyframes.order_by('-number').first()
+    if keyframe is None:
+        raise UnknownRevision()
+
+    deltas = revisions.filter(number__gt=keyframe.number)
+    if number is not None:
+        deltas = deltas.filter(number__lte=number)
+    state, last = keyframe.data, keyframe.number
+    for revision in deltas.order_by('number'):
+        state, last = apply(state, revision.data), revision.number
+    if number is not None and last != number:
+        raise UnknownRevision()
+    return last, state
+
+
+def record_revision(recipe):
+    """Record the recipe's fields if they changed, return the revision"""
+    using = recipe._state.db
+    with transaction.atomic(using=using):
+        # The row as saved, which a stale instance may not show.
+        current = snapshot(Recipe.objects.using(using).select_for_update(
+            ).get(pk=recipe.pk))
+        try:
+            number, previous = rebuild(recipe)
+        except UnknownRevision:
+            number, previous = 0, None
+
+        if previous is None:
+            changes = current
+        else:
+            changes = diff(previous, current)
+            if not changes:
+                return number
+        number += 1
+        keyframe = \
+            (number - 1) % settings.RECIPE_REVISION_KEYFRAME_INTERVAL == 0
+        RecipeRevision.objects.using(using).create(
+            recipe=recipe,
+            user_id=recipe.user_id,
+            number=number,
+            changed=[field for field in FIELDS if field in changes],
+            keyframe=keyframe,
+            data=current if keyframe else changes,
+        )
+    return number
+
+
+def record_base_revision(recipe):
+    """Record the recipe's saved row if it has no revision yet"""
+    using = recipe._state.db
+    if not RecipeRevision.objects.using(using).filter(
+            recipe=recipe).exists():
+        record_revision(recipe)
+
+
+def revert(recipe, number):
+    """Set the recipe's fields to a revision and record that as new one"""
+    state = rebuild(recipe, number)[1]
+    for field in FIELDS:
+        setattr(recipe, field, state[field])
+    recipe.price = Decimal(recipe.price)
+    recipe.save()
+    return record_revision(recipe)
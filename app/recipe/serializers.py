@@ -1,21 +1,157 @@
 """
 Serializers for recipe APIs
 """
+import os
+
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from core.models import Recipe
+from core.models import (
+    Recipe,
+    RecipeRevision,
+    Tag,
+)
+
+
+class TagSerializer(serializers.ModelSerializer):
+    """Serializer for tags."""
+
+    class Meta:
+        model = Tag
+        fields = ['id', 'name']
+        read_only_fields = ['id']
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializers for recipes."""
+    tags = TagSerializer(source='tag', many=True, read_only=True)
 
     class Meta:
         model = Recipe
-        fields = ['id', 'title', 'time_minutes', 'price', 'link']
+        fields = ['id', 'title', 'time_minutes', 'price', 'link', 'tags']
         read_only_fields = ['id']
 
 
+class RecipeListSerializer(RecipeSerializer):
+    """Serializer for recipe lists reading the denormalized tag list"""
+    tags = serializers.ListField(
+        source='tag_cache',
+        child=serializers.DictField(),
+        read_only=True,
+    )
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view"""
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description']
+        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        read_only_fields = ['id', 'image']
+
+
+class RecipeShareSerializer(serializers.ModelSerializer):
+    """Serializer for the public link of a shared recipe"""
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['share_slug', 'url']
+        read_only_fields = fields
+
+    def get_url(self, recipe):
+        url = reverse('recipe:shared', args=[recipe.share_slug])
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return url
+
+
+class PublicRecipeSerializer(serializers.ModelSerializer):
+    """Serializer for the public page of a shared recipe"""
+    tags = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = [
+            'title', 'description', 'time_minutes', 'price', 'link', 'tags']
+        read_only_fields = fields
+
+    def get_tags(self, recipe):
+        return [tag['name'] for tag in recipe.tag_cache]
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Serializer for recipe images and their thumbnails"""
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'image', 'thumbnails']
+        read_only_fields = ['id', 'image']
+
+    def get_thumbnails(self, recipe):
+        """Return the URL of each thumbnail size"""
+        if not recipe.image:
+            return {}
+
+        request = self.context.get('request')
+        filename = os.path.basename(recipe.image.name)
+        urls = {}
+        for size in settings.RECIPE_THUMBNAIL_SIZES:
+            url = reverse('recipe:thumbnail', args=[filename, size])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[str(size)] = url
+
+        return urls
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for the ids asked for in a batch retrieve"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+    )
+    since = serializers.DateTimeField(required=False)
+
+    def validate_ids(self, value):
+        """Drop repeated ids and check the batch is not too big"""
+        ids = list(dict.fromkeys(value))
+        limit = settings.RECIPE_BATCH_MAX_IDS
+        if len(ids) > limit:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {limit} elements.')
+        return ids
+
+
+class RecipeRevisionSerializer(serializers.ModelSerializer):
+    """Serializer for an entry of a recipe's history"""
+
+    class Meta:
+        model = RecipeRevision
+        fields = ['number', 'created', 'changed']
+        read_only_fields = fields
+
+
+class RecipeRevertSerializer(serializers.Serializer):
+    """Serializer for the revision a recipe is reverted to"""
+    revision = serializers.IntegerField(min_value=1)
+
+
+class ShoppingListRecipeSerializer(serializers.Serializer):
+    """Serializer for one recipe on a shopping list"""
+    id = serializers.IntegerField(min_value=1)
+    servings = serializers.FloatField(min_value=0, default=1)
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Serializer for the recipes a shopping list is made from"""
+    recipes = ShoppingListRecipeSerializer(many=True, allow_empty=False)
+
+    def validate_recipes(self, value):
+        """Check the list is not too long"""
+        limit = settings.RECIPE_BATCH_MAX_IDS
+        if len(value) > limit:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {limit} elements.')
+        return value
@@ -0,0 +1,64 @@
+"""
+Public pages of the recipes users share.
+
+A shared recipe gets a random ``share_slug`` and can then be read by
+anyone at its public URL. The pages are meant to be served by the CDN:
+they are cacheable by anyone, carry a strong ETag of their content and
+are tagged with surrogate keys so edits purge them (see core.cdn). Pages
+not found are cached for a shorter time, tagged with the slug so that
+restoring archived recipes purges them.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+
+from core.cdn import share_key, user_key
+from core.models import Recipe
+
+
+def new_slug():
+    return secrets.token_urlsafe(16)
+
+
+def find_shared(slug):
+    """Return the recipe shared under slug, or None"""
+    # The slug does not say whose recipe it is, so each shard is asked;
+    # it is one unique index lookup each and the CDN answers most reads.
+    for alias in settings.DATABASE_SHARDS:
+        recipe = Recipe.objects.using(alias).filter(share_slug=slug).first()
+        if recipe is not None:
+            return recipe
+    return None
+
+
+def etag(body):
+    """Return a strong ETag of a response body"""
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def make_public(response, recipe=None):
+    """Let browsers and the CDN cache a public response"""
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.PUBLIC_RECIPE_MAX_AGE,
+        s_maxage=settings.PUBLIC_RECIPE_CDN_MAX_AGE,
+    )
+    if recipe is not None:
+        response['Surrogate-Key'] = ' '.join([
+            share_key(recipe.share_slug), user_key(recipe.user_id)])
+    return response
+
+
+def make_not_found(response, slug):
+    """Let browsers and the CDN briefly cache a page not found"""
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.PUBLIC_RECIPE_MAX_AGE,
+        s_maxage=settings.PUBLIC_RECIPE_MISSING_MAX_AGE,
+    )
+    response['Surrogate-Key'] = share_key(slug)
+    return response
@@ -0,0 +1,82 @@
+"""
+Shopping list aggregation across recipes.
+
+The quantities come from one grouped query. Scaling by servings,
+converting to base units and summing per ingredient are done on NumPy
+arrays, so the Python work does not grow with the number of ingredients.
+"""
+import numpy as np
+from django.db.models import Sum
+
+from core.models import RecipeIngredient
+from core.sharding import shard_for_user
+from core.units import UNITS
+
+# Switch to the larger unit once a total reaches this many base units.
+LARGER_UNITS = {'g': ('kg', 1000.0), 'ml': ('l', 1000.0)}
+
+
+def shopping_list(user, servings):
+    """
+    Return the combined ingredients of the user's recipes.
+
+    ``servings`` maps recipe ids to how many times each recipe is cooked.
+    """
+    rows = list(RecipeIngredient.objects.using(
+        shard_for_user(user.pk),
+    ).filter(
+        recipe__user=user,
+        recipe_id__in=servings,
+    ).values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name', 'unit',
+    ).annotate(total=Sum('quantity')).order_by())
+    if not rows:
+        return []
+
+    recipe_ids, ingredient_ids, names, units, totals = zip(*rows)
+    recipe_ids = np.array(recipe_ids, dtype=np.int64)
+    ingredient_ids = np.array(ingredient_ids, dtype=np.int64)
+    totals = np.array(totals, dtype=np.float64)
+
+    # Look up per recipe multipliers and per unit factors by index.
+    known_recipes = np.array(sorted(servings), dtype=np.int64)
+    multipliers = np.array(
+        [servings[id] for id in known_recipes], dtype=np.float64)
+    scale = multipliers[np.searchsorted(known_recipes, recipe_ids)]
+
+    unit_names, unit_index = np.unique(np.array(units), return_inverse=True)
+    dimensions = np.array([UNITS[unit][0] for unit in unit_names])
+    factors = np.array([UNITS[unit][1] for unit in unit_names])
+    base_quantities = totals * scale * factors[unit_index]
+    row_dimensions = dimensions[unit_index]
+
+    # Sum per (ingredient, dimension); the same ingredient measured by
+    # mass and by volume cannot be combined.
+    dimension_names, dimension_index = np.unique(
+        row_dimensions, return_inverse=True)
+    keys = ingredient_ids * len(dimension_names) + dimension_index
+    _, first_row, group_index = np.unique(
+        keys, return_index=True, return_inverse=True)
+    quantities = np.bincount(group_index, weights=base_quantities)
+    group_dimensions = row_dimensions[first_row]
+
+    group_units = group_dimensions.astype(object)
+    for unit, (larger, factor) in LARGER_UNITS.items():
+        larger_rows = (group_dimensions == unit) & (quantities >= factor)
+        quantities = np.where(larger_rows, quantities / factor, quantities)
+        group_units[larger_rows] = larger
+    quantities = np.round(quantities, 3)
+
+    return sorted(
+        (
+            {
+                'ingredient': int(ingredient_ids[row]),
+                'name': names[row],
+                'quantity': float(quantity),
+                'unit': unit,
+            }
+            for row, quantity, unit in zip(
+                first_row, quantities, group_units)
+        ),
+        key=lambda item: (item['name'].lower(), item['unit']),
+    )
@@ -0,0 +1,103 @@
+"""
+Signal handlers for data derived from recipes.
+"""
+import shutil
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.cdn import purge, share_key, user_key
+from core.deletion import user_data_deleted
+from core.models import Recipe, Tag
+from recipe import analytics, events, similarity
+
+
+@receiver(user_data_deleted)
+def remove_similarity_index(sender, user_id, **kwargs):
+    """Remove the "similar recipes" index of a deleted user"""
+    shutil.rmtree(similarity.index_dir(user_id), ignore_errors=True)
+
+
+@receiver(user_data_deleted)
+def purge_deleted_user(sender, user_id, **kwargs):
+    """Drop the public pages of a deleted user from the CDN"""
+    purge([user_key(user_id)])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+def publish_saved(sender, instance, using, **kwargs):
+    """Tell the owner's event streams about a changed recipe or tag"""
+    events.publish(instance.user_id, {
+        'type': sender._meta.model_name,
+        'action': 'saved',
+        'id': instance.pk,
+    }, using)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+def publish_deleted(sender, instance, using, **kwargs):
+    events.publish(instance.user_id, {
+        'type': sender._meta.model_name,
+        'action': 'deleted',
+        'id': instance.pk,
+    }, using)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def publish_tags_changed(sender, instance, action, reverse, using,
+                         **kwargs):
+    """Recipes whose tags are set change too"""
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        publish_saved(Recipe, instance, using)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def count_tags_linked(sender, instance, action, reverse, pk_set, using,
+                      **kwargs):
+    """Count tag uses in the analytics once the links are committed"""
+    if action == 'post_add' and pk_set:
+        pk_set = set(pk_set)
+        transaction.on_commit(
+            lambda: analytics.record_tags_linked(
+                instance, reverse, pk_set, using),
+            using=using,
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def purge_shared_recipe(sender, instance, using, **kwargs):
+    """Drop the public page of a changed shared recipe from the CDN"""
+    if instance.share_slug:
+        purge([share_key(instance.share_slug)], using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def purge_tag_pages(sender, instance, using, **kwargs):
+    """Public pages list tag names, so drop the owner's from the CDN"""
+    shared = Recipe.objects.using(using).filter(
+        user_id=instance.user_id, share_slug__isnull=False)
+    if shared.exists():
+        purge([user_key(instance.user_id)], using)
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def purge_retagged(sender, instance, action, reverse, pk_set, using,
+                   **kwargs):
+    """Drop the public pages of recipes whose tags change from the CDN"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        purge_shared_recipe(Recipe, instance, using)
+    elif pk_set:
+        slugs = Recipe.objects.using(using).filter(
+            pk__in=pk_set, share_slug__isnull=False).values_list(
+            'share_slug', flat=True)
+        purge([share_key(slug) for slug in slugs], using)
+    else:
+        # Cleared links; which recipes had the tag is not known any more.
+        purge([user_key(instance.user_id)], using)
@@ -0,0 +1,371 @@
+"""
+"Similar recipes" from a per user TF-IDF index.
+
+Each user's recipes are kept as a sparse term matrix in CSR form, stored as
+``.npy`` files that are memory mapped when read. A build records the time
+until which it holds every change, ``RECIPE_SYNC_LAG`` seconds before it was
+written as delta sync cursors do, since rows may commit after others written
+later. Before answering a query the index picks up recipes changed or
+deleted since then, re-tokenizing only those and re-weighting the matrix
+with NumPy. Finding neighbours is then a single vectorized cosine
+similarity pass over the user's rows.
+
+Builds are written by a background thread, so requests never wait for one:
+a user without an index is told to come back shortly, and a request finding
+changes saves the updated index after it answers. The previous
+``SIMILARITY_KEEP_BUILDS`` builds are kept for processes still reading them.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import Recipe, RecipeTombstone
+from core.sharding import shard_for_user
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ['ids', 'indptr', 'indices', 'counts', 'weights']
+TITLE_WEIGHT = 2
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'into', 'is', 'it', 'of', 'on', 'or', 'the', 'then', 'to', 'with',
+}
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+_executor = None
+_executor_lock = threading.Lock()
+# Users whose index is being written in the background.
+_pending = set()
+
+
+class IndexNotReady(Exception):
+    """The user's index is being built"""
+
+
+def tokenize(text):
+    """Return the terms of a piece of text"""
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def recipe_terms(title, description, tag_cache):
+    """Return the terms describing a recipe"""
+    terms = tokenize(title) * TITLE_WEIGHT + tokenize(description)
+    for tag in tag_cache:
+        terms += tokenize(tag['name'])
+    return terms
+
+
+class SimilarityIndex:
+    """The TF-IDF matrix of one user's recipes"""
+
+    def __init__(self, user_id, vocabulary, arrays, settled_at=None,
+                 build=None):
+        self.user_id = user_id
+        self.vocabulary = vocabulary
+        self.terms = {term: i for i, term in enumerate(vocabulary)}
+        self.ids, self.indptr, self.indices, self.counts, self.weights = (
+            arrays[name] for name in ARRAYS)
+        # Changes from before this time are all in the index.
+        self.settled_at = settled_at
+        self.build = build
+
+    @classmethod
+    def empty(cls, user_id):
+        arrays = {
+            'ids': np.zeros(0, dtype=np.int64),
+            'indptr': np.zeros(1, dtype=np.int64),
+            'indices': np.zeros(0, dtype=np.int32),
+            'counts': np.zeros(0, dtype=np.float32),
+            'weights': np.zeros(0, dtype=np.float32),
+        }
+        return cls(user_id, [], arrays)
+
+    def apply_changes(self, documents, deleted_ids):
+        """
+        Return a new index with documents replaced and rows deleted.
+
+        ``documents`` maps recipe ids to their terms.
+        """
+        vocabulary = list(self.vocabulary)
+        terms = dict(self.terms)
+        lengths = np.diff(self.indptr)
+        drop = np.isin(self.ids, list(documents) + list(deleted_ids))
+        keep_nnz = np.repeat(~drop, lengths)
+
+        ids = [self.ids[~drop]]
+        row_lengths = [lengths[~drop]]
+        indices = [self.indices[keep_nnz]]
+        counts = [self.counts[keep_nnz]]
+        for recipe_id, doc_terms in documents.items():
+            doc_counts = {}
+            for term in doc_terms:
+                if term not in terms:
+                    terms[term] = len(vocabulary)
+                    vocabulary.append(term)
+                doc_counts[terms[term]] = doc_counts.get(terms[term], 0) + 1
+            ids.append(np.array([recipe_id], dtype=np.int64))
+            row_lengths.append(np.array([len(doc_counts)], dtype=np.int64))
+            indices.append(np.fromiter(doc_counts, dtype=np.int32))
+            counts.append(np.fromiter(doc_counts.values(), dtype=np.float32))
+
+        row_lengths = np.concatenate(row_lengths)
+        arrays = {
+            'ids': np.concatenate(ids),
+            'indptr': np.concatenate(([0], np.cumsum(row_lengths))),
+            'indices': np.concatenate(indices),
+            'counts': np.concatenate(counts),
+        }
+        arrays['weights'] = tfidf_weights(
+            arrays['indptr'], arrays['indices'], arrays['counts'],
+            len(vocabulary),
+        )
+        return SimilarityIndex(self.user_id, vocabulary, arrays)
+
+    def similar(self, recipe_id, k):
+        """Return [(recipe id, score)] of the k closest recipes"""
+        rows = np.flatnonzero(self.ids == recipe_id)
+        if not len(rows) or not len(self.vocabulary):
+            return []
+
+        start, end = self.indptr[rows[0]], self.indptr[rows[0] + 1]
+        query = np.zeros(len(self.vocabulary), dtype=np.float32)
+        query[self.indices[start:end]] = self.weights[start:end]
+
+        # Rows are L2 normalized, so the dot product is the cosine.
+        sums = np.concatenate((
+            [0], np.cumsum(self.weights * query[self.indices],
+                           dtype=np.float64)))
+        scores = sums[self.indptr[1:]] - sums[self.indptr[:-1]]
+        scores[rows[0]] = 0
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [
+            (int(self.ids[i]), round(float(scores[i]), 4))
+            for i in top if scores[i] > 1e-6
+        ]
+
+
+def tfidf_weights(indptr, indices, counts, vocabulary_size):
+    """Return L2 normalized TF-IDF weights for a CSR count matrix"""
+    rows = len(indptr) - 1
+    if not len(counts):
+        return np.zeros(0, dtype=np.float32)
+
+    df = np.bincount(indices, minlength=vocabulary_size)
+    idf = np.log((1 + rows) / (1 + df)) + 1
+    weights = (1 + np.log(counts)) * idf[indices]
+    squares = np.concatenate(([0], np.cumsum(weights ** 2)))
+    norms = np.sqrt(squares[indptr[1:]] - squares[indptr[:-1]])
+    norms[norms == 0] = 1
+    weights /= np.repeat(norms, np.diff(indptr))
+    return weights.astype(np.float32)
+
+
+def index_dir(user_id):
+    return os.path.join(settings.SIMILARITY_INDEX_DIR, str(user_id))
+
+
+def save_index(index):
+    """Write a new build of the index and switch the manifest to it"""
+    directory = index_dir(index.user_id)
+    # Build names sort by when they were written.
+    build = f'{time.time_ns():020d}{uuid.uuid4().hex[:8]}'
+    os.makedirs(os.path.join(directory, build))
+    for name in ARRAYS:
+        np.save(os.path.join(directory, build, f'{name}.npy'),
+                getattr(index, name))
+
+    manifest = {
+        'build': build,
+        'vocabulary': index.vocabulary,
+        'settled_at': index.settled_at.isoformat()
+        if index.settled_at else None,
+    }
+    tmp = os.path.join(directory, f'index.json.{build}')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(directory, 'index.json'))
+    index.build = build
+    _prune(directory)
+
+
+def _prune(directory):
+    """Delete the builds older than the current one but the last few"""
+    try:
+        with open(os.path.join(directory, 'index.json')) as f:
+            current = json.load(f)['build']
+    except FileNotFoundError:
+        return
+    # Another process may have switched to a newer build; those stay.
+    older = sorted(
+        entry for entry in os.listdir(directory)
+        if entry < current and os.path.isdir(os.path.join(directory, entry))
+    )
+    for entry in older[:max(len(older) - settings.SIMILARITY_KEEP_BUILDS, 0)]:
+        shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+@lru_cache(maxsize=128)
+def _load_build(user_id, build, manifest_json):
+    """Memory map the arrays of one build"""
+    directory = os.path.join(index_dir(user_id), build)
+    arrays = {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        for name in ARRAYS
+    }
+    manifest = json.loads(manifest_json)
+    return SimilarityIndex(
+        user_id,
+        manifest['vocabulary'],
+        arrays,
+        # Builds from before settled_at read every change once more.
+        settled_at=parse_datetime(manifest['settled_at'])
+        if manifest.get('settled_at') else None,
+        build=build,
+    )
+
+
+def load_index(user_id):
+    """Return the saved index of a user, or None if there is none"""
+    for _ in range(2):
+        try:
+            with open(os.path.join(index_dir(user_id), 'index.json')) as f:
+                manifest_json = f.read()
+            build = json.loads(manifest_json)['build']
+            return _load_build(user_id, build, manifest_json)
+        except FileNotFoundError:
+            # Another process may have replaced the build while we read.
+            continue
+    return None
+
+
+def _settled():
+    """Return the time before which no more changes can commit"""
+    return timezone.now() - timedelta(seconds=settings.RECIPE_SYNC_LAG)
+
+
+def _documents(recipes):
+    """Return {recipe id: terms} and the earliest updated_at of recipes"""
+    documents = {}
+    earliest = None
+    for id, title, description, tag_cache, updated_at in \
+            recipes.values_list('id', 'title', 'description', 'tag_cache',
+                                'updated_at'):
+        documents[id] = recipe_terms(title, description, tag_cache)
+        earliest = min(earliest or updated_at, updated_at)
+    return documents, earliest
+
+
+def build_index(user_id):
+    """Build a user's index from scratch and save it"""
+    settled_at = _settled()
+    documents, _ = _documents(
+        Recipe.objects.using(shard_for_user(user_id)).filter(
+            user_id=user_id))
+
+    index = SimilarityIndex.empty(user_id).apply_changes(documents, [])
+    index.settled_at = settled_at
+    save_index(index)
+    return index
+
+
+def _write_in_thread(user_id, index):
+    try:
+        if index is None:
+            build_index(user_id)
+        else:
+            save_index(index)
+    except Exception:
+        logger.exception('Could not write the similarity index of user %s',
+                         user_id)
+    finally:
+        with _executor_lock:
+            _pending.discard(user_id)
+        connections.close_all()
+
+
+def schedule_write(user_id, index=None):
+    """
+    Save an index, or build one when None, off the request path.
+
+    It is done right away when ``SIMILARITY_IN_BACKGROUND`` is off, and
+    skipped when a write for the user is already under way.
+    """
+    if not settings.SIMILARITY_IN_BACKGROUND:
+        if index is None:
+            build_index(user_id)
+        else:
+            save_index(index)
+        return
+
+    global _executor
+    with _executor_lock:
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='similarity')
+    _executor.submit(_write_in_thread, user_id, index)
+
+
+def get_index(user_id):
+    """
+    Return a user's index, updated with changes since it was built.
+
+    Raises IndexNotReady while the first index of the user is built.
+    """
+    index = load_index(user_id)
+    if index is None:
+        schedule_write(user_id)
+        index = load_index(user_id)
+        if index is None:
+            raise IndexNotReady()
+        return index
+
+    settled_at = _settled()
+    using = shard_for_user(user_id)
+    changed = Recipe.objects.using(using).filter(user_id=user_id)
+    deleted = RecipeTombstone.objects.using(using).filter(user_id=user_id)
+    if index.settled_at is not None:
+        changed = changed.filter(updated_at__gt=index.settled_at)
+        deleted = deleted.filter(deleted_at__gt=index.settled_at)
+    documents, earliest = _documents(changed)
+    deleted = list(deleted.values_list('deleted_at', 'recipe_id'))
+    if not documents and not deleted:
+        return index
+
+    updated = index.apply_changes(
+        documents, [recipe_id for _, recipe_id in deleted])
+    updated.settled_at = index.settled_at
+    # Changes still in the lag window are read again by every query, and
+    # the index is only saved once some of them have settled.
+    if (earliest is not None and earliest <= settled_at) or \
+            any(deleted_at <= settled_at for deleted_at, _ in deleted):
+        updated.settled_at = settled_at
+        schedule_write(user_id, updated)
+    return updated
+
+
+def similar_recipes(user_id, recipe_id, k):
+    """Return [(recipe id, score)] of a user's recipes like recipe_id"""
+    return get_index(user_id).similar(recipe_id, k)
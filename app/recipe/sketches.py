@@ -0,0 +1,103 @@
+"""
+Mergeable probabilistic counters.
+
+``HyperLogLog`` estimates how many distinct values were added and
+``CountMinSketch`` how often each value was added, both in fixed space.
+Sketches of the same size built in different processes merge into the
+sketch of all their values, so workers can count on their own and combine
+their counts in the database. ``to_bytes`` compresses them for storage.
+"""
+import hashlib
+import math
+import zlib
+from array import array
+
+MASK_64 = (1 << 64) - 1
+
+
+def hash64(value):
+    """Return a stable 64 bit hash of a value"""
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """Estimate of the number of distinct values added"""
+
+    def __init__(self, precision=11, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = bytearray(self.size)
+        self.registers = registers
+
+    def add(self, value):
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & MASK_64
+        # Position of the first set bit in the remaining bits.
+        rank = 64 - self.precision + 1 if rest == 0 else \
+            64 - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Add the values of another sketch of the same precision"""
+        self.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small sets.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=11):
+        return cls(precision, bytearray(zlib.decompress(data)))
+
+
+class CountMinSketch:
+    """Estimate of how often each value was added, never too low"""
+
+    def __init__(self, width=2048, depth=4, counters=None):
+        self.width = width
+        self.depth = depth
+        if counters is None:
+            counters = array('Q', bytes(8 * width * depth))
+        self.counters = counters
+
+    def _cells(self, value):
+        h = hash64(value)
+        h1, h2 = h & 0xffffffff, h >> 32
+        for row in range(self.depth):
+            yield row * self.width + (h1 + row * h2) % self.width
+
+    def add(self, value, count=1):
+        for cell in self._cells(value):
+            self.counters[cell] += count
+
+    def query(self, value):
+        return min(self.counters[cell] for cell in self._cells(value))
+
+    def merge(self, other):
+        """Add the counts of another sketch of the same size"""
+        for i, count in enumerate(other.counters):
+            if count:
+                self.counters[i] += count
+
+    def to_bytes(self):
+        return zlib.compress(self.counters.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, width=2048, depth=4):
+        counters = array('Q')
+        counters.frombytes(zlib.decompress(data))
+        return cls(width, depth, counters)
@@ -0,0 +1,134 @@
+"""
+Delta sync of recipes for offline clients.
+
+A cursor remembers how far a client has read two streams: recipes ordered
+by ``(updated_at, id)`` and tombstones ordered by ``(deleted_at, id)``.
+Both are read with keyset pagination, so a page costs the same however
+many recipes the user has.
+
+Those times are taken when a row is written, and its transaction may
+commit after others written later, so the last page of a sync leaves the
+cursor ``RECIPE_SYNC_LAG`` seconds in the past: rows committed late come
+with the next sync, along with a few sent again. Tombstones are purged
+after ``RECIPE_SYNC_TOMBSTONE_DAYS``, and a cursor older than that starts
+a full resync flagged ``reset``, after which the client drops the recipes
+it was not sent.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import Recipe, RecipeTombstone, Tag
+
+SALT = 'recipe.sync'
+
+
+class InvalidCursor(Exception):
+    """The cursor was not issued by this server"""
+
+
+def _dump_position(position):
+    if position is None:
+        return None
+    return [position[0].isoformat(), position[1]]
+
+
+def _load_position(position):
+    if position is None:
+        return None
+    at = parse_datetime(position[0])
+    if at is None:
+        raise ValueError(position[0])
+    return at, int(position[1])
+
+
+def encode_cursor(recipe_position, tombstone_position):
+    """Return an opaque cursor for the given (time, id) positions"""
+    return signing.dumps({
+        'r': _dump_position(recipe_position),
+        't': _dump_position(tombstone_position),
+    }, salt=SALT)
+
+
+def decode_cursor(cursor):
+    """Return the recipe and tombstone positions of a cursor"""
+    try:
+        data = signing.loads(cursor, salt=SALT)
+        if not isinstance(data['t'], list):
+            # Issued before tombstones were purged; read everything again.
+            return None, None
+        return _load_position(data['r']), _load_position(data['t'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise InvalidCursor()
+
+
+def _after(queryset, field, position):
+    """Filter queryset to the rows after a (time, id) position"""
+    if position is None:
+        return queryset
+    at, pk = position
+    return queryset.filter(
+        Q(**{f'{field}__gt': at}) | Q(**{field: at, 'id__gt': pk}))
+
+
+def changes_since(user, cursor, page_size):
+    """
+    Return a page of changed recipes and deleted recipe ids.
+
+    Without a cursor every recipe is returned as changed and deletions that
+    happened before the first sync are skipped.
+    """
+    now = timezone.now()
+    settled = (now - timedelta(seconds=settings.RECIPE_SYNC_LAG), 0)
+    recipe_position = tombstone_position = None
+    reset = False
+    if cursor:
+        recipe_position, tombstone_position = decode_cursor(cursor)
+        cutoff = now - timedelta(days=settings.RECIPE_SYNC_TOMBSTONE_DAYS)
+        # Deletions after the cursor may have been purged.
+        reset = tombstone_position is None or \
+            tombstone_position[0] < cutoff
+        if reset:
+            recipe_position = None
+
+    recipes = _after(Recipe.objects.for_user(user), 'updated_at',
+                     recipe_position)
+    recipes = list(recipes.order_by('updated_at', 'id').prefetch_related(
+        Prefetch('tag', queryset=Tag.objects.order_by('id')),
+    )[:page_size + 1])
+
+    if recipe_position is None:
+        # The client is sent every recipe, so no deletion is news to it.
+        tombstones = []
+        tombstone_position = settled
+    else:
+        tombstones = list(_after(
+            RecipeTombstone.objects.for_user(user), 'deleted_at',
+            tombstone_position,
+        ).order_by('deleted_at', 'id').values_list(
+            'deleted_at', 'id', 'recipe_id')[:page_size + 1])
+
+    has_more = len(recipes) > page_size or len(tombstones) > page_size
+    recipes = recipes[:page_size]
+    tombstones = tombstones[:page_size]
+    if not has_more:
+        # Everything written until now was read, but rows written lately
+        # may yet be joined by rows committing late.
+        recipe_position = tombstone_position = settled
+    else:
+        if recipes:
+            recipe_position = (recipes[-1].updated_at, recipes[-1].id)
+        if tombstones:
+            tombstone_position = tombstones[-1][:2]
+
+    return {
+        'changed': recipes,
+        'deleted': [deleted_id for _, _, deleted_id in tombstones],
+        'cursor': encode_cursor(recipe_position, tombstone_position),
+        'has_more': has_more,
+        'reset': reset,
+    }
@@ -0,0 +1,204 @@
+"""
+Tests for the recipe event stream
+"""
+import asyncio
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from app.asgi import application
+from core import tokens
+from core.models import Recipe, Tag
+from recipe import events
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+def stream_scope(headers=(), query_string=b''):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': events.PATH,
+        'headers': list(headers),
+        'query_string': query_string,
+    }
+
+
+class EventStreamTests(TestCase):
+    """Test streaming events over ASGI"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.access = tokens.create_access_token(self.user)
+        # Cache the token generation so the stream needs no query.
+        tokens.get_generation(self.user.pk)
+
+    async def test_requires_token(self):
+        communicator = ApplicationCommunicator(application, stream_scope())
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output()
+
+        self.assertEqual(start['status'], 401)
+
+    async def test_stream_events(self):
+        """Test published events reach the user's stream"""
+        communicator = ApplicationCommunicator(application, stream_scope(
+            query_string=f'access_token={self.access}'.encode()))
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      start['headers'])
+        await communicator.receive_output()
+
+        events.broker.publish(
+            self.user.pk, {'type': 'recipe', 'action': 'saved', 'id': 1})
+        events.broker.publish(
+            self.user.pk + 1, {'type': 'recipe', 'action': 'saved', 'id': 2})
+        body = await communicator.receive_output()
+        self.assertEqual(
+            body['body'],
+            b'event: recipe\n'
+            b'data: {"type": "recipe", "action": "saved", "id": 1}\n\n')
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait()
+        self.assertNotIn(self.user.pk, events.broker.subscribers)
+
+    @override_settings(RECIPE_EVENTS_HEARTBEAT=0.05,
+                       RECIPE_EVENTS_RECHECK=0.05)
+    async def test_revoked_token_ends_stream(self):
+        communicator = ApplicationCommunicator(application, stream_scope(
+            query_string=f'access_token={self.access}'.encode()))
+        await communicator.send_input({'type': 'http.request'})
+        await communicator.receive_output()
+        await communicator.receive_output()
+
+        self.assertEqual(
+            (await communicator.receive_output())['body'], b': ping\n\n')
+        await sync_to_async(tokens.revoke_tokens)(self.user)
+        while True:
+            body = await communicator.receive_output()
+            if not body.get('more_body'):
+                break
+
+        self.assertEqual(body['body'], b'')
+        await communicator.wait()
+        self.assertNotIn(self.user.pk, events.broker.subscribers)
+
+    @override_settings(RECIPE_EVENTS_HEARTBEAT=0.01)
+    async def test_credentials_rechecked_on_interval(self):
+        with patch('recipe.events.authenticate',
+                   wraps=events.authenticate) as patched_authenticate, \
+                patch('recipe.events.close_old_connections') as patched_close:
+            communicator = ApplicationCommunicator(application, stream_scope(
+                query_string=f'access_token={self.access}'.encode()))
+            await communicator.send_input({'type': 'http.request'})
+            await communicator.receive_output()
+            await communicator.receive_output()
+            for _ in range(3):
+                self.assertEqual(
+                    (await communicator.receive_output())['body'],
+                    b': ping\n\n')
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait()
+
+        # Only the check when the stream opened, the recheck is not due.
+        self.assertEqual(patched_authenticate.call_count, 1)
+        self.assertEqual(patched_close.call_count, 2)
+
+    async def test_full_queue_asks_for_resync(self):
+        queue = asyncio.Queue(maxsize=1)
+        broker = events.Broker()
+        broker.subscribers[1] = {queue}
+
+        broker.deliver(1, {'type': 'recipe', 'action': 'saved', 'id': 1})
+        broker.deliver(1, {'type': 'recipe', 'action': 'saved', 'id': 2})
+
+        self.assertEqual(queue.get_nowait(), {'type': 'resync'})
+
+
+class PublishTests(TestCase):
+    """Test model changes publish events after commit"""
+
+    def setUp(self):
+        self.user = create_user()
+
+    def test_recipe_saved(self):
+        with patch.object(events.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe = Recipe.objects.create(
+                    user=self.user, title='Soup', time_minutes=5,
+                    price=Decimal('1.00'))
+
+        publish.assert_called_once_with(
+            self.user.pk, {'type': 'recipe', 'action': 'saved',
+                           'id': recipe.id})
+
+    def test_tag_deleted(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tag_id = tag.id
+
+        with patch.object(events.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                tag.delete()
+
+        publish.assert_called_once_with(
+            self.user.pk, {'type': 'tag', 'action': 'deleted', 'id': tag_id})
+
+    def test_not_published_before_commit(self):
+        with patch.object(events.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=False):
+                Tag.objects.create(user=self.user, name='Vegan')
+
+        publish.assert_not_called()
+
+
+@patch('recipe.events.psycopg2.connect')
+class PostgresListenerTests(TestCase):
+    """Test the NOTIFY listener survives losing its connection"""
+
+    def setUp(self):
+        self.broker = events.Broker()
+        self.queue = asyncio.Queue()
+        self.broker.subscribers[1] = {self.queue}
+        self.loop = MagicMock()
+        self.listener = events.PostgresListener(self.broker)
+
+    def test_reconnect_after_error(self, connect):
+        self.listener.start(self.loop)
+        connect.return_value.poll.side_effect = psycopg2.OperationalError
+
+        with self.assertLogs('recipe.events', 'WARNING'):
+            self.listener.read()
+
+        self.loop.remove_reader.assert_called_once()
+        delay, reconnect, *args = self.loop.call_later.call_args[0]
+        connect.return_value.poll.side_effect = None
+        reconnect(*args)
+        self.assertEqual(connect.call_count, 2)
+        cursor = connect.return_value.cursor.return_value.__enter__
+        cursor.return_value.execute.assert_called_with(
+            f'LISTEN {events.CHANNEL}')
+        self.assertEqual(self.loop.add_reader.call_count, 2)
+        self.assertEqual(self.queue.get_nowait(), {'type': 'resync'})
+
+    def test_retry_when_connect_fails(self, connect):
+        connect.side_effect = psycopg2.OperationalError
+
+        with self.assertLogs('recipe.events', 'WARNING'):
+            self.listener.start(self.loop)
+
+        self.loop.add_reader.assert_not_called()
+        self.loop.call_later.assert_called_once()
@@ -0,0 +1,54 @@
+"""
+Memory budgets of reading many recipes
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.testing import MemoryBudgetMixin
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SYNC_URL = reverse('recipe:sync')
+RECIPE_COUNT = 10000
+
+
+class RecipeMemoryBudgetTests(MemoryBudgetMixin, TestCase):
+    """Test reading 10k recipes stays within its memory budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        Recipe.objects.bulk_create(
+            Recipe(
+                user=cls.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('5.50'),
+                description='Sample description',
+            )
+            for i in range(RECIPE_COUNT)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_budget(self):
+        with self.assertMemoryBudget(40):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), RECIPE_COUNT)
+
+    def test_sync_page_budget(self):
+        # A sync page is the same size however many recipes there are.
+        with self.assertMemoryBudget(5):
+            res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -1,22 +1,33 @@
 """
 Tests for recipe APIs.
 """
+from datetime import timedelta
 from decimal import Decimal
 import email # noqa
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe
+from core.models import Recipe, Tag
+from recipe import images
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
 RECIPIES_URL = reverse('recipe:recipe-list')
+BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def detail_url(recipe_id):
@@ -26,6 +37,19 @@ def detail_url(recipe_id):
 
 
 # create  a general recipe creation method for different testing
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def create_image_file(size=(600, 400)):
+    """Create and return a temporary JPEG image file"""
+    image_file = tempfile.NamedTemporaryFile(suffix='.jpg')
+    Image.new('RGB', size, color='red').save(image_file, format='JPEG')
+    image_file.seek(0)
+    return image_file
+
+
 def create_recipe(user, **params):
     """Create and return a Sample Recipe"""
     defaults = {
@@ -214,3 +238,262 @@ class PrivateRecipeApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
         self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_batch_retrieve(self):
+        """Test retrieving several recipes by id in one request"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user, title='First')
+        r2 = create_recipe(user=self.user, title='Second')
+        r2.tag.add(tag)
+        create_recipe(user=self.user, title='Not asked for')
+
+        with self.assertNumQueries(2):
+            res = self.client.get(BATCH_URL, {'ids': f'{r2.id},{r1.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        serializer = RecipeDetailSerializer([r2, r1], many=True)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['results'][0]['tags'],
+                         [{'id': tag.id, 'name': 'Vegan'}])
+        self.assertEqual(res.data['missing'], [])
+
+    def test_batch_retrieve_reports_missing(self):
+        """Test unknown and other users' recipes are reported as missing"""
+        other_user = create_user(email='other@example.com',
+                                 password='password123')
+        mine = create_recipe(user=self.user)
+        theirs = create_recipe(user=other_user)
+
+        res = self.client.post(
+            BATCH_URL,
+            {'ids': [mine.id, theirs.id, 999999]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [mine.id])
+        self.assertEqual(res.data['missing'], [theirs.id, 999999])
+
+    @override_settings(RECIPE_BATCH_MAX_IDS=2)
+    def test_batch_retrieve_limit(self):
+        """Test asking for more ids than allowed returns an error"""
+        res = self.client.post(BATCH_URL, {'ids': [1, 2, 3]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_retrieve_invalid_ids(self):
+        """Test malformed ids return an error"""
+        res = self.client.get(BATCH_URL, {'ids': '1,abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_retrieve_since(self):
+        """Test only recipes changed after the watermark are returned"""
+        old = create_recipe(user=self.user, title='Old')
+        new = create_recipe(user=self.user, title='New')
+        watermark = timezone.now() - timedelta(minutes=5)
+        Recipe.objects.filter(id=old.id).update(
+            updated_at=watermark - timedelta(minutes=5))
+
+        res = self.client.get(BATCH_URL, {
+            'ids': f'{old.id},{new.id}',
+            'since': watermark.isoformat(),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [new.id])
+        self.assertEqual(res.data['unchanged'], [old.id])
+        new.refresh_from_db()
+        self.assertEqual(res.data['version'], new.updated_at)
+
+    def test_list_renders_tags(self):
+        """Test the recipe list includes each recipe's tags"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPIES_URL)
+
+        self.assertEqual(res.data[0]['tags'],
+                         [{'id': tag.id, 'name': 'Vegan'}])
+
+    @override_settings(RECIPE_DENORMALIZED_TAGS=False)
+    def test_list_renders_tags_from_join(self):
+        """Test the recipe list can read tags from the join table"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+
+        res = self.client.get(RECIPIES_URL)
+
+        self.assertEqual(res.data[0]['tags'],
+                         [{'id': tag.id, 'name': 'Vegan'}])
+
+    def test_filter_by_tags(self):
+        """Test filtering recipes by tags"""
+        r1 = create_recipe(user=self.user, title='Thai curry')
+        r2 = create_recipe(user=self.user, title='Aubergine tahini')
+        r3 = create_recipe(user=self.user, title='Fish and chips')
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Vegetarian')
+        r1.tag.add(tag1)
+        r2.tag.add(tag1, tag2)
+
+        for denormalized in (True, False):
+            with self.settings(RECIPE_DENORMALIZED_TAGS=denormalized):
+                res = self.client.get(
+                    RECIPIES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+            ids = [r['id'] for r in res.data]
+            self.assertEqual(ids, [r2.id, r1.id])
+            self.assertNotIn(r3.id, ids)
+
+
+@override_settings(RECIPE_THUMBNAIL_WORKERS=0)
+class ImageUploadTests(TestCase):
+    """Tests for the image upload API"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = self.settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_upload_image(self):
+        """Test uploading an image stores it and makes thumbnails"""
+        with create_image_file() as image_file:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    image_upload_url(self.recipe.id),
+                    {'image': image_file},
+                    format='multipart',
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertIn('image', res.data)
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(set(res.data['thumbnails']), {'128', '512'})
+        name = images.thumbnail_name(self.recipe.image.name, 128)
+        with Image.open(os.path.join(self.media_root, name)) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 85))
+
+    def test_same_image_stored_once(self):
+        """Test identical uploads share one stored file"""
+        other = create_recipe(user=self.user)
+        for recipe in (self.recipe, other):
+            with create_image_file() as image_file:
+                self.client.post(
+                    image_upload_url(recipe.id),
+                    {'image': image_file},
+                    format='multipart',
+                )
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+
+    def test_upload_image_bad_request(self):
+        """Test uploading an invalid image"""
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': 'notanimage'},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_thumbnail_served_with_cache_headers(self):
+        """Test thumbnails are served as immutable, made on demand"""
+        with create_image_file() as image_file:
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        url = res.data['thumbnails']['512']
+
+        res = APIClient().get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        etag = res['ETag']
+        b''.join(res.streaming_content)
+
+        res = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_thumbnail_unknown_size(self):
+        """Test only configured thumbnail sizes are served"""
+        url = reverse('recipe:thumbnail', args=['0' * 64 + '.jpeg', 77])
+
+        res = APIClient().get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_upload_decompression_bomb(self):
+        """Test images too large to decode are refused"""
+        with create_image_file() as image_file, \
+                patch('PIL.Image.MAX_IMAGE_PIXELS', 1000):
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_THUMBNAIL_WORKERS=1)
+    def test_missing_thumbnail_queued(self):
+        """Test a thumbnail not made yet is queued once, not made inline"""
+        with create_image_file() as image_file:
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        url = res.data['thumbnails']['512']
+        future = Future()
+        executor = MagicMock()
+        executor.submit.return_value = future
+
+        with patch('recipe.images.get_executor', return_value=executor):
+            first = APIClient().get(url)
+            second = APIClient().get(url)
+        with self.assertLogs('recipe.images', 'ERROR'):
+            future.set_exception(OSError('No space left on device'))
+
+        for res in (first, second):
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(res['Cache-Control'], 'no-store')
+            self.assertIn('Retry-After', res)
+        executor.submit.assert_called_once()
+        self.assertEqual(images._pending, set())
+
+    @override_settings(RECIPE_THUMBNAIL_WORKERS=1)
+    def test_thumbnails_made_in_pool(self):
+        """Test thumbnails can be made by the process pool"""
+        with create_image_file() as image_file:
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        self.recipe.refresh_from_db()
+
+        future = images.schedule_thumbnails(self.recipe.image.name)
+        future.result(timeout=60)
+
+        name = images.thumbnail_name(self.recipe.image.name, 512)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
@@ -0,0 +1,185 @@
+"""
+Tests for the recipe revision history
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeRevision
+from recipe import revisions
+
+RECIPES_URL = reverse('recipe:recipe-list')
+LONG_DESCRIPTION = ' '.join(f'Step {i}: stir well.' for i in range(200))
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def history_url(recipe_id):
+    return reverse('recipe:recipe-history', args=[recipe_id])
+
+
+def revert_url(recipe_id):
+    return reverse('recipe:recipe-revert', args=[recipe_id])
+
+
+class TextDeltaTests(SimpleTestCase):
+    """Test description deltas"""
+
+    def test_round_trip(self):
+        pairs = [
+            ('', 'Boil water.'),
+            ('Boil water.', ''),
+            ('Boil the water, add  salt.', 'Boil water, then add salt.\n'),
+            (LONG_DESCRIPTION, LONG_DESCRIPTION.replace('Step 99', 'Go')),
+        ]
+        for old, new in pairs:
+            delta = revisions.text_delta(old, new)
+            self.assertEqual(revisions.apply_delta(old, delta), new)
+
+    def test_delta_size_follows_change(self):
+        new = LONG_DESCRIPTION.replace('Step 99:', 'Step 99, gently:')
+
+        delta = revisions.text_delta(LONG_DESCRIPTION, new)
+
+        self.assertLess(len(str(delta)), 100)
+
+
+class RecipeRevisionApiTests(TestCase):
+    """Test the history and revert actions"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 20,
+            'price': Decimal('4.50'),
+            'description': LONG_DESCRIPTION,
+        })
+        self.recipe = Recipe.objects.get(id=res.data['id'])
+
+    def test_create_records_keyframe(self):
+        revision = RecipeRevision.objects.get(recipe=self.recipe)
+
+        self.assertEqual(revision.number, 1)
+        self.assertTrue(revision.keyframe)
+        self.assertEqual(revision.data['description'], LONG_DESCRIPTION)
+
+    def test_update_stores_changes_only(self):
+        description = LONG_DESCRIPTION.replace('Step 5:', 'Step 5, slowly:')
+        self.client.patch(detail_url(self.recipe.id), {
+            'title': 'Tomato soup',
+            'description': description,
+        })
+
+        revision = RecipeRevision.objects.get(recipe=self.recipe, number=2)
+        self.assertFalse(revision.keyframe)
+        self.assertEqual(revision.changed, ['title', 'description'])
+        self.assertEqual(revision.data['title'], 'Tomato soup')
+        self.assertLess(len(str(revision.data)), 100)
+
+    def test_update_without_changes_not_recorded(self):
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Soup'})
+
+        self.assertEqual(self.recipe.revisions.count(), 1)
+
+    def test_update_records_base_of_older_recipe(self):
+        """Test a recipe without revisions keeps its row before updates"""
+        self.recipe.revisions.all().delete()
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Stew'})
+
+        base = RecipeRevision.objects.get(recipe=self.recipe, number=1)
+        self.assertTrue(base.keyframe)
+        self.assertEqual(base.data['title'], 'Soup')
+        self.assertEqual(revisions.rebuild(self.recipe)[1]['title'], 'Stew')
+        self.assertEqual(self.recipe.revisions.count(), 2)
+
+    def test_stale_instance_records_saved_row(self):
+        """Test a late revision records the row, not an older instance"""
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Stew'})
+
+        number = revisions.record_revision(stale)
+
+        self.assertEqual(number, 2)
+        self.assertEqual(self.recipe.revisions.count(), 2)
+        self.assertEqual(revisions.rebuild(stale)[1]['title'], 'Stew')
+
+    def test_history(self):
+        self.client.patch(detail_url(self.recipe.id), {'time_minutes': 25})
+
+        res = self.client.get(history_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['number'] for r in res.data], [2, 1])
+        self.assertEqual(res.data[0]['changed'], ['time_minutes'])
+
+    def test_history_revision(self):
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Stew'})
+
+        res = self.client.get(history_url(self.recipe.id), {'revision': 1})
+
+        self.assertEqual(res.data['revision'], 1)
+        self.assertEqual(res.data['title'], 'Soup')
+        self.assertEqual(res.data['description'], LONG_DESCRIPTION)
+
+    def test_history_unknown_revision(self):
+        res = self.client.get(history_url(self.recipe.id), {'revision': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_revert(self):
+        self.client.patch(detail_url(self.recipe.id), {
+            'title': 'Stew',
+            'description': 'Just stew it.',
+            'price': Decimal('6.00'),
+        })
+
+        res = self.client.post(revert_url(self.recipe.id), {'revision': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Soup')
+        self.assertEqual(self.recipe.description, LONG_DESCRIPTION)
+        self.assertEqual(self.recipe.price, Decimal('4.50'))
+        self.assertEqual(self.recipe.revisions.count(), 3)
+
+    def test_revert_unknown_revision(self):
+        res = self.client.post(revert_url(self.recipe.id), {'revision': 7})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipe(self):
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(history_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RECIPE_REVISION_KEYFRAME_INTERVAL=3)
+    def test_keyframes_rebuild(self):
+        titles = ['Soup']
+        for i in range(6):
+            titles.append(f'Soup {i}')
+            self.client.patch(detail_url(self.recipe.id), {
+                'title': titles[-1],
+                'description': f'{LONG_DESCRIPTION} {i}',
+            })
+
+        keyframes = self.recipe.revisions.filter(
+            keyframe=True).values_list('number', flat=True)
+        self.assertEqual(sorted(keyframes), [1, 4, 7])
+        for number, title in enumerate(titles, 1):
+            state = revisions.rebuild(self.recipe, number)[1]
+            self.assertEqual(state['title'], title)
@@ -0,0 +1,216 @@
+"""
+Tests for public links to shared recipes
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import archive
+from core.models import Recipe, Tag
+from core.sharding import shard_for_user
+from core.testing import CachingProxy
+from recipe import sharing
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def share_url(recipe_id):
+    return reverse('recipe:recipe-share', args=[recipe_id])
+
+
+def shared_url(slug):
+    return reverse('recipe:shared', args=[slug])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'Sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(CDN_PURGER='core.testing.purge_proxies')
+class RecipeSharingTests(TestCase):
+    """Test sharing recipes and serving their public pages"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.user)
+        self.proxy = CachingProxy(APIClient())
+
+    def share(self, recipe=None):
+        recipe = recipe or self.recipe
+        res = self.client.post(share_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['share_slug']
+
+    def test_share_recipe(self):
+        res = self.client.post(share_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        slug = res.data['share_slug']
+        self.assertGreaterEqual(len(slug), 22)
+        self.assertTrue(res.data['url'].endswith(shared_url(slug)))
+        self.assertEqual(self.share(), slug)
+
+    def test_public_page(self):
+        self.recipe.tag.add(Tag.objects.create(user=self.user, name='Vegan'))
+        slug = self.share()
+
+        res = APIClient().get(shared_url(slug))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {
+            'title': 'Sample recipe',
+            'description': 'Sample description',
+            'time_minutes': 22,
+            'price': '5.25',
+            'link': '',
+            'tags': ['Vegan'],
+        })
+        self.assertIn('public', res['Cache-Control'])
+        self.assertIn('s-maxage=86400', res['Cache-Control'])
+        self.assertEqual(
+            res['Surrogate-Key'], f'share-{slug} user-{self.user.id}')
+        self.assertTrue(res['ETag'].startswith('"'))
+
+    def test_not_modified(self):
+        slug = self.share()
+        etag = APIClient().get(shared_url(slug))['ETag']
+
+        res = APIClient().get(shared_url(slug), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_private_recipe_not_found(self):
+        res = APIClient().get(shared_url(sharing.new_slug()))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('public', res['Cache-Control'])
+        self.assertIn('s-maxage=300', res['Cache-Control'])
+
+    def test_restore_purges_not_found(self):
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_user(self.user)
+        missing = self.proxy.get(shared_url(slug))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.restore_user(self.user.pk)
+        res = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(missing['Surrogate-Key'], f'share-{slug}')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.proxy.origin_requests, 3)
+
+    def test_other_users_recipe_not_shared(self):
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        recipe = create_recipe(other)
+
+        res = self.client.post(share_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_proxy_absorbs_reads(self):
+        slug = self.share()
+
+        for _ in range(100):
+            res = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.proxy.origin_requests, 1)
+
+    def test_expired_page_revalidated(self):
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+        self.proxy.advance(24 * 3600)
+
+        res = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.proxy.origin_requests, 2)
+
+    def test_edit_purges(self):
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(self.recipe.id), {'title': 'New'})
+        res = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(res.json()['title'], 'New')
+        self.assertEqual(self.proxy.origin_requests, 2)
+
+    def test_tag_rename_purges(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tag.add(tag)
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = 'Vegetarian'
+            tag.save()
+        res = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(res.json()['tags'], ['Vegetarian'])
+
+    def test_unrelated_edit_keeps_page(self):
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user, title='Other')
+        self.proxy.get(shared_url(slug))
+
+        self.assertEqual(self.proxy.origin_requests, 1)
+
+    def test_unshare(self):
+        slug = self.share()
+        self.proxy.get(shared_url(slug))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(share_url(self.recipe.id))
+        page = self.proxy.get(shared_url(slug))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(page.status_code, status.HTTP_404_NOT_FOUND)
+        self.recipe.refresh_from_db()
+        self.assertIsNone(self.recipe.share_slug)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_a', 'shard_b'])
+class ShardedSharingTests(TestCase):
+    """Test public pages are found on any shard"""
+    databases = {'default', 'shard_a', 'shard_b'}
+
+    def test_find_shared_on_every_shard(self):
+        cache.clear()
+        found = set()
+        for i in range(12):
+            user = get_user_model().objects.create_user(
+                f'user{i}@example.com', 'testpass123')
+            recipe = create_recipe(user, share_slug=sharing.new_slug())
+
+            res = APIClient().get(shared_url(recipe.share_slug))
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            found.add(shard_for_user(user.id))
+        self.assertEqual(found, {'default', 'shard_a', 'shard_b'})
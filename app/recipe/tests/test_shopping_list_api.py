@@ -0,0 +1,135 @@
+"""
+Tests for the shopping list API.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeIngredient
+
+SHOPPING_LIST_URL = reverse('recipe:shopping-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicShoppingListApiTests(TestCase):
+    """Test unauthenticated shopping list requests"""
+
+    def test_auth_required(self):
+        res = APIClient().post(SHOPPING_LIST_URL, {}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateShoppingListApiTests(TestCase):
+    """Test authenticated shopping list requests"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.flour = Ingredient.objects.create(user=self.user, name='Flour')
+        self.milk = Ingredient.objects.create(user=self.user, name='Milk')
+        self.eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+
+    def add(self, recipe, ingredient, quantity, unit):
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=ingredient,
+            quantity=Decimal(quantity),
+            unit=unit,
+        )
+
+    def test_combines_and_converts(self):
+        """Test quantities are scaled, converted and summed"""
+        pancakes = create_recipe(self.user, title='Pancakes')
+        self.add(pancakes, self.flour, '250', 'g')
+        self.add(pancakes, self.milk, '2', 'cups')
+        self.add(pancakes, self.eggs, '2', 'pcs')
+        bread = create_recipe(self.user, title='Bread')
+        self.add(bread, self.flour, '0.5', 'kg')
+        self.add(bread, self.milk, '100', 'ml')
+
+        res = self.client.post(SHOPPING_LIST_URL, {'recipes': [
+            {'id': pancakes.id, 'servings': 2},
+            {'id': bread.id},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['ingredients'], [
+            {'ingredient': self.eggs.id, 'name': 'Eggs',
+             'quantity': 4.0, 'unit': 'piece'},
+            {'ingredient': self.flour.id, 'name': 'Flour',
+             'quantity': 1.0, 'unit': 'kg'},
+            {'ingredient': self.milk.id, 'name': 'Milk',
+             'quantity': 1.046, 'unit': 'l'},
+        ])
+
+    def test_different_dimensions_kept_apart(self):
+        """Test mass and volume of one ingredient are not added up"""
+        recipe = create_recipe(self.user)
+        self.add(recipe, self.flour, '100', 'g')
+        self.add(recipe, self.flour, '1', 'tbsp')
+
+        res = self.client.post(SHOPPING_LIST_URL, {'recipes': [
+            {'id': recipe.id},
+        ]}, format='json')
+
+        self.assertEqual(
+            [(i['quantity'], i['unit']) for i in res.data['ingredients']],
+            [(100.0, 'g'), (14.787, 'ml')],
+        )
+
+    def test_other_users_recipes_ignored(self):
+        """Test recipes of other users are left out"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123')
+        recipe = create_recipe(other)
+        self.add(recipe, self.flour, '100', 'g')
+
+        res = self.client.post(SHOPPING_LIST_URL, {'recipes': [
+            {'id': recipe.id},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['ingredients'], [])
+
+    def test_single_query(self):
+        """Test the list is built from one query"""
+        recipes = [create_recipe(self.user) for _ in range(50)]
+        for recipe in recipes:
+            self.add(recipe, self.flour, '100', 'g')
+            self.add(recipe, self.milk, '1', 'cup')
+
+        with self.assertNumQueries(1):
+            res = self.client.post(SHOPPING_LIST_URL, {'recipes': [
+                {'id': recipe.id, 'servings': 1.5} for recipe in recipes
+            ]}, format='json')
+
+        self.assertEqual(res.data['ingredients'][0]['quantity'], 7.5)
+        self.assertEqual(res.data['ingredients'][0]['unit'], 'kg')
+
+    def test_invalid_servings(self):
+        """Test negative servings return an error"""
+        res = self.client.post(SHOPPING_LIST_URL, {'recipes': [
+            {'id': 1, 'servings': -1},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
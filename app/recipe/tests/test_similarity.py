@@ -0,0 +1,230 @@
+"""
+Tests for the similar recipes index and API.
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class SimilarityTestCase(TestCase):
+    """Test case with a temporary index directory"""
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        index_settings = self.settings(SIMILARITY_INDEX_DIR=self.index_dir)
+        index_settings.enable()
+        self.addCleanup(index_settings.disable)
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+
+class SimilarityIndexTests(SimilarityTestCase):
+    """Test building and updating the index"""
+
+    def test_tokenize(self):
+        self.assertEqual(
+            similarity.tokenize('The Best-Ever Thai curry, in 20 mins!'),
+            ['best', 'ever', 'thai', 'curry', '20', 'mins'],
+        )
+
+    def test_index_matches_exact_cosine(self):
+        """Test the stored weights give the exact cosine similarity"""
+        create_recipe(self.user, title='Thai green curry',
+                      description='Coconut curry with chicken')
+        create_recipe(self.user, title='Red curry',
+                      description='Coconut curry with beef')
+        create_recipe(self.user, title='Apple pie')
+
+        index = similarity.build_index(self.user.id)
+
+        lengths = np.diff(index.indptr)
+        dense = np.zeros((len(index.ids), len(index.vocabulary)))
+        dense[np.repeat(np.arange(len(index.ids)), lengths),
+              index.indices] = index.weights
+        np.testing.assert_allclose(np.linalg.norm(dense, axis=1), 1,
+                                   rtol=1e-5)
+        expected = dense @ dense[0]
+        result = dict(index.similar(int(index.ids[0]), 5))
+        self.assertAlmostEqual(result[int(index.ids[1])], expected[1],
+                               places=3)
+        self.assertNotIn(int(index.ids[2]), result)
+
+    def test_index_memory_mapped(self):
+        """Test a saved index is read back memory mapped"""
+        create_recipe(self.user, title='Soup')
+        similarity.build_index(self.user.id)
+
+        index = similarity.load_index(self.user.id)
+
+        self.assertIsInstance(index.weights, np.memmap)
+
+    def test_index_picks_up_changes(self):
+        """Test changed, new and deleted recipes reach the index"""
+        curry = create_recipe(self.user, title='Thai curry')
+        pie = create_recipe(self.user, title='Apple pie')
+        similarity.build_index(self.user.id)
+
+        pie.title = 'Thai curry pie'
+        pie.save()
+        soup = create_recipe(self.user, title='Thai soup')
+        self.assertEqual(
+            [id for id, _ in similarity.similar_recipes(
+                self.user.id, curry.id, 5)],
+            [pie.id, soup.id],
+        )
+
+        pie.delete()
+        self.assertEqual(
+            [id for id, _ in similarity.similar_recipes(
+                self.user.id, curry.id, 5)],
+            [soup.id],
+        )
+
+    @override_settings(RECIPE_SYNC_LAG=60)
+    def test_index_picks_up_late_commits(self):
+        """Test a recipe committed after a later one still reaches it"""
+        curry = create_recipe(self.user, title='Thai curry')
+        similarity.build_index(self.user.id)
+        # Written before the curry was, committed after the build.
+        soup = create_recipe(self.user, title='Thai soup')
+        Recipe.objects.filter(id=soup.id).update(
+            updated_at=curry.updated_at - timedelta(seconds=1))
+
+        self.assertEqual(
+            [id for id, _ in similarity.similar_recipes(
+                self.user.id, curry.id, 5)],
+            [soup.id],
+        )
+
+    @override_settings(SIMILARITY_KEEP_BUILDS=2)
+    def test_previous_builds_kept(self):
+        """Test a new build keeps the last few and newer ones"""
+        create_recipe(self.user, title='Soup')
+        builds = [similarity.build_index(self.user.id).build
+                  for _ in range(4)]
+        directory = similarity.index_dir(self.user.id)
+        newer = '9' * 28
+        os.makedirs(os.path.join(directory, newer))
+        index = similarity.load_index(self.user.id)
+
+        similarity.save_index(index)
+
+        self.assertEqual(
+            sorted(entry for entry in os.listdir(directory)
+                   if entry != 'index.json'),
+            [builds[2], builds[3], index.build, newer])
+
+    @override_settings(SIMILARITY_IN_BACKGROUND=True)
+    def test_first_build_in_background(self):
+        """Test requests do not wait for a first build"""
+        curry = create_recipe(self.user, title='Thai curry')
+        soup = create_recipe(self.user, title='Thai soup')
+
+        with patch.object(similarity, '_executor') as executor, \
+                patch.object(similarity, '_pending', set()):
+            with self.assertRaises(similarity.IndexNotReady):
+                similarity.similar_recipes(self.user.id, curry.id, 5)
+            with self.assertRaises(similarity.IndexNotReady):
+                similarity.similar_recipes(self.user.id, curry.id, 5)
+
+        executor.submit.assert_called_once_with(
+            similarity._write_in_thread, self.user.id, None)
+        with patch('recipe.similarity.connections'):
+            similarity._write_in_thread(self.user.id, None)
+        self.assertEqual(
+            [id for id, _ in similarity.similar_recipes(
+                self.user.id, curry.id, 5)],
+            [soup.id])
+
+    def test_build_command(self):
+        """Test the command rebuilds the index of every user"""
+        create_recipe(self.user, title='Soup')
+
+        call_command('build_similarity_index', stdout=StringIO())
+
+        self.assertIsNotNone(similarity.load_index(self.user.id))
+
+
+class SimilarRecipesApiTests(SimilarityTestCase):
+    """Test the similar recipes API"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_similar_recipes(self):
+        """Test the most similar recipes come first"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        curry = create_recipe(self.user, title='Thai green curry',
+                              description='Coconut and lemongrass')
+        curry.tag.add(tag)
+        close = create_recipe(self.user, title='Thai red curry',
+                              description='Coconut milk')
+        close.tag.add(tag)
+        far = create_recipe(self.user, title='Green salad')
+        create_recipe(self.user, title='Apple pie')
+
+        res = self.client.get(similar_url(curry.id), {'k': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [close.id, far.id])
+        self.assertGreater(res.data[0]['score'], res.data[1]['score'])
+        self.assertEqual(res.data[0]['tags'],
+                         [{'id': tag.id, 'name': 'Vegan'}])
+
+    @override_settings(SIMILARITY_IN_BACKGROUND=True)
+    def test_similar_while_indexing(self):
+        recipe = create_recipe(self.user, title='Thai curry')
+
+        with patch.object(similarity, '_executor'), \
+                patch.object(similarity, '_pending', set()):
+            res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+
+    def test_similar_limited_to_user(self):
+        """Test other users' recipes are not reachable"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123')
+        recipe = create_recipe(other, title='Thai curry')
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,194 @@
+"""
+Tests for the recipe sync API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeTombstone, Tag
+from recipe import sync
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncApiTests(TestCase):
+    """Test unauthenticated sync requests"""
+
+    def test_auth_required(self):
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TestCase):
+    """Test authenticated sync requests"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_first_sync_returns_everything(self):
+        """Test syncing without a cursor returns all recipes"""
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        create_recipe(get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123'))
+        RecipeTombstone.objects.create(user=self.user, recipe_id=999)
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['changed']],
+                         [r1.id, r2.id])
+        self.assertEqual(res.data['deleted'], [])
+        self.assertFalse(res.data['has_more'])
+
+    def test_sync_returns_only_changes(self):
+        """Test a cursor only returns what changed after it"""
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        r3 = create_recipe(self.user)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        r1.title = 'Changed'
+        r1.save()
+        deleted_id = r2.id
+        r2.delete()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r3.tag.add(tag)
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual([r['title'] for r in res.data['changed']],
+                         ['Changed', 'Sample recipe'])
+        self.assertEqual(res.data['changed'][1]['tags'][0]['name'], 'Vegan')
+        self.assertEqual(res.data['deleted'], [deleted_id])
+
+        res = self.client.get(SYNC_URL, {'since': res.data['cursor']})
+
+        self.assertEqual(res.data['changed'], [])
+        self.assertEqual(res.data['deleted'], [])
+
+    @override_settings(RECIPE_SYNC_PAGE_SIZE=2)
+    def test_sync_pages(self):
+        """Test changes are returned in bounded pages"""
+        recipes = [create_recipe(self.user) for _ in range(5)]
+
+        seen = []
+        cursor = None
+        for expected_more in (True, True, False):
+            params = {'since': cursor} if cursor else {}
+            res = self.client.get(SYNC_URL, params)
+            self.assertLessEqual(len(res.data['changed']), 2)
+            self.assertEqual(res.data['has_more'], expected_more)
+            seen += [r['id'] for r in res.data['changed']]
+            cursor = res.data['cursor']
+
+        self.assertEqual(seen, [r.id for r in recipes])
+
+    def test_sync_invalid_cursor(self):
+        """Test a tampered cursor returns an error"""
+        res = self.client.get(SYNC_URL, {'since': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_tag_marks_recipes_changed(self):
+        """Test deleting a tag shows up as a change on its recipes"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tag.add(tag)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        tag.delete()
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.data['changed'][0]['id'], recipe.id)
+        self.assertEqual(res.data['changed'][0]['tags'], [])
+
+    @override_settings(RECIPE_SYNC_LAG=60)
+    def test_late_commit_synced(self):
+        """Test a change committed after a sync, but dated before, is sent"""
+        recipe = create_recipe(self.user)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+        late = create_recipe(self.user, title='Late')
+        Recipe.objects.filter(id=late.id).update(
+            updated_at=timezone.now() - timedelta(seconds=30))
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertIn(late.id, [r['id'] for r in res.data['changed']])
+        self.assertIn(recipe.id, [r['id'] for r in res.data['changed']])
+        self.assertFalse(res.data['reset'])
+
+    @override_settings(RECIPE_SYNC_LAG=60)
+    def test_late_tombstone_synced(self):
+        recipe = create_recipe(self.user)
+        deleted_id = recipe.id
+        cursor = self.client.get(SYNC_URL).data['cursor']
+        recipe.delete()
+        RecipeTombstone.objects.filter(recipe_id=deleted_id).update(
+            deleted_at=timezone.now() - timedelta(seconds=30))
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.data['deleted'], [deleted_id])
+
+    def test_old_cursor_resyncs(self):
+        """Test a cursor older than the tombstones starts over"""
+        recipe = create_recipe(self.user)
+        with self.settings(RECIPE_SYNC_LAG=100 * 24 * 3600):
+            cursor = self.client.get(SYNC_URL).data['cursor']
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertTrue(res.data['reset'])
+        self.assertEqual([r['id'] for r in res.data['changed']], [recipe.id])
+        res = self.client.get(SYNC_URL, {'since': res.data['cursor']})
+        self.assertFalse(res.data['reset'])
+
+    def test_legacy_cursor_resyncs(self):
+        recipe = create_recipe(self.user)
+        cursor = signing.dumps({'r': None, 't': 0}, salt=sync.SALT)
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['reset'])
+        self.assertEqual([r['id'] for r in res.data['changed']], [recipe.id])
+
+    def test_purge_tombstones(self):
+        old = RecipeTombstone.objects.create(user=self.user, recipe_id=1)
+        RecipeTombstone.objects.filter(id=old.id).update(
+            deleted_at=timezone.now() - timedelta(days=91))
+        recent = RecipeTombstone.objects.create(user=self.user, recipe_id=2)
+
+        call_command('purge_tombstones', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            list(RecipeTombstone.objects.values_list('id', flat=True)),
+            [recent.id])
@@ -0,0 +1,207 @@
+"""
+Tests for the tag analytics
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, TagUsage, TagUsers
+from recipe import analytics
+from recipe.sketches import CountMinSketch, HyperLogLog
+
+TRENDING_URL = reverse('recipe:tag-trending')
+
+
+class SketchAccuracyTests(SimpleTestCase):
+    """Test the sketches against exact counts"""
+
+    def test_hyperloglog(self):
+        for exact in (10, 1000, 50000):
+            sketch = HyperLogLog()
+            for i in range(exact):
+                sketch.add(i)
+                sketch.add(i)
+
+            # 2.3% standard error; allow three of them.
+            self.assertAlmostEqual(
+                sketch.count(), exact, delta=max(exact * 0.07, 1))
+
+    def test_hyperloglog_merge(self):
+        a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            (a if i % 2 else b).add(i)
+            both.add(i)
+
+        a.merge(HyperLogLog.from_bytes(b.to_bytes()))
+
+        self.assertEqual(a.count(), both.count())
+
+    def test_count_min(self):
+        rng = random.Random(0)
+        exact = {}
+        sketch = CountMinSketch()
+        for _ in range(50000):
+            name = f'tag{int(rng.paretovariate(1.2))}'
+            exact[name] = exact.get(name, 0) + 1
+            sketch.add(name)
+
+        total = sum(exact.values())
+        for name, count in exact.items():
+            estimate = sketch.query(name)
+            self.assertGreaterEqual(estimate, count)
+            self.assertLessEqual(estimate, count + total * 2 / 2048)
+
+    def test_count_min_merge(self):
+        a, b = CountMinSketch(), CountMinSketch()
+        a.add('vegan', 3)
+        b.add('vegan', 4)
+
+        a.merge(CountMinSketch.from_bytes(b.to_bytes()))
+
+        self.assertEqual(a.query('vegan'), 7)
+
+
+def link_tags(user, names):
+    recipe = Recipe.objects.create(
+        user=user, title='Sample', time_minutes=5, price=Decimal('5.00'))
+    tags = [Tag.objects.create(user=user, name=name) for name in names]
+    recipe.tag.add(*tags)
+
+
+class TagAnalyticsTests(TestCase):
+    """Test counting tag uses and the trending endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        analytics.tag_analytics.flush()
+        self.users = [
+            get_user_model().objects.create_user(
+                f'user{i}@example.com', 'testpass123')
+            for i in range(30)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_trending_matches_exact_counts(self):
+        rng = random.Random(1)
+        names = ['Vegan', 'Dessert', 'Quick', 'Spicy']
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                link_tags(user, rng.sample(names, rng.randint(1, 3)))
+        analytics.tag_analytics.flush()
+
+        exact = {
+            row['name'].lower(): row
+            for row in Tag.objects.values('name').annotate(
+                uses=Count('recipe'),
+                users=Count('user', distinct=True),
+            )
+        }
+        res = self.client.get(TRENDING_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), len(names))
+        for tag in res.data:
+            self.assertEqual(tag['uses'], exact[tag['name']]['uses'])
+            self.assertEqual(tag['users'], exact[tag['name']]['users'])
+        uses = [tag['uses'] for tag in res.data]
+        self.assertEqual(uses, sorted(uses, reverse=True))
+
+    def test_reverse_links_counted(self):
+        recipes = [
+            Recipe.objects.create(
+                user=self.users[0], title='Sample', time_minutes=5,
+                price=Decimal('5.00'))
+            for _ in range(3)
+        ]
+        tag = Tag.objects.create(user=self.users[0], name='Vegan')
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.recipe_set.add(*recipes)
+        analytics.tag_analytics.flush()
+
+        res = self.client.get(TRENDING_URL)
+
+        self.assertEqual(res.data, [{
+            'name': 'vegan', 'uses': 3, 'previous_uses': 0, 'users': 1}])
+
+    def test_workers_merge(self):
+        when = timezone.now()
+        first, second = analytics.TagAnalytics(), analytics.TagAnalytics()
+        first.record(self.users[0].id, ['Vegan'], when=when)
+        second.record(self.users[1].id, ['vegan'], when=when)
+        second.record(self.users[1].id, ['Dessert'], when=when)
+
+        first.flush()
+        second.flush()
+
+        usage = TagUsage.objects.get()
+        self.assertEqual(usage.top, {'vegan': 2, 'dessert': 1})
+        users = TagUsers.objects.get(name='vegan')
+        self.assertEqual(HyperLogLog.from_bytes(users.registers).count(), 2)
+
+    def test_trending_by_growth(self):
+        tracker = analytics.TagAnalytics()
+        earlier = timezone.now() - timedelta(days=1, hours=1)
+        for user in self.users[:10]:
+            tracker.record(user.id, ['Soup'], when=earlier)
+        for user in self.users[:5]:
+            tracker.record(user.id, ['Soup', 'Salad'], when=timezone.now())
+        tracker.flush()
+
+        res = self.client.get(TRENDING_URL)
+
+        self.assertEqual([t['name'] for t in res.data], ['salad', 'soup'])
+        self.assertEqual(res.data[1]['previous_uses'], 10)
+
+    def test_trending_reads_constant_queries(self):
+        tracker = analytics.TagAnalytics()
+        for user in self.users:
+            tracker.record(user.id, [f'tag{user.id}', 'Vegan'])
+        tracker.flush()
+
+        with self.assertNumQueries(2, using='default'):
+            tags = analytics.trending(10)
+        self.assertEqual(tags[0], {
+            'name': 'vegan', 'uses': 30, 'previous_uses': 0, 'users': 30})
+
+    def test_failed_merge_kept(self):
+        tracker = analytics.TagAnalytics()
+        tracker.record(self.users[0].id, ['Vegan'])
+
+        with patch('recipe.analytics.merge_into_db',
+                   side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                tracker.flush()
+        tracker.record(self.users[1].id, ['Vegan'])
+        tracker.flush()
+
+        self.assertEqual(TagUsage.objects.get().top, {'vegan': 2})
+        users = TagUsers.objects.get(name='vegan')
+        self.assertEqual(HyperLogLog.from_bytes(users.registers).count(), 2)
+
+    @override_settings(TAG_ANALYTICS_IN_BACKGROUND=True,
+                       TAG_ANALYTICS_FLUSH_EVENTS=1)
+    def test_merged_in_background(self):
+        tracker = analytics.TagAnalytics()
+
+        with patch('recipe.analytics.merge_into_db') as patched_merge:
+            tracker.record(self.users[0].id, ['Vegan'])
+            self.assertIsNotNone(tracker.thread)
+
+            give_up = time.monotonic() + 5
+            while not patched_merge.called and time.monotonic() < give_up:
+                time.sleep(0.01)
+        self.assertTrue(patched_merge.called)
+        self.assertEqual(tracker.buckets, {})
@@ -13,7 +13,8 @@ from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
 
-def create_user(email = 'user@example.com', password ='testpass123'):
+
+def create_user(email='user@example.com', password='testpass123'):
     """Create a new user and return it"""
     return get_user_model().objects.create_user(email=email, password=password)
 
@@ -30,7 +31,7 @@ class PublicTagsApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
-    
+
 class PrivateTagsApiTests(TestCase):
     """Test authenticated API requests"""
 
@@ -39,17 +40,27 @@ class PrivateTagsApiTests(TestCase):
         self.client = APIClient()
         self.client.force_authenticate(self.user)
 
-
-
     def test_retrive_tags(self):
         """Test retriving list of Tags"""
-        Tag.objects.create(user=self.user, name = 'Vegan')
-        Tag.objects.create(user=self.user, name = 'Dessert')
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
 
         res = self.client.get(TAGS_URL)
 
-        tags = Tag.
-
+        tags = Tag.objects.all().order_by('-name')
+        serializer = TagSerializer(tags, many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, serializer.data)
 
+    def test_tags_limited_to_user(self):
+        """Test list of tags is limited to authenticated user"""
+        other = create_user(email='other@example.com')
+        Tag.objects.create(user=other, name='Fruity')
+        tag = Tag.objects.create(user=self.user, name='Comfort Food')
 
+        res = self.client.get(TAGS_URL)
 
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(res.data[0]['id'], tag.id)
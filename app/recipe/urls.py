@@ -3,6 +3,7 @@
 
 from django.urls import (
     path,
+    re_path,
     include,
 )
 
@@ -13,9 +14,22 @@ from recipe import views
 router = DefaultRouter()
 
 router.register('recipe', views.RecipeViewSet)
+router.register('tags', views.TagViewSet)
 
 app_name = 'recipe'
 
 urlpatterns = [
-    path('', include(router.urls))
+    path('sync/', views.RecipeSyncView.as_view(), name='sync'),
+    path(
+        'shopping-list/',
+        views.ShoppingListView.as_view(),
+        name='shopping-list',
+    ),
+    path('shared/<slug:slug>/', views.shared_recipe, name='shared'),
+    re_path(
+        r'^images/(?P<filename>[0-9a-f]{64}\.[a-z0-9]+)/(?P<size>[0-9]+)/$',
+        views.recipe_thumbnail,
+        name='thumbnail',
+    ),
+    path('', include(router.urls)),
 ]
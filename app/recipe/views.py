@@ -2,12 +2,45 @@
 Views for the various types of api for recipes.
 """
 
-from rest_framework import viewsets
-from rest_framework.authentication import TokenAuthentication
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Prefetch, Q
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotFound,
+    HttpResponseNotModified,
+)
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from core.models import Recipe
-from recipe import serializers
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core.cdn import purge, share_key
+from core.coalescing import coalesce, request_key
+from core.models import Recipe, Tag
+from core.throttling import BulkThrottle, ReadWriteThrottle
+from recipe import (
+    analytics,
+    images,
+    revisions,
+    serializers,
+    sharing,
+    shopping,
+    similarity,
+    sync,
+)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -15,20 +48,352 @@ class RecipeViewSet(viewsets.ModelViewSet):
     # Detail serializer is important seraializer
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ReadWriteThrottle]
+
+    def _params_to_ints(self, qs):
+        """Convert a list of strings to integers"""
+        try:
+            return [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            raise ValidationError({'tags': 'Expected a list of ids.'})
+
+    def _use_tag_cache(self):
+        return self.action in ('list', 'similar') and \
+            settings.RECIPE_DENORMALIZED_TAGS
 
     def get_queryset(self):
         """Retive recipe for authenticated users"""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        queryset = self.queryset.for_user(self.request.user)
+        tags = self.request.query_params.get('tags')
+        if tags:
+            tag_ids = self._params_to_ints(tags)
+            features = connections[queryset.db].features
+            if (self._use_tag_cache() and
+                    features.supports_json_field_contains):
+                tagged = Q()
+                for tag_id in tag_ids:
+                    tagged |= Q(tag_cache__contains=[{'id': tag_id}])
+                queryset = queryset.filter(tagged)
+            else:
+                queryset = queryset.filter(tag__id__in=tag_ids).distinct()
+
+        queryset = queryset.order_by('-id')
+        if self._use_tag_cache():
+            return queryset
+        return queryset.prefetch_related(
+            Prefetch('tag', queryset=Tag.objects.order_by('id')))
 
     def get_serializer_class(self):
         """Return a serializer class for request"""
-        if self.action == 'list':
+        if self._use_tag_cache():
+            return serializers.RecipeListSerializer
+        if self.action in ('list', 'similar'):
             return serializers.RecipeSerializer
+        if self.action == 'batch':
+            return serializers.RecipeBatchSerializer
+        if self.action == 'upload_image':
+            return serializers.RecipeImageSerializer
+        if self.action == 'history':
+            return serializers.RecipeRevisionSerializer
+        if self.action == 'revert':
+            return serializers.RecipeRevertSerializer
+        if self.action == 'share':
+            return serializers.RecipeShareSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """List recipes, computing identical concurrent lists once"""
+        if not settings.COALESCE_USER_READS:
+            return super().list(request, *args, **kwargs)
+        key = request_key('recipe-list', request, request.user.pk)
+        data = coalesce(
+            key, lambda: list(super(RecipeViewSet, self).list(
+                request, *args, **kwargs).data))
+        return Response(data)
+
     def perform_create(self, serializer):
         """Create a new recipe"""
-        serializer.save(user=self.request.user)
+        with transaction.atomic(using=self.get_queryset().db):
+            recipe = serializer.save(user=self.request.user)
+            revisions.record_revision(recipe)
+
+    def perform_update(self, serializer):
+        """Update a recipe and record the new revision"""
+        with transaction.atomic(using=serializer.instance._state.db):
+            revisions.record_base_revision(serializer.instance)
+            recipe = serializer.save()
+            revisions.record_revision(recipe)
+
+    @action(
+        detail=False,
+        methods=['get', 'post'],
+        throttle_classes=[BulkThrottle],
+    )
+    def batch(self, request):
+        """Retrieve many recipes by id in a single query"""
+        if request.method == 'GET':
+            data = {}
+            ids = request.query_params.get('ids')
+            if ids:
+                data['ids'] = ids.split(',')
+            since = request.query_params.get('since')
+            if since:
+                data['since'] = since
+        else:
+            data = request.data
+
+        batch = self.get_serializer(data=data)
+        batch.is_valid(raise_exception=True)
+        ids = batch.validated_data['ids']
+        since = batch.validated_data.get('since')
+
+        recipes = {
+            recipe.id: recipe
+            for recipe in self.get_queryset().filter(id__in=ids)
+        }
+        found = [recipes[id] for id in ids if id in recipes]
+        if since is None:
+            changed, unchanged = found, []
+        else:
+            changed = [r for r in found if r.updated_at > since]
+            unchanged = [r.id for r in found if r.updated_at <= since]
+
+        return Response({
+            'results': serializers.RecipeDetailSerializer(
+                changed, many=True).data,
+            'missing': [id for id in ids if id not in recipes],
+            'unchanged': unchanged,
+            'version': max((r.updated_at for r in found), default=since),
+        })
+
+    @action(
+        detail=True,
+        methods=['post'],
+        url_path='upload-image',
+        parser_classes=[MultiPartParser],
+    )
+    def upload_image(self, request, pk=None):
+        """Upload an image to a recipe"""
+        recipe = self.get_object()
+        upload = request.FILES.get('image')
+        if upload is None:
+            raise ValidationError({'image': 'No file was submitted.'})
+        try:
+            name = images.save_image(upload)
+        except images.InvalidImage:
+            raise ValidationError({'image': 'Upload a valid image.'})
+
+        recipe.image = name
+        recipe.save(update_fields=['image', 'updated_at'])
+        transaction.on_commit(lambda: images.schedule_thumbnails(name))
+
+        return Response(self.get_serializer(recipe).data)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """List a recipe's revisions, or show one with ?revision="""
+        recipe = self.get_object()
+        number = request.query_params.get('revision')
+        if number is None:
+            queryset = recipe.revisions.using(recipe._state.db).order_by(
+                '-number')
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        try:
+            number, state = revisions.rebuild(recipe, int(number))
+        except (ValueError, revisions.UnknownRevision):
+            raise Http404
+        return Response({'revision': number, **state})
+
+    @action(detail=True, methods=['post'])
+    def revert(self, request, pk=None):
+        """Set a recipe back to one of its revisions"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic(using=recipe._state.db):
+                revisions.revert(
+                    recipe, serializer.validated_data['revision'])
+        except revisions.UnknownRevision:
+            raise ValidationError({'revision': 'Unknown revision.'})
+
+        return Response(serializers.RecipeDetailSerializer(
+            recipe, context=self.get_serializer_context()).data)
+
+    @action(detail=True, methods=['post', 'delete'])
+    def share(self, request, pk=None):
+        """Make a recipe public, or private again with DELETE"""
+        recipe = self.get_object()
+        if request.method == 'DELETE':
+            if recipe.share_slug:
+                slug, recipe.share_slug = recipe.share_slug, None
+                recipe.save(update_fields=['share_slug'])
+                purge([share_key(slug)], recipe._state.db)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if not recipe.share_slug:
+            recipe.share_slug = sharing.new_slug()
+            recipe.save(update_fields=['share_slug'])
+        return Response(self.get_serializer(recipe).data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """List the user's recipes most similar to this one"""
+        recipe = self.get_object()
+        try:
+            k = min(int(request.query_params.get('k', 10)), 50)
+        except ValueError:
+            raise ValidationError({'k': 'A valid integer is required.'})
+
+        try:
+            scores = dict(similarity.similar_recipes(
+                request.user.id, recipe.id, max(k, 1)))
+        except similarity.IndexNotReady:
+            return Response(
+                {'detail': 'Similar recipes are being indexed, try again '
+                           'shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': settings.SIMILARITY_RETRY_AFTER},
+            )
+        recipes = sorted(
+            self.get_queryset().filter(id__in=scores),
+            key=lambda r: -scores[r.id],
+        )
+        data = self.get_serializer(recipes, many=True).data
+        for item in data:
+            item['score'] = scores[item['id']]
+
+        return Response(data)
+
+
+class TagViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """View for the tags of the authenticated user"""
+    serializer_class = serializers.TagSerializer
+    queryset = Tag.objects.all()
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ReadWriteThrottle]
+
+    def get_queryset(self):
+        """Retrieve tags for the authenticated user"""
+        return self.queryset.for_user(self.request.user).order_by('-name')
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """List the tag names trending across all users"""
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+
+        return Response(analytics.trending(max(limit, 1)))
+
+
+@require_GET
+def recipe_thumbnail(request, filename, size):
+    """Serve a recipe image thumbnail, cacheable for good"""
+    size = int(size)
+    if size not in settings.RECIPE_THUMBNAIL_SIZES:
+        raise Http404()
+
+    # The file name is the hash of the image, so the content never changes.
+    etag = '"%s-%d"' % (filename.split('.')[0], size)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            thumbnail = images.open_thumbnail(filename, size)
+        except images.ThumbnailPending:
+            # Not cached, so the thumbnail is served once it is made.
+            response = HttpResponseNotFound()
+            response['Cache-Control'] = 'no-store'
+            response['Retry-After'] = settings.RECIPE_THUMBNAIL_RETRY_AFTER
+            return response
+        if thumbnail is None:
+            raise Http404()
+        response = FileResponse(thumbnail, content_type='image/jpeg')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@require_GET
+def shared_recipe(request, slug):
+    """Serve the public page of a shared recipe to anyone"""
+    recipe = sharing.find_shared(slug)
+    if recipe is None:
+        # Cached too, so guessing slugs mostly reaches the CDN.
+        return sharing.make_not_found(HttpResponse(
+            JSONRenderer().render({'detail': 'Not found.'}),
+            content_type='application/json',
+            status=status.HTTP_404_NOT_FOUND,
+        ), slug)
+
+    body = JSONRenderer().render(
+        serializers.PublicRecipeSerializer(recipe).data)
+    etag = sharing.etag(body)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return sharing.make_public(response, recipe)
+
+
+class RecipeSyncView(APIView):
+    """Return the recipes changed and deleted since a cursor"""
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [BulkThrottle]
+
+    def get(self, request):
+        """Return one page of changes"""
+        try:
+            page = sync.changes_since(
+                request.user,
+                request.query_params.get('since'),
+                settings.RECIPE_SYNC_PAGE_SIZE,
+            )
+        except sync.InvalidCursor:
+            raise ValidationError({'since': 'Invalid cursor.'})
+
+        page['changed'] = serializers.RecipeDetailSerializer(
+            page['changed'], many=True).data
+        return Response(page)
+
+
+class ShoppingListView(APIView):
+    """Combine the ingredients of several recipes into a shopping list"""
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [BulkThrottle]
+
+    def post(self, request):
+        """Return the combined, unit converted ingredients"""
+        serializer = serializers.ShoppingListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        servings = {
+            recipe['id']: recipe['servings']
+            for recipe in serializer.validated_data['recipes']
+        }
+
+        return Response({
+            'ingredients': shopping.shopping_list(request.user, servings),
+        })
@@ -10,6 +10,9 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 
+from core.audit import audit
+from core.backends import users_by_email
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializers for the user object."""
@@ -18,21 +21,34 @@ class UserSerializer(serializers.ModelSerializer):
         model = get_user_model()
         fields = ['email', 'password', 'name', ]
         extra_kwargs = {'password':
-                        {'write_only': True, 'min_length': 5}
+                        {'write_only': True, 'min_length': 5},
+                        # Checked ignoring case by validate_email.
+                        'email': {'validators': []},
                         }
 
+    def validate_email(self, value):
+        """Reject emails taken by another user in any case"""
+        users = users_by_email(value)
+        if self.instance is not None:
+            users = users.exclude(pk=self.instance.pk)
+        if users.exists():
+            msg = _('A user with this email already exists.')
+            raise serializers.ValidationError(msg)
+        return value
+
     def create(self, validated_data):
         """Create a new user and return it with encrypted password"""
         return get_user_model().objects.create_user(**validated_data)
 
     def update(self, instance, validated_data):
         """Update a user and return user"""
+        # Only the names of the changed fields are audited, not values.
+        changes = sorted(validated_data)
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
-
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+        user = super().update(instance, validated_data)
+        audit(user, 'update', changes)
 
         return user
 
@@ -62,3 +78,8 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a refresh token"""
+    refresh = serializers.CharField()
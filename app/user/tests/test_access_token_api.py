@@ -0,0 +1,153 @@
+"""
+Tests for signed access tokens and refresh tokens
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import tokens
+from core.models import RefreshToken
+
+ACCESS_URL = reverse('user:token-access')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    return get_user_model().objects.create_user(
+        email=email, password=password, name='Test Name')
+
+
+class AccessTokenApiTests(TestCase):
+    """Test signed access tokens"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+
+    def login(self):
+        res = self.client.post(ACCESS_URL, {
+            'email': 'user@example.com',
+            'password': 'testpass123',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_create_token_pair(self):
+        """Valid credentials give an access and a refresh token"""
+        data = self.login()
+
+        self.assertIn('access', data)
+        self.assertIn('refresh', data)
+        self.assertEqual(RefreshToken.objects.filter(user=self.user).count(),
+                         1)
+
+    def test_bad_credentials(self):
+        res = self.client.post(ACCESS_URL, {
+            'email': 'user@example.com',
+            'password': 'wrong',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_access_token_skips_user_query(self):
+        """Authenticating a cached generation needs no query"""
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+        self.client.get(ME_URL)
+
+        # Only the recipe list itself is queried.
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_me_with_access_token(self):
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_tampered_token_rejected(self):
+        data = self.login()
+        user_id, rest = data['access'].split(':', 1)
+        token = f'{int(user_id) + 1}:{rest}'
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_invalidates_tokens(self):
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+
+        res = self.client.post(REVOKE_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_not_undone_by_stale_cache(self):
+        """Test a request caching the old generation late is ignored"""
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+        self.client.get(RECIPES_URL)
+        stale = cache.get(tokens.generation_key(self.user.pk))
+
+        self.client.post(REVOKE_URL)
+        cache.add(tokens.generation_key(self.user.pk), stale)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        data = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {data["access"]}')
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates_token(self):
+        """A refresh token can be used once"""
+        data = self.login()
+
+        res = self.client.post(REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['refresh'], data['refresh'])
+
+        res = self.client.post(REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_old_token_still_works(self):
+        """Clients using authtoken tokens keep working"""
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -2,10 +2,15 @@
 Test for the user API
 """
 
-from django.test import TestCase
-from django.contrib.auth import get_user_model
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import authenticate, get_user_model
+from django.db import IntegrityError, transaction
 from django.urls import reverse
+from django.utils import timezone
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -146,3 +151,111 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(USER_DELETION_IN_BACKGROUND=False)
+    def test_delete_user(self):
+        """Test deleting the account of the authenticated user"""
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(get_user_model().objects.filter(
+            pk=self.user.pk).exists())
+
+
+class TokenExpiryTests(TestCase):
+    """Test authtoken tokens expire when unused"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def set_created(self, **delta):
+        Token.objects.filter(pk=self.token.pk).update(
+            created=timezone.now() - timedelta(**delta))
+
+    def test_expired_token_rejected(self):
+        self.set_created(days=365)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_recent_token_not_written(self):
+        """Test a recently renewed token is not written on each request"""
+        self.set_created(minutes=5)
+        created = Token.objects.get(pk=self.token.pk).created
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Token.objects.get(pk=self.token.pk).created, created)
+
+    def test_token_renewed_when_used(self):
+        self.set_created(days=2)
+
+        self.client.get(ME_URL)
+
+        created = Token.objects.get(pk=self.token.pk).created
+        self.assertGreater(created, timezone.now() - timedelta(minutes=1))
+
+    def test_login_replaces_expired_token(self):
+        self.set_created(days=365)
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], self.token.key)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+
+class CaseInsensitiveLoginTests(TestCase):
+    """Test emails are matched ignoring case"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='Test@example.com', password='testpass123')
+        self.client = APIClient()
+
+    def test_login_any_case(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'TEST@EXAMPLE.COM',
+            'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+
+    def test_authenticate_one_query(self):
+        with self.assertNumQueries(1):
+            user = authenticate(
+                username='test@EXAMPLE.com', password='testpass123')
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(
+                username='other@example.com', password='testpass123'))
+
+    def test_create_case_variant_rejected(self):
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data)
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_database_rejects_case_variant(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            get_user_model().objects.create_user(
+                'TEST@example.com', 'testpass123')
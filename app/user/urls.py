@@ -10,5 +10,11 @@ urlpatterns = [
 
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/access/', views.CreateAccessTokenView.as_view(),
+         name='token-access'),
+    path('token/refresh/', views.RefreshAccessTokenView.as_view(),
+         name='token-refresh'),
+    path('token/revoke/', views.RevokeTokensView.as_view(),
+         name='token-revoke'),
     path('me/', views.ManageUsersView.as_view(), name='me'),
 ]
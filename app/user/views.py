@@ -1,11 +1,25 @@
 """Views for the user   API"""
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from user.serializers import (UserSerializer,
-                              AuthTokenSerializer
+                              AuthTokenSerializer,
+                              RefreshTokenSerializer,
                               )
 from rest_framework.settings import api_settings
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import tokens
+from core.archive import user_seen
+from core.deletion import start_user_deletion
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core.throttling import LoginThrottle
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -17,15 +31,88 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for the user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = [LoginThrottle]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        user_seen(user)
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and tokens.auth_token_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+        return Response({'token': token.key})
+
+
+class CreateAccessTokenView(APIView):
+    """Create a signed access token and a refresh token for the user"""
+    serializer_class = AuthTokenSerializer
+    authentication_classes = []
+    throttle_classes = [LoginThrottle]
+
+    def post(self, request):
+        serializer = self.serializer_class(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        user_seen(user)
+        return Response(tokens.create_token_pair(user))
+
+
+class RefreshAccessTokenView(APIView):
+    """Exchange a refresh token for a new access and refresh token"""
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = []
+    throttle_classes = [LoginThrottle]
 
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            pair = tokens.rotate_refresh_token(
+                serializer.validated_data['refresh'])
+        except tokens.InvalidToken:
+            raise AuthenticationFailed('Invalid or expired refresh token.')
+        return Response(pair)
 
-class ManageUsersView(generics.RetrieveUpdateAPIView):
+    def get_authenticate_header(self, request):
+        """Answer bad refresh tokens with 401 rather than 403"""
+        return SignedTokenAuthentication.keyword
+
+
+class RevokeTokensView(APIView):
+    """Revoke every signed access and refresh token of the user"""
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        tokens.revoke_tokens(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ManageUsersView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user """
 
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """retrive and return the Authenticated User"""
-        return self.request.user
+        user = self.request.user
+        if user.get_deferred_fields():
+            # Signed tokens only carry the id.
+            user.refresh_from_db()
+        return user
+
+    def destroy(self, request, *args, **kwargs):
+        """Lock the account out and delete its data in the background"""
+        start_user_deletion(request.user)
+        return Response(status=status.HTTP_202_ACCEPTED)